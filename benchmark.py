@@ -0,0 +1,340 @@
+import argparse
+import functools
+import inspect
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from pandas.core.groupby import DataFrameGroupBy, SeriesGroupBy
+
+from climate_bootstrap import precompute
+from climate_core import DataCore
+from climate_store import build_store, load_dataset
+
+APP_FILE = 'streamlit_app.py'
+DATA_FILE = 'clean_climate_change_indicators.csv'
+MAPPING_FILE = 'urban_rural_mapping.json'
+MONTHLY_FILE = 'monthly_temperature_change.csv'
+
+# Scales run by default, as country factor x year factor over the base dataset
+DEFAULT_SCALES = ['1x1', '10x1', '1x10', '100x1', '1x100']
+
+# Years covered by the base dataset when there is no CSV to take them from
+DEFAULT_YEARS = range(1961, 2023)
+
+
+# Count the calls made into pandas DataFrame, Series and groupby methods while active.
+# Calls pandas makes internally while serving one of them are not counted again.
+class OpCounter:
+
+    CLASSES = [pd.DataFrame, pd.Series, DataFrameGroupBy, SeriesGroupBy]
+
+    def __init__(self):
+        self.count = 0
+        self.state = threading.local()
+        self.patched = []
+
+    def _wrap(self, function):
+        @functools.wraps(function)
+        def counted(*args, **kwargs):
+            depth = getattr(self.state, 'depth', 0)
+            if depth == 0:
+                self.count += 1
+            self.state.depth = depth + 1
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.state.depth = depth
+        return counted
+
+    def __enter__(self):
+        for cls in self.CLASSES:
+            for name in dir(cls):
+                if name.startswith('_') and name not in ('__getitem__', '__setitem__'):
+                    continue
+                if inspect.isfunction(inspect.getattr_static(cls, name)):
+                    self.patched.append((cls, name, name in cls.__dict__, cls.__dict__.get(name)))
+                    setattr(cls, name, self._wrap(getattr(cls, name)))
+        return self
+
+    def __exit__(self, *exc):
+        for cls, name, own, original in reversed(self.patched):
+            if own:
+                setattr(cls, name, original)
+            else:
+                delattr(cls, name)
+        self.patched = []
+
+
+# Per-country trend parameters of the base dataset: the countries of the real CSV
+# when there is one, otherwise every mapped country with made-up trends
+def base_parameters(mapping, seed=0):
+    rng = np.random.default_rng(seed)
+    if os.path.exists(DATA_FILE):
+        core = DataCore.from_frame(load_dataset(DATA_FILE))
+        fit = core.trends()
+        noise = np.sqrt(np.nan_to_num(core.country_vars) * (1 - np.nan_to_num(fit['r']) ** 2))
+        return {
+            'countries': list(core.countries),
+            'years': core.years,
+            'intercept': np.nan_to_num(fit['intercept']),
+            'slope': np.nan_to_num(fit['slope']),
+            'noise': noise,
+            'missing': 1 - core.mask.mean(),
+        }
+    countries = sorted(mapping)
+    years = np.array(DEFAULT_YEARS)
+    slope = rng.normal(0.025, 0.01, len(countries))
+    return {
+        'countries': countries,
+        'years': years,
+        'intercept': rng.normal(0, 0.3, len(countries)) - slope * years[0],
+        'slope': slope,
+        'noise': np.full(len(countries), 0.35),
+        'missing': 0.03,
+    }
+
+
+# Long-format dataset with country_factor times the base countries and year_factor
+# times the base years. Extra countries are copies of the base ones ("Jordan 2"),
+# with jittered trends and the same mapping entry, and extra years follow on from
+# the last base year along each country's trend.
+def synthetic_dataset(base, mapping, country_factor, year_factor, seed=0):
+    rng = np.random.default_rng(seed)
+    countries = [name if copy == 1 else f"{name} {copy}"
+                 for copy in range(1, country_factor + 1) for name in base['countries']]
+    years = np.arange(base['years'][0], base['years'][0] + len(base['years']) * year_factor)
+    jitter = lambda values, scale: np.tile(values, country_factor) + np.r_[
+        np.zeros(len(values)), rng.normal(0, scale, len(values) * (country_factor - 1))]
+    intercept = jitter(base['intercept'], 0.1)
+    slope = jitter(base['slope'], 0.005)
+    noise = np.tile(base['noise'], country_factor)
+
+    values = intercept[:, None] + slope[:, None] * years + rng.normal(0, 1, (len(countries), len(years))) * noise[:, None]
+    present = rng.random(values.shape) >= base['missing']
+    rows, columns = np.nonzero(present)
+    data = pd.DataFrame({
+        'Country': pd.Categorical.from_codes(rows, categories=countries),
+        'Year': years[columns],
+        'Temperature Change': values[present].round(3),
+    })
+    scaled_mapping = {country: mapping[name] for country, name in
+                      zip(countries, base['countries'] * country_factor) if name in mapping}
+    return data, scaled_mapping
+
+
+# Monthly rows for the seasonal analysis: each annual value plus a seasonal cycle and noise
+def synthetic_monthly(data, seed=0):
+    rng = np.random.default_rng(seed)
+    months = np.tile(np.arange(1, 13), len(data))
+    values = (np.repeat(data['Temperature Change'].to_numpy(), 12)
+              + 0.3 * np.sin((months - 1) * np.pi / 6) + rng.normal(0, 0.4, len(months)))
+    return pd.DataFrame({
+        'Country': np.repeat(data['Country'].to_numpy(), 12),
+        'Year': np.repeat(data['Year'].to_numpy(), 12),
+        'Month': months,
+        'Temperature Change': values.round(3),
+    })
+
+
+# Directory laid out like a deployment, with the app files linked in and the
+# scaled datasets written next to them. The binary stores and bootstrap intervals
+# are prebuilt, as a deploy would, so page timings do not include the CSV
+# conversion or the resampling.
+def prepare_directory(directory, data, mapping, monthly=None):
+    source = os.path.dirname(os.path.abspath(__file__))
+    for name in os.listdir(source):
+        if name.endswith(('.py', '.png')):
+            os.symlink(os.path.join(source, name), os.path.join(directory, name))
+    with open(os.path.join(directory, MAPPING_FILE), 'w') as file:
+        json.dump(mapping, file)
+    data.to_csv(os.path.join(directory, DATA_FILE), index=False)
+    build_store(os.path.join(directory, DATA_FILE))
+    precompute(os.path.join(directory, DATA_FILE), DataCore.from_frame(load_dataset(os.path.join(directory, DATA_FILE))))
+    if monthly is not None:
+        monthly.to_csv(os.path.join(directory, MONTHLY_FILE), index=False)
+        build_store(os.path.join(directory, MONTHLY_FILE))
+
+
+# Total size of the Plotly figure JSON the last run sent to the browser
+def plotly_json_bytes(app):
+    charts = app.get('plotly_chart')
+    return len(charts), sum(len(chart.proto.spec) for chart in charts)
+
+
+def exception_messages(app):
+    return [exception.message for exception in app.exception] or None
+
+
+# Run every page of the app in directory and measure it. Each page is run once
+# cold (building the datasets it needs), repeat times warm for wall time, and once
+# more with memory tracing and op counting, which slow it down too much to time.
+# The background warm-up is off unless warm_up is set, so a cold run only builds
+# the datasets its own page needs.
+def benchmark_pages(directory, pages=None, repeat=3, timeout=600, warm_up=False):
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    os.environ['CLIMATE_WARM_UP_THREADS'] = '2' if warm_up else '0'
+    # Results computed in the background, such as the change points, are waited for on
+    # the first visit, so the timed reruns render them rather than a placeholder
+    os.environ['CLIMATE_WAIT_FOR_BACKGROUND'] = '1'
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        app = AppTest.from_file(os.path.join(directory, APP_FILE), default_timeout=timeout)
+        start = time.perf_counter()
+        app.run()
+        startup = time.perf_counter() - start
+        radio = lambda: app.sidebar.radio[0]
+        pages = [page for page in radio().options if not pages or page in pages]
+
+        results = []
+        for page in pages:
+            start = time.perf_counter()
+            radio().set_value(page).run()
+            first = time.perf_counter() - start
+
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                app.run()
+                timings.append(time.perf_counter() - start)
+            charts, spec_bytes = plotly_json_bytes(app)
+
+            tracemalloc.start()
+            try:
+                baseline = tracemalloc.get_traced_memory()[0]
+                with OpCounter() as ops:
+                    app.run()
+                peak = tracemalloc.get_traced_memory()[1] - baseline
+            finally:
+                tracemalloc.stop()
+
+            results.append({
+                'page': page,
+                'first_seconds': first,
+                'wall_seconds': float(np.median(timings)) if timings else first,
+                'wall_seconds_all': timings,
+                'peak_memory_bytes': peak,
+                'dataframe_ops': ops.count,
+                'plotly_charts': charts,
+                'plotly_json_bytes': spec_bytes,
+                'exception': exception_messages(app),
+            })
+            print(f"  {page:45s} {results[-1]['wall_seconds'] * 1000:9.1f} ms {peak / 2**20:8.1f} MB "
+                  f"{ops.count:6d} ops {spec_bytes / 1024:9.1f} KB", file=sys.stderr)
+        return startup, results
+    finally:
+        os.chdir(cwd)
+
+
+def parse_scale(scale):
+    countries, _, years = scale.partition('x')
+    return int(countries), int(years or 1)
+
+
+# Versions and commit the numbers were taken with
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    import plotly
+    import streamlit
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'plotly': plotly.__version__,
+        'streamlit': streamlit.__version__,
+    }
+
+
+def run(scales, pages=None, repeat=3, monthly=False, seed=0, warm_up=False):
+    with open(MAPPING_FILE, 'r') as file:
+        mapping = json.load(file)
+    base = base_parameters(mapping, seed)
+
+    runs = []
+    for scale in scales:
+        country_factor, year_factor = parse_scale(scale)
+        data, scaled_mapping = synthetic_dataset(base, mapping, country_factor, year_factor, seed)
+        print(f"{scale}: {data['Country'].nunique()} countries x {data['Year'].nunique()} years, "
+              f"{len(data)} rows", file=sys.stderr)
+        directory = tempfile.mkdtemp(prefix='climate-benchmark-')
+        try:
+            prepare_directory(directory, data, scaled_mapping, synthetic_monthly(data, seed) if monthly else None)
+            startup, results = benchmark_pages(directory, pages, repeat, warm_up=warm_up)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        runs.append({
+            'scale': scale,
+            'countries': int(data['Country'].nunique()),
+            'years': int(data['Year'].nunique()),
+            'rows': len(data),
+            'monthly': monthly,
+            'startup_seconds': startup,
+            'pages': results,
+        })
+    return {'environment': environment(), 'repeat': repeat, 'warm_up': warm_up, 'runs': runs}
+
+
+# Pages of a run that got slower than in a baseline run at the same scale by more
+# than tolerance (a fraction), as (scale, page, baseline seconds, current seconds)
+def regressions(report, baseline, tolerance=0.2):
+    before = {(run['scale'], page['page']): page['wall_seconds'] for run in baseline['runs'] for page in run['pages']}
+    slower = []
+    for run in report['runs']:
+        for page in run['pages']:
+            previous = before.get((run['scale'], page['page']))
+            if previous is not None and page['wall_seconds'] > previous * (1 + tolerance):
+                slower.append((run['scale'], page['page'], previous, page['wall_seconds']))
+    return slower
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run every dashboard page headlessly on synthetic data and report per-page timings as JSON.")
+    parser.add_argument('--scale', action='append', help=f"country x year factor over the base dataset, e.g. 10x1 (default: {' '.join(DEFAULT_SCALES)})")
+    parser.add_argument('--page', action='append', help="only benchmark this page (can be repeated)")
+    parser.add_argument('--repeat', type=int, default=3, help="warm runs timed per page")
+    parser.add_argument('--monthly', action='store_true', help="also generate the monthly file for the seasonal analysis")
+    parser.add_argument('--warm-up', action='store_true', help="let the app warm its datasets up in the background, as it does when deployed")
+    parser.add_argument('--seed', type=int, default=0, help="seed for the synthetic data")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--baseline', help="earlier JSON report to compare wall times against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="slowdown over the baseline reported as a regression")
+    args = parser.parse_args()
+
+    report = run(args.scale or DEFAULT_SCALES, args.page, args.repeat, args.monthly, args.seed, args.warm_up)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+    failed = [(run['scale'], page['page']) for run in report['runs'] for page in run['pages'] if page['exception']]
+    for scale, page in failed:
+        print(f"{scale} {page}: failed", file=sys.stderr)
+    slower = []
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            slower = regressions(report, json.load(file), args.tolerance)
+        for scale, page, before, after in slower:
+            print(f"{scale} {page}: {before * 1000:.1f} ms -> {after * 1000:.1f} ms", file=sys.stderr)
+    sys.exit(1 if failed or slower else 0)
@@ -0,0 +1,298 @@
+import argparse
+import hashlib
+import json
+import os
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+
+from climate_core import COUNTRY_METRICS, Artifacts, CountryMapping, GroupEngine, LRUCache, Rankings, load_core, sources_fingerprint
+from climate_store import source_mtime
+
+DATA_FILE = 'clean_climate_change_indicators.csv'
+MAPPING_FILE = 'urban_rural_mapping.json'
+
+# Bump when the shape of a response changes, so clients drop their cached copies
+API_VERSION = 1
+
+# Bounds of the response cache
+RESPONSE_CACHE_ENTRIES = int(os.environ.get('CLIMATE_API_CACHE_ENTRIES', 1024))
+RESPONSE_CACHE_MB = float(os.environ.get('CLIMATE_API_CACHE_MB', 64))
+
+# Group dimensions of the mapping that /groups/<dimension> serves
+GROUP_DIMENSIONS = ['Continent', 'Region', 'Urban_Rural']
+
+# Longest ranking a request can ask for
+MAX_RANKING_SIZE = 1000
+
+
+# Records of a frame as JSON-ready dicts, with NaN as null
+def _records(frame):
+    return json.loads(frame.to_json(orient='records'))
+
+
+# The aggregates behind the dashboard as plain JSON-ready values, without Streamlit.
+# Datasets are built on first use and kept in an Artifacts registry; refresh()
+# drops the ones whose source file changed, as the app does on every rerun.
+class ClimateQueries:
+
+    def __init__(self, data_file=DATA_FILE, mapping_file=MAPPING_FILE):
+        self.data_file = data_file
+        self.mapping_file = mapping_file
+        self.artifacts = Artifacts({
+            'mapping': self._build_mapping,
+            'core': lambda artifacts: load_core(artifacts, self.data_file),
+            'groups': lambda artifacts: GroupEngine(artifacts.get('core'), artifacts.get('mapping')),
+            'rankings': lambda artifacts: Rankings(artifacts.get('core'), artifacts.get('groups')),
+            'trends': lambda artifacts: artifacts.get('core').trend_table(),
+            'fingerprint': lambda artifacts: sources_fingerprint(artifacts, self.data_file, self.mapping_file),
+        })
+        self.refresh()
+
+    def _build_mapping(self, artifacts):
+        artifacts.source('mapping')
+        return CountryMapping.from_file(self.mapping_file)
+
+    # Check the source files and drop the datasets built from any that changed
+    def refresh(self):
+        self.artifacts.update_sources(data=source_mtime(self.data_file), mapping=os.stat(self.mapping_file).st_mtime_ns)
+
+    # Content fingerprint of the data and mapping; equal fingerprints mean equal answers
+    def fingerprint(self):
+        return self.artifacts.get('fingerprint')
+
+    # Average temperature change across all countries per year
+    def global_yearly_mean(self):
+        return _records(self.artifacts.get('core').yearly_mean().reset_index())
+
+    # Every country with its number of years and mean temperature change
+    def countries(self):
+        core = self.artifacts.get('core')
+        return [{'Country': country, 'Years': int(count), 'Temperature Change': None if np.isnan(mean) else float(mean)}
+                for country, count, mean in zip(core.countries, core.country_counts, core.country_means)]
+
+    # KeyError unless country is in the data
+    def check_country(self, country):
+        if country not in self.artifacts.get('core').country_index:
+            raise KeyError(f"Unknown country: {country}")
+
+    # One country's yearly series with its trend statistics
+    def country(self, country):
+        self.check_country(country)
+        core = self.artifacts.get('core')
+        trends = self.artifacts.get('trends')
+        return {
+            'Country': country,
+            'Series': _records(core.country_series(country).reset_index()),
+            'Trend': _records(trends.iloc[[core.country_index[country]]])[0],
+        }
+
+    # KeyError unless dimension is one of GROUP_DIMENSIONS
+    def check_dimension(self, dimension):
+        if dimension not in GROUP_DIMENSIONS:
+            raise KeyError(f"Unknown group dimension: {dimension}; expected one of {', '.join(GROUP_DIMENSIONS)}")
+
+    # Yearly and overall means of the groups of one mapping dimension
+    def groups(self, dimension):
+        self.check_dimension(dimension)
+        stats = self.artifacts.get('groups').stats(dimension)
+        return {
+            'Dimension': dimension,
+            'Yearly': _records(stats.frame(dimension)),
+            'Overall': _records(stats.overall(dimension).reset_index()),
+        }
+
+    # ValueError unless metric is one of COUNTRY_METRICS
+    def check_metric(self, metric):
+        if metric not in COUNTRY_METRICS:
+            raise ValueError(f"Unknown metric: {metric}; expected one of {', '.join(COUNTRY_METRICS)}")
+
+    # Split year moved into the data's years, leaving at least one year after it
+    def clamp_split_year(self, split_year):
+        return self.artifacts.get('rankings').clamp_split_year(split_year)
+
+    # Top or bottom n countries by a metric, optionally within a region and urban/rural
+    # class. A split year outside the data is moved to its first or last split.
+    def country_ranking(self, metric='mean', n=10, largest=True, region=None, urban_rural=None, split_year=2000):
+        self.check_metric(metric)
+        ranking = self.artifacts.get('rankings').countries(metric, n, largest, region, urban_rural, split_year)
+        return _records(ranking)
+
+    # Warmest or coldest n years by the global mean
+    def year_ranking(self, n=10, largest=True):
+        return _records(self.artifacts.get('rankings').years('mean', n, largest))
+
+    # Trend statistics of every country
+    def trends(self):
+        return _records(self.artifacts.get('trends'))
+
+
+# Encoded responses by resolved request, including the data fingerprint, least
+# recently used dropped first. Entries for old data are never served and age out of
+# the cache.
+class ResponseCache(LRUCache):
+
+    def __init__(self, max_entries=RESPONSE_CACHE_ENTRIES, max_bytes=int(RESPONSE_CACHE_MB * 2**20)):
+        super().__init__(max_entries, max_bytes)
+
+
+# Single value of a query parameter, or default when it is absent
+def _parameter(query, name, default=None):
+    values = query.get(name)
+    return values[-1] if values else default
+
+
+def _integer(query, name, default, low, high):
+    value = _parameter(query, name)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer") from None
+    if not low <= number <= high:
+        raise ValueError(f"{name} must be between {low} and {high}")
+    return number
+
+
+def _largest(query):
+    order = _parameter(query, 'order', 'top')
+    if order not in ('top', 'bottom'):
+        raise ValueError("order must be 'top' or 'bottom'")
+    return order == 'top'
+
+
+# Query method and normalized arguments for a path under /api and its query
+# parameters. Everything a request can get wrong is checked here, before any answer
+# is computed: an unknown endpoint, country or group dimension raises KeyError and an
+# invalid parameter ValueError. Parameters are parsed and defaulted, and the split
+# year clamped, so equivalent requests resolve to the same arguments.
+def resolve(queries, path, query):
+    parts = [unquote(part) for part in path.strip('/').split('/')]
+    if parts[0] != 'api':
+        raise KeyError(f"Unknown path: {path}")
+    parts = parts[1:]
+    if parts == []:
+        return 'endpoints', ()
+    if parts == ['global', 'yearly']:
+        return 'global_yearly_mean', ()
+    if parts == ['countries']:
+        return 'countries', ()
+    if len(parts) == 2 and parts[0] == 'countries':
+        queries.check_country(parts[1])
+        return 'country', (parts[1],)
+    if len(parts) == 2 and parts[0] == 'groups':
+        queries.check_dimension(parts[1])
+        return 'groups', (parts[1],)
+    if parts == ['rankings', 'countries']:
+        metric = _parameter(query, 'metric', 'mean')
+        queries.check_metric(metric)
+        n, largest = _integer(query, 'n', 10, 1, MAX_RANKING_SIZE), _largest(query)
+        split_year = _integer(query, 'split_year', 2000, -10**6, 10**6)
+        return 'country_ranking', (metric, n, largest, _parameter(query, 'region'), _parameter(query, 'urban_rural'),
+                                   queries.clamp_split_year(split_year) if metric == 'change' else None)
+    if parts == ['rankings', 'years']:
+        return 'year_ranking', (_integer(query, 'n', 10, 1, MAX_RANKING_SIZE), _largest(query))
+    if parts == ['trends']:
+        return 'trends', ()
+    raise KeyError(f"Unknown path: {path}")
+
+
+# JSON-ready answer to a request resolved by resolve()
+def answer(queries, name, arguments):
+    return {'endpoints': ENDPOINTS} if name == 'endpoints' else getattr(queries, name)(*arguments)
+
+
+# Paths served, listed at /api
+ENDPOINTS = [
+    '/api/global/yearly',
+    '/api/countries',
+    '/api/countries/<country>',
+    '/api/groups/<Continent|Region|Urban_Rural>',
+    '/api/rankings/countries?metric=mean|slope|change&n=10&order=top|bottom&region=&urban_rural=&split_year=2000',
+    '/api/rankings/years?n=10&order=top|bottom',
+    '/api/trends',
+]
+
+
+# JSON over HTTP for the queries. A request is resolved first, so an unknown path
+# is a 404 and an invalid parameter a 400. Every answer carries an ETag derived from
+# the data fingerprint and the resolved request, so a client that sends it back in
+# If-None-Match gets an empty 304 until the data changes. Bodies are kept in the
+# response cache, so a repeated request is a dictionary lookup. Any other failure
+# is a 500.
+class ApiHandler(BaseHTTPRequestHandler):
+
+    queries = None
+    cache = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        try:
+            self.queries.refresh()
+            fingerprint = self.queries.fingerprint()
+            try:
+                name, arguments = resolve(self.queries, url.path, parse_qs(url.query))
+            except KeyError as error:
+                self._send(404, json.dumps({'error': error.args[0]}).encode(), None)
+                return
+            except ValueError as error:
+                self._send(400, json.dumps({'error': str(error)}).encode(), None)
+                return
+
+            request = json.dumps([API_VERSION, fingerprint, name, arguments])
+            etag = '"' + hashlib.sha256(request.encode()).hexdigest()[:32] + '"'
+            requested = [tag.strip().removeprefix('W/') for tag in self.headers.get('If-None-Match', '').split(',')]
+            if etag in requested or '*' in requested:
+                self._send(304, None, etag)
+                return
+
+            body = self.cache.get(request)
+            if body is None:
+                body = json.dumps(answer(self.queries, name, arguments)).encode()
+                self.cache.put(request, body)
+        except Exception:
+            self.log_error("Failed to answer %s:\n%s", self.path, traceback.format_exc())
+            self._send(500, json.dumps({'error': 'Internal server error'}).encode(), None)
+            return
+        self._send(200, body, etag)
+
+    def _send(self, status, body, etag):
+        self.send_response(status)
+        if etag is not None:
+            self.send_header('ETag', etag)
+            # Clients may keep responses but must revalidate them, which costs a 304
+            self.send_header('Cache-Control', 'no-cache')
+        if body is not None:
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body is not None:
+            self.wfile.write(body)
+
+
+# HTTP server for queries on host:port, each request handled on its own thread
+def make_server(queries, host='127.0.0.1', port=8502, cache=None):
+    handler = type('Handler', (ApiHandler,), {'queries': queries, 'cache': cache or ResponseCache()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the dashboard's aggregates as JSON over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on (default: localhost only)")
+    parser.add_argument('--port', type=int, default=8502, help="port to listen on")
+    parser.add_argument('--data', default=DATA_FILE, help="dataset CSV, or the name of an ingested store")
+    parser.add_argument('--mapping', default=MAPPING_FILE, help="urban/rural and region mapping")
+    args = parser.parse_args()
+
+    queries = ClimateQueries(args.data, args.mapping)
+    # Build the shared datasets before the first request
+    queries.fingerprint()
+    queries.artifacts.get('trends')
+    server = make_server(queries, args.host, args.port)
+    print(f"Serving http://{args.host}:{server.server_address[1]}/api")
+    server.serve_forever()
@@ -0,0 +1,209 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from climate_core import DataCore
+from climate_store import cache_root, load_dataset, write_atomic
+
+# Bump when the resampling or the saved layout changes so old results are recomputed
+BOOTSTRAP_VERSION = 1
+
+# Resamples per country, years per resampled block and the interval's coverage
+RESAMPLES = int(os.environ.get('CLIMATE_BOOTSTRAP_RESAMPLES', 2000))
+BLOCK_LENGTH = 5
+CONFIDENCE = 0.95
+
+# Resamples drawn at a time, and the most cells (countries x resamples x years) a
+# task works on at once; tasks take as many countries as fit
+BATCH_SIZE = 250
+TASK_CELLS = 2_000_000
+
+# Seed of the first batch's generator. Every batch gets its own child seed, and all
+# countries are resampled with the same years, so the intervals are the same
+# whatever the number of workers or the way the countries are split between them.
+SEED = 0
+
+# Statistics that get intervals, each per country
+STATISTICS = ['slope', 'mean', 'correlation']
+
+# Panel shared with the tasks of a worker process, set once by _init_worker
+_panel = {}
+
+
+def _init_worker(years, values, global_mean):
+    _panel.update(years=years, values=values, global_mean=global_mean)
+
+
+# Year positions of size moving-block resamples of a series of n years: runs of
+# block_length consecutive years starting at random positions, joined and cut to
+# n. Whole blocks keep the year-to-year autocorrelation that a plain bootstrap
+# would break up.
+def block_indices(rng, size, n, block_length=BLOCK_LENGTH):
+    block_length = max(1, min(block_length, n))
+    blocks = -(-n // block_length)
+    starts = rng.integers(0, n - block_length + 1, size=(size, blocks))
+    return (starts[:, :, None] + np.arange(block_length)).reshape(size, -1)[:, :n]
+
+
+# Slope, mean and correlation with the global mean of each row of values in the
+# resamples given by positions (resamples x years), each a rows x resamples array.
+# Years a country has no data for are left out of its fits, as in the point estimates.
+def resample_statistics(years, values, global_mean, positions):
+    y = values[:, positions]
+    present = ~np.isnan(y)
+    y = np.where(present, y, 0.0)
+    x = np.where(present, (years - years.mean())[positions], 0.0)
+    g = np.where(present, global_mean[positions], 0.0)
+    n = present.sum(axis=2)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sx, sy, sg = x.sum(axis=2), y.sum(axis=2), g.sum(axis=2)
+        slope = (n * (x * y).sum(axis=2) - sx * sy) / (n * (x * x).sum(axis=2) - sx * sx)
+        mean = sy / n
+        covariance = n * (y * g).sum(axis=2) - sy * sg
+        spread = (n * (y * y).sum(axis=2) - sy * sy) * (n * (g * g).sum(axis=2) - sg * sg)
+        correlation = covariance / np.sqrt(spread)
+    valid = n > 2
+    return {
+        'slope': np.where(valid, slope, np.nan),
+        'mean': np.where(n > 0, mean, np.nan),
+        'correlation': np.where(valid & (spread > 0), correlation, np.nan),
+    }
+
+
+# Percentile bounds of every statistic for the countries in rows (a slice of the
+# panel), over the resample batches with the given seeds and sizes
+def resample_rows(rows, seeds, sizes, block_length, confidence):
+    years, values, global_mean = _panel['years'], _panel['values'][rows], _panel['global_mean']
+    batches = [resample_statistics(years, values, global_mean, block_indices(np.random.default_rng(seed), size, len(years), block_length))
+               for seed, size in zip(seeds, sizes)]
+
+    tail = (1 - confidence) / 2 * 100
+    bounds = {}
+    for statistic in STATISTICS:
+        samples = np.hstack([batch[statistic] for batch in batches])
+        # Countries with no valid resample are left without an interval
+        empty = np.isnan(samples).all(axis=1)
+        samples[empty] = 0.0
+        low, high = np.nanpercentile(samples, [tail, 100 - tail], axis=1)
+        bounds[statistic] = (np.where(empty, np.nan, low), np.where(empty, np.nan, high))
+    return bounds
+
+
+# Percentile bootstrap intervals for each country's warming rate, mean and
+# correlation with the global yearly mean
+class BootstrapIntervals:
+
+    def __init__(self, countries, lower, upper, resamples, confidence, fingerprint=None):
+        self.countries = np.asarray(countries, dtype=object)
+        self.lower = lower
+        self.upper = upper
+        self.resamples = resamples
+        self.confidence = confidence
+        self.fingerprint = fingerprint
+        self.country_index = {country: row for row, country in enumerate(self.countries)}
+
+    # Lower and upper bound of one statistic for one country
+    def interval(self, country, statistic):
+        row = self.country_index[country]
+        return self.lower[statistic][row], self.upper[statistic][row]
+
+    # Bounds of every statistic as a frame, one row per country
+    def table(self):
+        columns = {'Country': self.countries}
+        for statistic in STATISTICS:
+            name = statistic.capitalize()
+            columns[name + '_Low'] = self.lower[statistic]
+            columns[name + '_High'] = self.upper[statistic]
+        return pd.DataFrame(columns)
+
+    def save(self, path):
+        arrays = {f'{bound}_{statistic}': getattr(self, bound)[statistic] for bound in ('lower', 'upper') for statistic in STATISTICS}
+        meta = {'resamples': self.resamples, 'confidence': self.confidence, 'fingerprint': self.fingerprint}
+        write_atomic(path, lambda file: np.savez(file, countries=self.countries.astype(str), meta=json.dumps(meta), **arrays))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as saved:
+            meta = json.loads(str(saved['meta']))
+            lower = {statistic: saved['lower_' + statistic] for statistic in STATISTICS}
+            upper = {statistic: saved['upper_' + statistic] for statistic in STATISTICS}
+            return cls(saved['countries'].astype(object), lower, upper, meta['resamples'], meta['confidence'], meta['fingerprint'])
+
+
+# Resample the core's panel on a process pool and return the percentile
+# intervals. Each task takes a block of countries through every resample, so
+# only its bounds come back and memory stays within TASK_CELLS per task.
+def bootstrap(core, resamples=RESAMPLES, block_length=BLOCK_LENGTH, confidence=CONFIDENCE,
+              seed=SEED, batch_size=BATCH_SIZE, workers=None):
+    sizes = [min(batch_size, resamples - start) for start in range(0, resamples, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    workers = workers or os.cpu_count() or 1
+    countries = len(core.countries)
+    block = max(1, min(TASK_CELLS // (batch_size * max(len(core.years), 1)), -(-countries // workers)))
+    blocks = [slice(start, start + block) for start in range(0, countries, block)]
+    panel = (core.years.astype(np.float64), np.asarray(core.values), np.asarray(core.year_means))
+
+    # Workers are spawned rather than forked: the dashboard starts the bootstrap from a
+    # threaded server, and a forked child could inherit locks held by other threads
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=panel) as pool:
+        count = len(blocks)
+        parts = list(pool.map(resample_rows, blocks, [seeds] * count, [sizes] * count, [block_length] * count, [confidence] * count))
+
+    lower = {statistic: np.concatenate([part[statistic][0] for part in parts]) for statistic in STATISTICS}
+    upper = {statistic: np.concatenate([part[statistic][1] for part in parts]) for statistic in STATISTICS}
+    return BootstrapIntervals(core.countries, lower, upper, resamples, confidence, core.fingerprint)
+
+
+# Saved intervals for a dataset, keyed by its fingerprint and the bootstrap settings
+def intervals_path(csv_path, fingerprint, resamples=RESAMPLES, block_length=BLOCK_LENGTH, confidence=CONFIDENCE, seed=SEED):
+    settings = json.dumps([BOOTSTRAP_VERSION, fingerprint, resamples, block_length, confidence, seed])
+    return os.path.join(cache_root(csv_path), 'bootstrap', hashlib.sha256(settings.encode()).hexdigest() + '.npz')
+
+
+# The saved intervals for core, or None when they have not been computed yet
+def load_intervals(csv_path, core):
+    path = intervals_path(csv_path, core.fingerprint)
+    return BootstrapIntervals.load(path) if core.fingerprint is not None and os.path.exists(path) else None
+
+
+# Compute the intervals for core unless they are saved already, and save them
+def precompute(csv_path, core, workers=None):
+    intervals = load_intervals(csv_path, core)
+    if intervals is None:
+        intervals = bootstrap(core, workers=workers)
+        if core.fingerprint is not None:
+            intervals.save(intervals_path(csv_path, core.fingerprint))
+    return intervals
+
+
+# Compute the intervals for core in a separate Python process that runs this module,
+# for callers inside a server. Streamlit installs the app script as __main__, which
+# spawned pool workers would import and run again; this module's main is guarded.
+def precompute_in_subprocess(csv_path, core):
+    intervals = load_intervals(csv_path, core)
+    if intervals is None:
+        subprocess.run([sys.executable, os.path.abspath(__file__), csv_path], check=True, stdout=subprocess.DEVNULL)
+        intervals = load_intervals(csv_path, core)
+        if intervals is None:
+            raise RuntimeError(f"{csv_path} changed while its bootstrap intervals were computed")
+    return intervals
+
+
+if __name__ == '__main__':
+    # Precompute the intervals during deploy:  python climate_bootstrap.py [csv]
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else 'clean_climate_change_indicators.csv'
+    start = time.perf_counter()
+    core = DataCore.from_frame(load_dataset(csv_path))
+    precompute(csv_path, core)
+    print(f"{RESAMPLES} resamples of {len(core.countries)} countries in {time.perf_counter() - start:.1f}s: "
+          f"{intervals_path(csv_path, core.fingerprint)}")
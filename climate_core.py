@@ -0,0 +1,1170 @@
+import hashlib
+import json
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from climate_store import file_digest, load_dataset
+
+
+# Marks a missing entry where None is a valid value
+_MISSING = object()
+
+
+# Freeze an array so shared copies cannot be modified by a page
+def _read_only(array):
+    array.setflags(write=False)
+    return array
+
+
+# Values by key, dropping the least recently used once there are more than
+# max_entries of them or, with max_bytes, their sizes add up to more than that. A
+# value larger than max_bytes on its own is not kept. Shared between threads.
+class LRUCache:
+
+    def __init__(self, max_entries, max_bytes=None, size=len):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = size if max_bytes is not None else (lambda value: 0)
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    # The value for key, or None on a miss
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= self.sizeof(previous)
+            self.entries[key] = value
+            self.size += size
+            while len(self.entries) > self.max_entries or (self.max_bytes is not None and self.size > self.max_bytes):
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= self.sizeof(evicted)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.size, 'hits': self.hits, 'misses': self.misses}
+
+
+# Dense country x year view of the long-format temperature data.
+# Built once from load_data() and shared by every page, so the per-year and
+# per-country aggregates are computed a single time instead of on every rerun.
+# All aggregates are kept as running sums, so new years can be appended with
+# extend() in O(countries) work per year instead of a full rebuild.
+class DataCore:
+
+    def __init__(self, countries, years, values, fingerprint=None):
+        self.countries = _read_only(np.asarray(countries, dtype=object))
+        self.fingerprint = fingerprint
+
+        # Matrix row of each country, so a country's series is a single row lookup
+        self.country_index = {country: row for row, country in enumerate(self.countries)}
+
+        # Regression sums measure years from the first year so they stay small
+        empty = np.zeros(len(self.countries))
+        self.trend_origin = float(years[0]) if len(years) else 0.0
+        self.years = np.empty(0, dtype=np.int64)
+        self.values = np.empty((len(self.countries), 0))
+        self.mask = np.empty((len(self.countries), 0), dtype=bool)
+        self.year_counts = np.empty(0, dtype=np.int64)
+        self.year_sums = np.empty(0)
+        self.year_vars = np.empty(0)
+        self.country_counts = empty.astype(np.int64)
+        self.country_sums = self.country_squares = empty
+        self.trend_sums = {key: empty for key in ('x', 'xx', 'xy')}
+        self.cumulative_sums = np.zeros((len(self.countries), 1))
+        self.cumulative_counts = np.zeros((len(self.countries), 1), dtype=np.int64)
+        self._accumulate(np.asarray(years, dtype=np.int64), np.asarray(values, dtype=np.float64))
+
+    # Fold a block of new year columns into the matrix and every running aggregate
+    def _accumulate(self, years, block):
+        present = ~np.isnan(block)
+        filled = np.where(present, block, 0.0)
+        squares = filled * filled
+        x = (years - self.trend_origin).astype(np.float64)
+
+        self.years = _read_only(np.concatenate([self.years, years]))
+        self.values = _read_only(np.hstack([self.values, block]))
+        self.mask = _read_only(np.hstack([self.mask, present]))
+
+        # Row (country) aggregates over all years
+        self.country_counts = _read_only(self.country_counts + present.sum(axis=1))
+        self.country_sums = _read_only(self.country_sums + filled.sum(axis=1))
+        self.country_squares = _read_only(self.country_squares + squares.sum(axis=1))
+        self.country_means = _read_only(_mean(self.country_sums, self.country_counts))
+        self.country_vars = _read_only(_variance(self.country_sums, self.country_squares, self.country_counts))
+        self.trend_sums = {
+            'x': _read_only(self.trend_sums['x'] + present @ x),
+            'xx': _read_only(self.trend_sums['xx'] + present @ (x * x)),
+            'xy': _read_only(self.trend_sums['xy'] + filled @ x),
+        }
+
+        # Column (year) aggregates over all countries; existing columns do not change
+        counts = present.sum(axis=0)
+        sums = filled.sum(axis=0)
+        self.year_counts = _read_only(np.concatenate([self.year_counts, counts]))
+        self.year_sums = _read_only(np.concatenate([self.year_sums, sums]))
+        self.year_means = _read_only(_mean(self.year_sums, self.year_counts))
+        self.year_vars = _read_only(np.concatenate([self.year_vars, _variance(sums, squares.sum(axis=0), counts)]))
+
+        # Cumulative sums and counts along the year axis with a leading zero column,
+        # so the mean over any run of years is two lookups per country
+        self.cumulative_sums = _read_only(np.hstack([
+            self.cumulative_sums, self.cumulative_sums[:, -1:] + np.cumsum(filled, axis=1)]))
+        self.cumulative_counts = _read_only(np.hstack([
+            self.cumulative_counts, self.cumulative_counts[:, -1:] + np.cumsum(present, axis=1)]))
+
+    # Build the cube from a long-format frame with Country, Year and Temperature Change
+    @classmethod
+    def from_frame(cls, data):
+        countries, years, values = _pivot(data)
+        return cls(countries, years, values, data.attrs.get('fingerprint'))
+
+    # A new core with the rows of data for years after the last one appended.
+    # Only the new columns are aggregated; the existing core is left untouched.
+    # Returns None when the rows cannot be appended (earlier years or unknown
+    # countries), in which case the caller should rebuild from scratch.
+    def extend(self, data, fingerprint=None):
+        if len(data) == 0:
+            return None
+        positions = pd.Index(self.countries).get_indexer(pd.Index(data['Country'].astype(object)))
+        if (positions < 0).any() or data['Year'].min() <= self.years[-1]:
+            return None
+        _, years, block = _pivot(data, positions, self.countries)
+
+        extended = object.__new__(DataCore)
+        extended.__dict__.update(self.__dict__)
+        extended.fingerprint = fingerprint
+        extended._accumulate(np.asarray(years, dtype=np.int64), block)
+        return extended
+
+    # Global mean per year as a Series indexed by Year
+    def yearly_mean(self):
+        return pd.Series(self.year_means, index=pd.Index(self.years, name='Year'), name='Temperature Change')
+
+    # Mean over all years per country as a Series indexed by Country
+    def country_mean(self):
+        return pd.Series(self.country_means, index=pd.Index(self.countries, name='Country'), name='Temperature Change')
+
+    # One country's yearly series, leaving out the years it has no data for
+    def country_series(self, country):
+        row = self.country_index[country]
+        present = self.mask[row]
+        return pd.Series(self.values[row][present], index=pd.Index(self.years[present], name='Year'), name='Temperature Change')
+
+    # Column bounds [first, last) of the years from start to end inclusive
+    def year_bounds(self, start, end):
+        return np.searchsorted(self.years, start, side='left'), np.searchsorted(self.years, end, side='right')
+
+    # Mean per country over the years from start to end inclusive, from the prefix sums
+    def range_mean(self, start, end):
+        first, last = self.year_bounds(start, end)
+        sums = self.cumulative_sums[:, last] - self.cumulative_sums[:, first]
+        counts = self.cumulative_counts[:, last] - self.cumulative_counts[:, first]
+        return pd.Series(_mean(sums, counts), index=pd.Index(self.countries, name='Country'), name='Temperature Change')
+
+    # Least-squares trend of every country's series from the running sums
+    def trends(self):
+        return trend_from_sums(
+            self.country_counts, self.trend_sums['x'], self.country_sums,
+            self.trend_sums['xx'], self.trend_sums['xy'], self.country_squares, self.trend_origin)
+
+    # Trend statistics for every country as a DataFrame, one row per country
+    def trend_table(self):
+        fit = self.trends()
+        return pd.DataFrame({
+            'Country': self.countries,
+            'Slope': fit['slope'],
+            'Intercept': fit['intercept'],
+            'R': fit['r'],
+            'P_Value': fit['p_value'],
+            'Std_Err': fit['stderr'],
+            'Years': fit['n'],
+        })
+
+    # Yearly mean over every country except one, taken from the column totals
+    # minus that country's row rather than by rescanning the other countries
+    def others_mean(self, country):
+        row = self.country_index[country]
+        sums = self.year_sums - np.where(self.mask[row], self.values[row], 0.0)
+        counts = self.year_counts - self.mask[row]
+        return pd.Series(_mean(sums, counts), index=pd.Index(self.years, name='Year'), name='Temperature Change')
+
+
+# Seasons as consecutive month triples starting in December, so that December
+# counts towards the winter of the following year
+SEASONS = ['Winter', 'Spring', 'Summer', 'Fall']
+
+
+# Country x year x month cube of monthly temperature changes, with the seasonal
+# means of every country computed in one vectorized reduction
+class MonthlyCore:
+
+    def __init__(self, countries, years, values, min_months=3):
+        self.countries = _read_only(np.asarray(countries, dtype=object))
+        self.years = _read_only(np.asarray(years, dtype=np.int64))
+        self.values = _read_only(np.asarray(values, dtype=np.float64))
+        self.country_index = {country: row for row, country in enumerate(self.countries)}
+
+        # Move every month one slot later so December opens the next year's row;
+        # the extra trailing row only holds the final December and is dropped
+        shifted = np.full((len(self.countries), len(self.years) + 1, 12), np.nan)
+        shifted[:, :-1, 1:] = self.values[:, :, :11]
+        shifted[:, 1:, 0] = self.values[:, :, 11]
+        # A December only opens the next row's winter when that row is the next year
+        shifted[:, 1:-1, 0][:, np.diff(self.years) != 1] = np.nan
+        seasons = shifted[:, :-1].reshape(len(self.countries), len(self.years), 4, 3)
+
+        # Seasons with fewer than min_months months of data are left missing
+        present = ~np.isnan(seasons)
+        counts = present.sum(axis=3)
+        sums = np.where(present, seasons, 0.0).sum(axis=3)
+        self.seasonal_means = _read_only(np.where(counts >= min_months, sums / np.maximum(counts, 1), np.nan))
+
+    # Build the cube from a long-format frame with Country, Year, Month (1-12) and Temperature Change
+    @classmethod
+    def from_frame(cls, data):
+        country_codes, countries = pd.factorize(data['Country'], sort=True)
+        # Every year from the first to the last gets a row, even one missing from the
+        # data, so consecutive rows are consecutive years
+        year_values = data['Year'].to_numpy(dtype=np.int64)
+        first_year = year_values.min() if len(year_values) else 0
+        years = np.arange(first_year, year_values.max() + 1 if len(year_values) else 0)
+        year_codes = year_values - first_year
+        month_codes = data['Month'].to_numpy(dtype=np.int64) - 1
+        temperature = data['Temperature Change'].to_numpy(dtype=np.float64)
+
+        valid = ~np.isnan(temperature)
+        cells = (country_codes[valid] * len(years) + year_codes[valid]) * 12 + month_codes[valid]
+        size = len(countries) * len(years) * 12
+        sums = np.bincount(cells, weights=temperature[valid], minlength=size)
+        counts = np.bincount(cells, minlength=size)
+
+        values = np.full(size, np.nan)
+        np.divide(sums, counts, out=values, where=counts > 0)
+        return cls(np.asarray(countries), np.asarray(years), values.reshape(len(countries), len(years), 12))
+
+    # Seasonal means of one country as a frame indexed by Year with a column per season
+    def seasonal_frame(self, country):
+        row = self.country_index[country]
+        return pd.DataFrame(self.seasonal_means[row], index=pd.Index(self.years, name='Year'), columns=SEASONS)
+
+
+# Pairs of countries with fewer common years than this get no correlation
+MIN_COMMON_YEARS = 10
+
+# Rows of correlations computed per block; the temporary arrays of a block hold
+# block_rows x countries cells each
+CORRELATION_BLOCK_ROWS = 256
+
+# Most similar countries kept per country; larger lookups recompute that country's row
+SIMILAR_COUNTRIES = 50
+
+
+# Pearson correlation between the yearly series of countries, each pair over the
+# years both have data for (like pandas' DataFrame.corr()). Rows are computed a
+# block at a time from matrix products of the values and their masks, and only
+# each row's k strongest correlations are kept, so memory grows linearly with the
+# number of countries rather than with its square.
+class CorrelationMatrix:
+
+    def __init__(self, countries, values, neighbors, scores, min_periods=MIN_COMMON_YEARS, fingerprint=None):
+        self.countries = _read_only(np.asarray(countries, dtype=object))
+        self.values = values
+        self.neighbors = _read_only(neighbors)
+        self.scores = _read_only(scores)
+        self.min_periods = min_periods
+        self.fingerprint = fingerprint
+        self.country_index = {country: row for row, country in enumerate(self.countries)}
+
+    @classmethod
+    def from_core(cls, core, k=SIMILAR_COUNTRIES, min_periods=MIN_COMMON_YEARS, block_rows=CORRELATION_BLOCK_ROWS):
+        neighbors, scores = top_correlations(core.values, k, min_periods, block_rows)
+        return cls(core.countries, core.values, neighbors, scores, min_periods, core.fingerprint)
+
+    # Correlation of every country with one country as a Series indexed by Country,
+    # computed for that one row
+    def correlations(self, country):
+        row = self.country_index[country]
+        r = correlation_rows(self.values, slice(row, row + 1), self.min_periods)[0]
+        return pd.Series(r.astype(np.float64), index=pd.Index(self.countries, name='Country'), name='Correlation')
+
+    # The k countries whose yearly series correlate most strongly with country's,
+    # strongest first, as a frame with Country and Correlation
+    def most_similar(self, country, k=5):
+        row = self.country_index[country]
+        if k <= self.neighbors.shape[1]:
+            top = self.neighbors[row, :k]
+            scores = self.scores[row, :k]
+        else:
+            r = correlation_rows(self.values, slice(row, row + 1), self.min_periods)
+            top, scores = _top_of_rows(r, slice(row, row + 1), k)
+            top, scores = top[0], scores[0]
+        found = top >= 0
+        return pd.DataFrame({'Country': self.countries[top[found]], 'Correlation': scores[found].astype(np.float64)})
+
+
+# NaN-aware Pearson correlation of the given rows of values with every row, each
+# pair over the columns where both rows have data. Pairs with fewer than
+# min_periods common columns, or with a constant series, are NaN.
+def correlation_rows(values, rows, min_periods=MIN_COMMON_YEARS):
+    present = ~np.isnan(values)
+    mask = present.astype(np.float64)
+    filled = np.where(present, values, 0.0)
+    squares = filled * filled
+
+    # Sums over the common years of each pair (block row i, column j)
+    n = mask[rows] @ mask.T
+    sx = filled[rows] @ mask.T
+    sy = mask[rows] @ filled.T
+    sxx = squares[rows] @ mask.T
+    syy = mask[rows] @ squares.T
+    sxy = filled[rows] @ filled.T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = sxy - sx * sy / n
+        spread = (sxx - sx * sx / n) * (syy - sy * sy / n)
+        r = np.clip(covariance / np.sqrt(spread), -1.0, 1.0)
+    r[(n < min_periods) | ~(spread > 0)] = np.nan
+    return r
+
+
+# The k strongest correlations of every row of values with the other rows,
+# strongest first: column positions (-1 where there are fewer than k) and
+# float32 scores (NaN there), each a rows x k array. Rows are correlated a block
+# at a time and only each row's top k are kept.
+def top_correlations(values, k=SIMILAR_COUNTRIES, min_periods=MIN_COMMON_YEARS, block_rows=CORRELATION_BLOCK_ROWS):
+    k = max(0, min(k, len(values) - 1))
+    neighbors = np.empty((len(values), k), dtype=np.int64)
+    scores = np.empty((len(values), k), dtype=np.float32)
+    for start in range(0, len(values), block_rows):
+        rows = slice(start, start + block_rows)
+        neighbors[rows], scores[rows] = _top_of_rows(correlation_rows(values, rows, min_periods), rows, k)
+    return neighbors, scores
+
+
+# Top k columns of each row of a block of correlations, leaving out the row's own
+# column and NaN; argpartition finds them in linear time and only they are sorted
+def _top_of_rows(r, rows, k):
+    r = np.where(np.isnan(r), -np.inf, r)
+    own = np.arange(rows.start, rows.start + len(r))
+    r[np.arange(len(r)), own] = -np.inf
+    k = min(k, r.shape[1])
+    if k == 0:
+        return np.empty((len(r), 0), dtype=np.int64), np.empty((len(r), 0), dtype=np.float32)
+    top = np.argpartition(-r, k - 1, axis=1)[:, :k] if k < r.shape[1] else np.tile(np.arange(r.shape[1]), (len(r), 1))
+    top_scores = np.take_along_axis(r, top, axis=1)
+    order = np.lexsort((top, -top_scores), axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    missing = ~np.isfinite(top_scores)
+    return np.where(missing, -1, top), np.where(missing, np.nan, top_scores).astype(np.float32)
+
+
+# Years before a value that its rolling baseline covers, and the fewest of them
+# with data for the value to be scored
+ROLLING_WINDOW = 10
+ROLLING_MIN_YEARS = 5
+
+# Scale of the median absolute deviation that makes it comparable to a standard
+# deviation for normally distributed data (Iglewicz and Hoaglin's modified z-score)
+MAD_SCALE = 1.4826
+
+# What a value is compared with: the country's own previous years, or every
+# country in the same year
+OUTLIER_BASELINES = ['history', 'peers']
+
+# How far from the baseline a value is: (value - mean) / standard deviation, or
+# the robust (value - median) / (MAD_SCALE * median absolute deviation)
+OUTLIER_METHODS = ['z', 'mad']
+
+
+# Outlier scores of every country in every year, for each baseline and method.
+# Rolling sums come from cumulative sums along the year axis and rolling medians
+# from a strided window view, so the whole panel is scored without looping over
+# countries or years.
+class OutlierScreen:
+
+    def __init__(self, countries, years, values, window=ROLLING_WINDOW, min_years=ROLLING_MIN_YEARS, fingerprint=None):
+        self.countries = _read_only(np.asarray(countries, dtype=object))
+        self.years = _read_only(np.asarray(years, dtype=np.int64))
+        self.values = _read_only(np.asarray(values, dtype=np.float64))
+        self.window = window
+        self.fingerprint = fingerprint
+
+        # Baseline centre and spread per method, each a country x year matrix
+        history = {
+            'z': rolling_mean_std(self.values, window, min_years),
+            'mad': rolling_median_mad(self.values, window, min_years),
+        }
+        peers = {
+            'z': (_nan_mean(self.values, axis=0), _nan_std(self.values, axis=0)),
+            'mad': _median_mad(self.values, axis=0),
+        }
+        self.centers = {}
+        self.scores = {}
+        for baseline, spreads in (('history', history), ('peers', peers)):
+            for method, (center, spread) in spreads.items():
+                center = np.broadcast_to(center, self.values.shape)
+                spread = np.broadcast_to(spread, self.values.shape)
+                if method == 'mad':
+                    spread = spread * MAD_SCALE
+                score = np.full(self.values.shape, np.nan)
+                np.divide(self.values - center, spread, out=score, where=spread > 0)
+                self.centers[baseline, method] = _read_only(np.array(center))
+                self.scores[baseline, method] = _read_only(score)
+
+    @classmethod
+    def from_core(cls, core, window=ROLLING_WINDOW, min_years=ROLLING_MIN_YEARS):
+        return cls(core.countries, core.years, core.values, window, min_years, core.fingerprint)
+
+    # Number of countries flagged in each year as a Series indexed by Year
+    def counts(self, baseline, method, threshold):
+        flagged = np.abs(np.nan_to_num(self.scores[baseline, method])) > threshold
+        return pd.Series(flagged.sum(axis=0), index=pd.Index(self.years, name='Year'), name='Outliers')
+
+    # Countries flagged in one year with their value, baseline and score, the
+    # largest deviations first
+    def year_outliers(self, year, baseline, method, threshold):
+        column = int(np.searchsorted(self.years, year))
+        score = self.scores[baseline, method][:, column]
+        rows = np.flatnonzero(np.abs(np.nan_to_num(score)) > threshold)
+        rows = rows[np.argsort(-np.abs(score[rows]), kind='stable')]
+        return pd.DataFrame({
+            'Country': self.countries[rows],
+            'Temperature Change': self.values[rows, column],
+            'Baseline': self.centers[baseline, method][rows, column],
+            'Score': score[rows],
+        })
+
+
+# Mean and sample standard deviation of the window values before each column of
+# every row, from cumulative sums; NaN where fewer than min_periods have data
+def rolling_mean_std(values, window, min_periods):
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+    zero = np.zeros((len(values), 1))
+    sums = np.hstack([zero, np.cumsum(filled, axis=1)])
+    squares = np.hstack([zero, np.cumsum(filled * filled, axis=1)])
+    counts = np.hstack([zero, np.cumsum(present, axis=1)])
+
+    # Window of column j covers columns [j - window, j)
+    end = np.arange(values.shape[1])
+    start = np.maximum(end - window, 0)
+    window_sums = sums[:, end] - sums[:, start]
+    window_squares = squares[:, end] - squares[:, start]
+    window_counts = counts[:, end] - counts[:, start]
+
+    enough = window_counts >= min_periods
+    mean = np.where(enough, _mean(window_sums, window_counts), np.nan)
+    std = np.where(enough, np.sqrt(_variance(window_sums, window_squares, window_counts)), np.nan)
+    return mean, std
+
+
+# Median and median absolute deviation of the window values before each column of
+# every row, over a strided view of the NaN-padded matrix
+def rolling_median_mad(values, window, min_periods):
+    padded = np.hstack([np.full((len(values), window), np.nan), values])
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window, axis=1)[:, :values.shape[1]]
+    median, mad = _median_mad(windows, axis=2)
+    enough = (~np.isnan(windows)).sum(axis=2) >= min_periods
+    return np.where(enough, median, np.nan), np.where(enough, mad, np.nan)
+
+
+# NaN-aware median and median absolute deviation along axis; all-missing slices are NaN
+def _median_mad(values, axis):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        median = np.nanmedian(values, axis=axis)
+        mad = np.nanmedian(np.abs(values - np.expand_dims(median, axis)), axis=axis)
+    return median, mad
+
+
+# Most breaks looked for in a country's series, and the fewest years with data
+# between two breaks
+MAX_BREAKS = 3
+MIN_SEGMENT_YEARS = 10
+
+# Most (country x segment start x segment end) cells the segmentation holds at once
+CHANGE_POINT_BLOCK_CELLS = 4_000_000
+
+
+# Shifts in the mean level of every country's series. Each series is split into
+# segments with constant means, minimizing the squared deviations from them: the
+# cost of every segment comes from cumulative sums, and exact dynamic programming
+# over segment ends finds the best 1..MAX_BREAKS breaks for a block of countries
+# and segment ends at once. The number of breaks is chosen by BIC, so a country without a clear
+# shift keeps none.
+class ChangePoints:
+
+    def __init__(self, countries, years, values, max_breaks=MAX_BREAKS, min_years=MIN_SEGMENT_YEARS, fingerprint=None):
+        self.countries = _read_only(np.asarray(countries, dtype=object))
+        self.years = _read_only(np.asarray(years, dtype=np.int64))
+        self.max_breaks = max_breaks
+        self.fingerprint = fingerprint
+        self.country_index = {country: row for row, country in enumerate(self.countries)}
+
+        values = np.asarray(values, dtype=np.float64)
+        present = ~np.isnan(values)
+        zero = np.zeros((len(values), 1))
+        self.sums = np.hstack([zero, np.cumsum(np.where(present, values, 0.0), axis=1)])
+        self.counts = np.hstack([zero, np.cumsum(present, axis=1)])
+
+        # Squared deviations with 0..max_breaks breaks and the break positions
+        # (matrix columns where a new segment starts) for each number of breaks
+        rows = len(values)
+        block = max(1, CHANGE_POINT_BLOCK_CELLS // (values.shape[1] + 1) ** 2)
+        self.costs = np.full((rows, max_breaks + 1), np.inf)
+        self.positions = np.zeros((rows, max_breaks, max_breaks), dtype=np.int64)
+        for start in range(0, rows, block):
+            part = slice(start, start + block)
+            self.costs[part], self.positions[part] = optimal_partitions(values[part], min_years, max_breaks)
+
+        # Bayesian information criterion of each number of breaks: every break adds
+        # a position and a segment mean
+        n = self.counts[:, -1:]
+        breaks = np.arange(max_breaks + 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bic = n * np.log(np.maximum(self.costs, 1e-12) / n) + (2 * breaks + 1) * np.log(n)
+        bic[~np.isfinite(self.costs)] = np.inf
+        self.count = _read_only(np.where(np.isfinite(bic).any(axis=1), np.argmin(bic, axis=1), -1))
+        self.costs = _read_only(self.costs)
+
+    @classmethod
+    def from_core(cls, core, max_breaks=MAX_BREAKS, min_years=MIN_SEGMENT_YEARS):
+        return cls(core.countries, core.years, core.values, max_breaks, min_years, core.fingerprint)
+
+    # Break years of one country: its single most likely break, or the number of
+    # breaks chosen by BIC when multiple is True
+    def breaks(self, country, multiple=True):
+        row = self.country_index[country]
+        count = self.count[row] if multiple else 1
+        if count <= 0 or not np.isfinite(self.costs[row, count]):
+            return []
+        return [int(self.years[position]) for position in self.positions[row, count - 1, :count]]
+
+    # Every break as a row with Country, Year, the mean before and after it and the
+    # shift between them, over all countries
+    def table(self, multiple=True):
+        frames = []
+        for count in range(1, self.max_breaks + 1):
+            if multiple:
+                rows = np.flatnonzero(self.count == count)
+            else:
+                rows = np.flatnonzero(np.isfinite(self.costs[:, 1])) if count == 1 else np.empty(0, dtype=np.int64)
+            if len(rows) == 0:
+                continue
+            # Segment bounds of each country: the series start, its breaks and its end
+            bounds = np.hstack([np.zeros((len(rows), 1), dtype=np.int64), self.positions[rows, count - 1, :count],
+                                np.full((len(rows), 1), len(self.years))])
+            means = _mean(np.diff(np.take_along_axis(self.sums[rows], bounds, axis=1), axis=1),
+                          np.diff(np.take_along_axis(self.counts[rows], bounds, axis=1), axis=1))
+            frames.append(pd.DataFrame({
+                'Country': np.repeat(self.countries[rows], count),
+                'Year': self.years[bounds[:, 1:-1]].ravel(),
+                'Before': means[:, :-1].ravel(),
+                'After': means[:, 1:].ravel(),
+            }))
+        table = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['Country', 'Year', 'Before', 'After'])
+        table['Shift'] = table['After'] - table['Before']
+        return table
+
+    # Mean of each segment of one country as a Series indexed by Year, for drawing
+    def segment_means(self, country, multiple=True):
+        row = self.country_index[country]
+        bounds = [0] + [int(np.searchsorted(self.years, year)) for year in self.breaks(country, multiple)] + [len(self.years)]
+        levels = np.full(len(self.years), np.nan)
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            count = self.counts[row, end] - self.counts[row, start]
+            if count > 0:
+                levels[start:end] = (self.sums[row, end] - self.sums[row, start]) / count
+        return pd.Series(levels, index=pd.Index(self.years, name='Year'), name='Segment Mean')
+
+
+# Squared deviation from the mean of every segment [i, j) with an end j in
+# [first, last) and a start i < last, as a rows x last x (last - first) array from
+# the rows' cumulative sums, squares and counts. Segments with fewer than min_years
+# values, or starting at a position that is not in starts, cost infinity.
+def segment_costs(sums, squares, counts, starts, min_years, first, last):
+    n = counts[:, None, first:last] - counts[:, :last, None]
+    s = sums[:, None, first:last] - sums[:, :last, None]
+    cost = squares[:, None, first:last] - squares[:, :last, None]
+    # In place, as the block is the largest array of the segmentation
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s *= s
+        s /= n
+        cost -= s
+    np.maximum(cost, 0.0, out=cost)
+    cost[(n < min_years) | ~starts[:, :last, None]] = np.inf
+    return cost
+
+
+# Exact optimal partitioning of every row of values into segments of at least
+# min_years values. Returns the lowest total cost with 0..max_breaks breaks
+# (rows x max_breaks + 1) and, for k breaks, the k break positions in
+# positions[:, k - 1, :k]. Segment ends are taken a block at a time, so at most
+# about block_cells segment costs exist at once: a segment ending in a block
+# starts at an earlier end, whose best totals are already known.
+def optimal_partitions(values, min_years, max_breaks, block_cells=CHANGE_POINT_BLOCK_CELLS):
+    rows, ends = len(values), values.shape[1] + 1
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+    zero = np.zeros((rows, 1))
+    sums = np.hstack([zero, np.cumsum(filled, axis=1)])
+    squares = np.hstack([zero, np.cumsum(filled * filled, axis=1)])
+    counts = np.hstack([zero, np.cumsum(present, axis=1)])
+    # A break is dated by the first year of the new segment, which must have data
+    starts = np.hstack([np.ones((rows, 1), dtype=bool), present[:, 1:], np.zeros((rows, 1), dtype=bool)])
+
+    # Best cost of the first j positions with k breaks, and the start of its last segment
+    totals = np.full((max_breaks + 1, rows, ends), np.inf)
+    previous = np.zeros((max_breaks, rows, ends), dtype=np.int64)
+    width = max(1, block_cells // max(rows * ends, 1))
+    for first in range(0, ends, width):
+        last = min(first + width, ends)
+        costs = segment_costs(sums, squares, counts, starts, min_years, first, last)
+        totals[0, :, first:last] = costs[:, 0, :]
+        for k in range(1, max_breaks + 1):
+            # Best cost up to the last break plus the new segment
+            candidates = totals[k - 1, :, :last, None] + costs
+            best = np.argmin(candidates, axis=1)
+            totals[k, :, first:last] = np.take_along_axis(candidates, best[:, None, :], axis=1)[:, 0]
+            previous[k - 1, :, first:last] = best
+
+    positions = np.zeros((rows, max_breaks, max_breaks), dtype=np.int64)
+    everyone = np.arange(rows)
+    for count in range(1, max_breaks + 1):
+        position = np.full(rows, ends - 1)
+        for step in range(count, 0, -1):
+            position = previous[step - 1, everyone, position]
+            positions[:, count - 1, step - 1] = position
+    return totals[:, :, -1].T, positions
+
+
+# NaN-aware ordinary least squares of each row of values against years, computed
+# for all rows at once. Returns slope, intercept, r, two-sided p-value and the
+# slope's standard error per row, with the same meaning as scipy's linregress.
+def fit_trends(years, values):
+    values = np.atleast_2d(values)
+    present = ~np.isnan(values)
+    # Centre the years to keep the sums of squares well conditioned
+    origin = float(np.mean(years))
+    x = np.where(present, np.asarray(years, dtype=np.float64) - origin, 0.0)
+    y = np.where(present, values, 0.0)
+    return trend_from_sums(
+        present.sum(axis=1), x.sum(axis=1), y.sum(axis=1),
+        (x * x).sum(axis=1), (x * y).sum(axis=1), (y * y).sum(axis=1), origin)
+
+
+# Regression statistics from per-row running sums of x, y, x*x, x*y and y*y, where
+# x is measured from origin. Rows with fewer than three points come back as NaN.
+def trend_from_sums(n, sx, sy, sxx, sxy, syy, origin=0.0):
+    n = np.asarray(n, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ssx = sxx - sx * sx / n
+        ssy = syy - sy * sy / n
+        sxy_centered = sxy - sx * sy / n
+        slope = sxy_centered / ssx
+        intercept = (sy - slope * sx) / n - slope * origin
+        r = np.clip(sxy_centered / np.sqrt(ssx * ssy), -1.0, 1.0)
+        df = n - 2
+        stderr = np.sqrt((1 - r * r) * ssy / ssx / df)
+        t = r * np.sqrt(df / ((1.0 - r) * (1.0 + r)))
+        p_value = 2 * stats.t.sf(np.abs(t), df)
+    valid = n > 2
+    return {
+        'slope': np.where(valid, slope, np.nan),
+        'intercept': np.where(valid, intercept, np.nan),
+        'r': np.where(valid, r, np.nan),
+        'p_value': np.where(valid, p_value, np.nan),
+        'stderr': np.where(valid, stderr, np.nan),
+        'n': n.astype(np.int64),
+    }
+
+
+# urban_rural_mapping.json compiled into integer codes per mapped country, so the
+# derived columns can be filled by array lookups instead of per-row lambdas
+class CountryMapping:
+
+    def __init__(self, mapping):
+        self.countries = pd.Index(sorted(mapping))
+        self.urban_rural_categories = sorted({info['urban_rural'] for info in mapping.values()})
+        self.region_categories = sorted({info['region'] for info in mapping.values()})
+
+        urban_rural = pd.Categorical([mapping[c]['urban_rural'] for c in self.countries], categories=self.urban_rural_categories)
+        region = pd.Categorical([mapping[c]['region'] for c in self.countries], categories=self.region_categories)
+        self.urban_rural_codes = _read_only(np.asarray(urban_rural.codes, dtype=np.int64))
+        self.region_codes = _read_only(np.asarray(region.codes, dtype=np.int64))
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'r') as file:
+            return cls(json.load(file))
+
+    # Positions of the given countries in the mapping, -1 where a country is not mapped
+    def positions(self, countries):
+        return self.countries.get_indexer(pd.Index(countries))
+
+
+# Mapping codes of countries at the given mapping positions, missing where a country is not mapped
+def _country_codes(positions, codes, missing):
+    return np.where(positions >= 0, codes[positions], missing)
+
+
+# Group x year sums, squares and counts of a country grouping, with the means and
+# spreads derived from them. Groups and years without data are NaN.
+class GroupStats:
+
+    def __init__(self, groups, years, sums, squares, counts):
+        self.groups = list(groups)
+        self.years = years
+        self.counts = _read_only(counts)
+        self.means = _read_only(_mean(sums, counts))
+        self.stds = _read_only(np.sqrt(_variance(sums, squares, counts)))
+        self.overall_counts = _read_only(counts.sum(axis=1))
+        self.overall_means = _read_only(_mean(sums.sum(axis=1), self.overall_counts))
+
+    # Long-format frame of the group x year means with the number of values behind
+    # each, leaving out empty cells as groupby(observed=True) does
+    def frame(self, name='Group'):
+        present = self.counts > 0
+        rows, columns = np.nonzero(present)
+        return pd.DataFrame({
+            name: pd.Categorical.from_codes(rows, categories=self.groups),
+            'Year': self.years[columns],
+            'Temperature Change': self.means[present],
+            'Std': self.stds[present],
+            'Count': self.counts[present],
+        })
+
+    # Mean of each group over all its values and years, for groups with data
+    def overall(self, name='Group'):
+        present = self.overall_counts > 0
+        return pd.Series(self.overall_means[present], index=pd.Index(np.asarray(self.groups, dtype=object)[present], name=name),
+                         name='Temperature Change')
+
+    # Yearly mean of one group as a Series indexed by Year
+    def series(self, group):
+        return pd.Series(self.means[self.groups.index(group)], index=pd.Index(self.years, name='Year'), name='Temperature Change')
+
+
+# Most groupings a GroupEngine keeps, least recently used dropped first; custom
+# groups picked on the G7 page each make a grouping
+GROUP_CACHE_ENTRIES = 64
+
+# Group statistics over the data core's country x year matrix. A grouping is one
+# of the mapping's dimensions (Urban_Rural, Continent or Region) or a dict of
+# group name -> countries, such as G7 or a custom list; custom groups may overlap.
+# Every (country, group) membership becomes a group code, and one bincount over
+# group x year cell numbers sums the whole matrix per grouping, so no long-format
+# frame is filtered or grouped. Results are kept for the GROUP_CACHE_ENTRIES most
+# recently used groupings.
+class GroupEngine:
+
+    def __init__(self, core, mapping):
+        self.core = core
+        positions = mapping.positions(core.countries)
+        self.unmapped_countries = [str(country) for country in core.countries[(positions < 0) & (core.country_counts > 0)]]
+
+        # Countries missing from the mapping are 'Unknown' in Urban_Rural and Continent
+        # and belong to no group in Region
+        unknown_urban_rural = len(mapping.urban_rural_categories)
+        unknown_region = len(mapping.region_categories)
+        urban_rural = _country_codes(positions, mapping.urban_rural_codes, unknown_urban_rural)
+        continent = _country_codes(positions, mapping.region_codes, unknown_region)
+        self.dimensions = {
+            'Urban_Rural': (mapping.urban_rural_categories + ['Unknown'], urban_rural),
+            'Continent': (mapping.region_categories + ['Unknown'], continent),
+            'Region': (mapping.region_categories, np.where(continent == unknown_region, -1, continent)),
+        }
+        self.cache = LRUCache(GROUP_CACHE_ENTRIES)
+
+    # Statistics of a grouping: a dimension name or a dict of group name -> countries.
+    # Countries that are not in the data are ignored.
+    def stats(self, grouping):
+        key = grouping if isinstance(grouping, str) else tuple((name, tuple(countries)) for name, countries in grouping.items())
+        stats = self.cache.get(key)
+        if stats is None:
+            stats = self._reduce(*self._memberships(grouping))
+            self.cache.put(key, stats)
+        return stats
+
+    # Group names and the (matrix row, group code) pair of every membership
+    def _memberships(self, grouping):
+        if isinstance(grouping, str):
+            groups, codes = self.dimensions[grouping]
+            rows = np.flatnonzero(codes >= 0)
+            return groups, rows, codes[rows]
+        index = self.core.country_index
+        members = [(index[country], code) for code, countries in enumerate(grouping.values()) for country in countries if country in index]
+        rows, codes = (np.array(column, dtype=np.int64) for column in zip(*members)) if members else (np.empty(0, np.int64),) * 2
+        return list(grouping), rows, codes
+
+    def _reduce(self, groups, rows, codes):
+        years = len(self.core.years)
+        present = self.core.mask[rows]
+        values = self.core.values[rows][present]
+        cells = (codes[:, None] * years + np.arange(years))[present]
+        size = len(groups) * years
+        sums = np.bincount(cells, weights=values, minlength=size).reshape(len(groups), years)
+        squares = np.bincount(cells, weights=values * values, minlength=size).reshape(len(groups), years)
+        counts = np.bincount(cells, minlength=size).reshape(len(groups), years)
+        return GroupStats(groups, self.core.years, sums, squares, counts)
+
+
+# Positions of the n largest (or smallest) values, best first, leaving out NaN and,
+# when keep is given, positions where it is False. argpartition finds the n in
+# linear time and only they are sorted; ties are broken by position.
+def top_indices(values, n, largest=True, keep=None):
+    valid = ~np.isnan(values) if keep is None else keep & ~np.isnan(values)
+    positions = np.flatnonzero(valid)
+    scores = -values[positions] if largest else values[positions]
+    n = min(n, len(positions))
+    if n == 0:
+        return positions[:0]
+    if n < len(positions):
+        selected = np.argpartition(scores, n - 1)[:n]
+        positions, scores = positions[selected], scores[selected]
+    return positions[np.lexsort((positions, scores))]
+
+
+# Metrics a country ranking can be ordered by: mean temperature change over all
+# years, linear warming rate per year, and the change in mean after a split year
+COUNTRY_METRICS = ['mean', 'slope', 'change']
+
+# Most rankings and split-year change vectors a Rankings keeps; the least recently
+# used are dropped first, so arbitrary query parameters cannot grow them
+RANKING_CACHE_ENTRIES = 256
+CHANGE_METRIC_ENTRIES = 16
+
+# Top and bottom N countries or years by a precomputed metric vector. Country
+# rankings can be limited to a region and an urban/rural class through the group
+# engine's codes. Rankings are kept per query, as they are the most viewed tables.
+class Rankings:
+
+    def __init__(self, core, groups):
+        self.core = core
+        self.groups = groups
+        self.country_metrics = {'mean': core.country_means, 'slope': _read_only(core.trends()['slope'])}
+        self.year_metrics = {'mean': core.year_means}
+        self.changes = LRUCache(CHANGE_METRIC_ENTRIES)
+        self.cache = LRUCache(RANKING_CACHE_ENTRIES)
+
+    # Split year moved into the core's years, leaving at least one year after it
+    def clamp_split_year(self, split_year):
+        first, last = int(self.core.years[0]), int(self.core.years[-1])
+        return min(max(int(split_year), first), max(first, last - 1))
+
+    # Per-country metric vector; the change after split_year comes from the core's prefix sums
+    def country_metric(self, metric, split_year=None):
+        if metric != 'change':
+            return self.country_metrics[metric]
+        split_year = self.clamp_split_year(split_year)
+        change = self.changes.get(split_year)
+        if change is None:
+            first, last = int(self.core.years[0]), int(self.core.years[-1])
+            before = self.core.range_mean(first, split_year).to_numpy()
+            after = self.core.range_mean(split_year + 1, last).to_numpy()
+            change = _read_only(after - before)
+            self.changes.put(split_year, change)
+        return change
+
+    # The n countries with the highest (or lowest) metric as a frame with Rank,
+    # Country and the metric, optionally only those of a region and urban/rural class
+    def countries(self, metric='mean', n=10, largest=True, region=None, urban_rural=None, split_year=None):
+        split_year = self.clamp_split_year(split_year) if metric == 'change' else None
+        key = ('countries', metric, n, largest, region, urban_rural, split_year)
+        return self._cached(key, lambda: self._rank_countries(metric, n, largest, region, urban_rural, split_year))
+
+    # The n years with the highest (or lowest) global mean as a frame with Rank, Year and the metric
+    def years(self, metric='mean', n=10, largest=True):
+        key = ('years', metric, n, largest)
+        return self._cached(key, lambda: self._rank(self.year_metrics[metric], n, largest, None, 'Year', self.core.years, metric))
+
+    def _rank_countries(self, metric, n, largest, region, urban_rural, split_year):
+        keep = None
+        for dimension, group in (('Region', region), ('Urban_Rural', urban_rural)):
+            if group is not None:
+                groups, codes = self.groups.dimensions[dimension]
+                match = codes == (groups.index(group) if group in groups else -2)
+                keep = match if keep is None else keep & match
+        values = self.country_metric(metric, split_year)
+        return self._rank(values, n, largest, keep, 'Country', self.core.countries, metric)
+
+    def _rank(self, values, n, largest, keep, label, labels, metric):
+        positions = top_indices(values, n, largest, keep)
+        return pd.DataFrame({'Rank': np.arange(1, len(positions) + 1), label: labels[positions], metric: values[positions]})
+
+    def _cached(self, key, rank):
+        ranking = self.cache.get(key)
+        if ranking is None:
+            ranking = rank()
+            self.cache.put(key, ranking)
+        return ranking
+
+
+# Named datasets computed on first request and memoized. Each builder receives
+# the registry so it can ask for the artifacts it depends on. The registry is
+# shared between sessions, so every artifact is built at most once.
+#
+# Sources are versioned inputs such as file modification times. The registry
+# records which artifacts were built from which sources and artifacts, so when a
+# source changes only the artifacts that depend on it are dropped. A dropped
+# artifact's last value stays available through last(), which lets a builder
+# update it incrementally instead of starting over.
+#
+# Every drop also bumps the artifact's generation. A build that was running when
+# one of its inputs was dropped still returns its value to its caller, but the
+# value is not kept, so the next request builds from the new source.
+class Artifacts:
+
+    def __init__(self, builders):
+        self.builders = dict(builders)
+        self.values = {}
+        self.previous = {}
+        self.versions = {}
+        self.dependents = {}
+        self.generations = {}
+        self.locks = {name: threading.Lock() for name in self.builders}
+        self.graph_lock = threading.RLock()
+        self.building = threading.local()
+
+    # Note that the artifact being built (if any) depends on name
+    def _record(self, name):
+        stack = getattr(self.building, 'stack', None)
+        if stack:
+            with self.graph_lock:
+                self.dependents.setdefault(name, set()).add(stack[-1])
+
+    def get(self, name):
+        self._record(name)
+        # Read once: another thread may drop the value between a check and a lookup
+        value = self.values.get(name, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self.locks[name]:
+            value = self.values.get(name, _MISSING)
+            if value is _MISSING:
+                generation = self.generations.get(name, 0)
+                stack = self.building.__dict__.setdefault('stack', [])
+                stack.append(name)
+                try:
+                    value = self.builders[name](self)
+                finally:
+                    stack.pop()
+                with self.graph_lock:
+                    if self.generations.get(name, 0) == generation:
+                        self.values[name] = value
+                        self.previous.pop(name, None)
+        return value
+
+    def ready(self, name):
+        return name in self.values
+
+    # Whether name is built and, when it is a Future for a background result, done
+    def finished(self, name):
+        value = self.values.get(name, _MISSING)
+        return value is not _MISSING and (not isinstance(value, Future) or value.done())
+
+    # Number of times name has been dropped; a build seen at one generation is stale at the next
+    def generation(self, name):
+        with self.graph_lock:
+            return self.generations.get(name, 0)
+
+    # Current version of a source, recording it as a dependency of the artifact being built
+    def source(self, name):
+        self._record(name)
+        return self.versions.get(name)
+
+    # Set source versions and drop the artifacts built from any source that changed
+    def update_sources(self, **versions):
+        with self.graph_lock:
+            for name, version in versions.items():
+                if name in self.versions and self.versions[name] != version:
+                    self.versions[name] = version
+                    self.invalidate(name)
+                else:
+                    self.versions[name] = version
+
+    # Drop everything built from name, directly or through other artifacts,
+    # including builds still running
+    def invalidate(self, name):
+        with self.graph_lock:
+            for dependent in self.dependents.pop(name, set()):
+                self.generations[dependent] = self.generations.get(dependent, 0) + 1
+                value = self.values.pop(dependent, _MISSING)
+                if value is not _MISSING:
+                    self.previous[dependent] = value
+                self.invalidate(dependent)
+
+    # Drop an artifact that is still value, and everything built from it, so that the
+    # next get() builds it again, e.g. after its background computation failed
+    def discard(self, name, value):
+        with self.graph_lock:
+            if self.values.get(name, _MISSING) is value:
+                self.generations[name] = self.generations.get(name, 0) + 1
+                del self.values[name]
+                self.invalidate(name)
+
+    # Value of an artifact before it was last invalidated, or None
+    def last(self, name):
+        return self.previous.get(name)
+
+
+# Builder of the data core of the dataset at csv_path, from the 'data' source. When
+# new years were appended to the store since the last build, only the appended rows
+# are folded into the previous core.
+def load_core(artifacts, csv_path):
+    artifacts.source('data')
+    data = load_dataset(csv_path)
+    previous = artifacts.last('core')
+    if previous is not None and previous.fingerprint is not None and previous.fingerprint == data.attrs['parent']:
+        core = previous.extend(data.iloc[data.attrs['base_rows']:], data.attrs['fingerprint'])
+        if core is not None:
+            return core
+    return DataCore.from_frame(data)
+
+
+# Builder of the content fingerprint of the 'data', 'mapping' and, when a monthly
+# file is given, 'monthly' sources; equal fingerprints mean equal datasets. Missing
+# sources count as empty.
+def sources_fingerprint(artifacts, data_file, mapping_file, monthly_file=None):
+    parts = [load_dataset(data_file).attrs['fingerprint'] if artifacts.source('data') else '']
+    parts.append(file_digest(mapping_file) if artifacts.source('mapping') else '')
+    if monthly_file is not None:
+        parts.append(load_dataset(monthly_file).attrs['fingerprint'] if artifacts.source('monthly') else '')
+    return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+
+# Builds artifacts on a thread pool in the background, in priority order, so a
+# cold process has them ready before pages ask for them. Pages never wait on the
+# warm-up itself: Artifacts.get() builds an artifact that is not warm yet on
+# demand, or joins the build if a warm-up thread has already started it.
+class WarmUp:
+
+    def __init__(self, artifacts, names, workers=2):
+        self.artifacts = artifacts
+        self.names = list(names)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='climate-warm-up')
+        self.queued = set()
+        self.seconds = {}
+        # Error of each failed artifact, with the generation it failed at
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    # Queue every artifact that is not built, queued or failed. Cheap enough to call
+    # on every rerun, which warms again whatever a source change dropped, including
+    # artifacts that failed before the change.
+    def schedule(self):
+        with self.lock:
+            for name in self.names:
+                if name in self.errors and self.errors[name][1] != self.artifacts.generation(name):
+                    del self.errors[name]
+                if name not in self.queued and name not in self.errors and not self.artifacts.ready(name):
+                    self.queued.add(name)
+                    self.executor.submit(self._build, name)
+
+    def _build(self, name):
+        start = time.perf_counter()
+        generation = self.artifacts.generation(name)
+        try:
+            self.artifacts.get(name)
+            self.seconds[name] = time.perf_counter() - start
+        except Exception as error:
+            self.errors[name] = (error, generation)
+        finally:
+            with self.lock:
+                self.queued.discard(name)
+
+    # Number of artifacts finished (built, with any background result done, or failed)
+    # out of all of them
+    def progress(self):
+        return sum(self.artifacts.finished(name) or name in self.errors for name in self.names), len(self.names)
+
+    def ready(self):
+        finished, total = self.progress()
+        return finished == total
+
+    # State and build time of every artifact, in priority order
+    def status(self):
+        rows = []
+        for name in self.names:
+            if name in self.errors:
+                state = f"failed: {self.errors[name][0]}"
+            elif self.artifacts.finished(name):
+                state = 'ready'
+            elif self.artifacts.ready(name):
+                state = 'running in the background'
+            else:
+                state = 'queued' if name in self.queued else 'not started'
+            rows.append({'Dataset': name, 'State': state, 'Seconds': self.seconds.get(name)})
+        return rows
+
+
+# Pivot long-format rows into a country x year matrix. Countries come from the data
+# unless positions (each row's matrix row) and the country list are given.
+# Duplicate Country-Year rows are averaged into a single cell.
+def _pivot(data, positions=None, countries=None):
+    if positions is None:
+        positions, countries = pd.factorize(data['Country'], sort=True)
+    year_codes, years = pd.factorize(data['Year'], sort=True)
+    temperature = data['Temperature Change'].to_numpy(dtype=np.float64)
+
+    valid = ~np.isnan(temperature)
+    cells = positions[valid] * len(years) + year_codes[valid]
+    size = len(countries) * len(years)
+    sums = np.bincount(cells, weights=temperature[valid], minlength=size)
+    counts = np.bincount(cells, minlength=size)
+
+    values = np.full(size, np.nan)
+    np.divide(sums, counts, out=values, where=counts > 0)
+    return np.asarray(countries), np.asarray(years), values.reshape(len(countries), len(years))
+
+
+def _nan_mean(values, axis):
+    present = ~np.isnan(values)
+    return _mean(np.where(present, values, 0.0).sum(axis=axis), present.sum(axis=axis))
+
+
+def _nan_std(values, axis):
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+    return np.sqrt(_variance(filled.sum(axis=axis), (filled * filled).sum(axis=axis), present.sum(axis=axis)))
+
+
+def _mean(sums, counts):
+    out = np.full(sums.shape, np.nan)
+    np.divide(sums, counts, out=out, where=counts > 0)
+    return out
+
+
+# Sample variance (ddof=1) to match pandas' default std()
+def _variance(sums, squares, counts):
+    out = np.full(sums.shape, np.nan)
+    np.divide(squares - sums * sums / np.maximum(counts, 1), counts - 1, out=out, where=counts > 1)
+    return np.maximum(out, 0.0, out=out, where=~np.isnan(out))
@@ -0,0 +1,231 @@
+import argparse
+import html
+import importlib.util
+import json
+import os
+import re
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import plotly.io as pio
+
+from climate_bootstrap import precompute
+from climate_core import CountryMapping, DataCore, GroupEngine
+from climate_store import load_dataset
+
+APP_FILE = 'streamlit_app.py'
+DATA_FILE = 'clean_climate_change_indicators.csv'
+MAPPING_FILE = 'urban_rural_mapping.json'
+
+# Element types copied from a page into its exported form; widgets are left out
+ALERTS = ['warning', 'info', 'error', 'success']
+
+
+# File name for a page, e.g. "G7 Analysis" -> "g7-analysis"
+def page_slug(page):
+    return re.sub(r'[^a-z0-9]+', '-', page.lower()).strip('-')
+
+
+# Make the app in this process write each figure it builds to figure_dir, so a
+# running dashboard can serve them. Set before the first run, since the app keeps
+# its figure cache for the life of the process.
+def prerender_into(figure_dir):
+    os.environ['CLIMATE_PRERENDERED_DIR'] = figure_dir
+    os.environ['CLIMATE_PRERENDER_WRITE'] = '1'
+
+
+# Run one page of the app headlessly with its default parameters and return its
+# elements in order as (type, value) pairs
+def render_page(app_dir, page, timeout=600):
+    from streamlit.testing.v1 import AppTest
+
+    os.chdir(app_dir)
+    app = AppTest.from_file(os.path.join(app_dir, APP_FILE), default_timeout=timeout)
+    app.run()
+    app.sidebar.radio[0].set_value(page).run()
+    if app.exception:
+        raise RuntimeError(f"{page}: {app.exception[0].message}")
+
+    elements = []
+    for node in app.main:
+        kind = getattr(node, 'type', None)
+        if kind in ('title', 'header', 'subheader', 'markdown', 'caption'):
+            elements.append((kind, node.value))
+        elif kind in ALERTS:
+            elements.append(('alert', (kind, node.value)))
+        elif kind == 'dataframe':
+            elements.append(('table', node.value))
+        elif kind == 'plotly_chart':
+            elements.append(('chart', node.proto.spec))
+    return page, elements
+
+
+# The few Markdown constructs the pages use: headings, bullet lists, bold and links
+def markdown_html(text):
+    blocks = []
+    for block in re.split(r'\n\s*\n', text.strip()):
+        lines = [line.strip() for line in block.strip().splitlines()]
+        inline = lambda line: re.sub(r'\[([^\]]+)\]\(([^)]+)\)', r'<a href="\2">\1</a>',
+                                     re.sub(r'\*\*(.+?)\*\*', r'<strong>\1</strong>', html.escape(line, quote=False)))
+        if lines and lines[0].startswith('#'):
+            level = min(len(lines[0]) - len(lines[0].lstrip('#')) + 1, 6)
+            blocks.append(f"<h{level}>{inline(lines[0].lstrip('#').strip())}</h{level}>")
+            lines = lines[1:]
+        if lines and all(line.startswith('- ') for line in lines):
+            blocks.append('<ul>' + ''.join(f"<li>{inline(line[2:])}</li>" for line in lines) + '</ul>')
+        elif lines:
+            blocks.append(f"<p>{inline(' '.join(lines))}</p>")
+    return '\n'.join(blocks)
+
+
+# Self-contained HTML for a page; plotly.js is embedded once unless plotlyjs='cdn'
+def page_html(page, elements, plotlyjs=True):
+    body = []
+    for kind, value in elements:
+        if kind == 'title':
+            body.append(f"<h1>{html.escape(value)}</h1>")
+        elif kind == 'header':
+            body.append(f"<h2>{html.escape(value)}</h2>")
+        elif kind == 'subheader':
+            body.append(f"<h3>{html.escape(value)}</h3>")
+        elif kind in ('markdown', 'caption'):
+            body.append(markdown_html(value))
+        elif kind == 'alert':
+            body.append(f"<div class=\"{value[0]}\">{markdown_html(value[1])}</div>")
+        elif kind == 'table':
+            body.append(value.to_html(border=0, float_format=lambda number: f"{number:.3f}"))
+        elif kind == 'chart':
+            body.append(pio.to_html(pio.from_json(value, skip_invalid=True), full_html=False, include_plotlyjs=plotlyjs))
+            plotlyjs = False if plotlyjs is True else plotlyjs
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{html.escape(page)}</title>
+<style>body {{ font-family: sans-serif; max-width: 960px; margin: auto; }} table {{ border-collapse: collapse; }}
+td, th {{ padding: 2px 8px; text-align: right; }} .warning {{ background: #fff3cd; }} .info {{ background: #e7f1ff; }}</style>
+</head><body>
+{chr(10).join(body)}
+</body></html>
+"""
+
+
+# JSON form of a page: the same elements, with charts as Plotly figure objects and tables as records
+def page_json(page, elements):
+    converted = []
+    for kind, value in elements:
+        if kind == 'chart':
+            value = json.loads(value)
+        elif kind == 'table':
+            value = json.loads(value.reset_index().to_json(orient='records'))
+        converted.append({'type': kind, 'value': value})
+    return {'page': page, 'elements': converted}
+
+
+# Aggregates behind the pages, as tables
+def aggregates():
+    core = DataCore.from_frame(load_dataset(DATA_FILE))
+    groups = GroupEngine(core, CountryMapping.from_file(MAPPING_FILE))
+    return {
+        'global_yearly_mean': core.yearly_mean().reset_index(),
+        'country_mean': core.country_mean().reset_index(),
+        'country_trends': core.trend_table(),
+        'continent_yearly_mean': groups.stats('Continent').frame('Continent'),
+        'region_mean': groups.stats('Region').overall('Region').reset_index(),
+        'urban_rural_yearly_mean': groups.stats('Urban_Rural').frame('Urban_Rural'),
+    }
+
+
+# Whether pandas can write Parquet here; it needs pyarrow or fastparquet, which the
+# dashboard itself does not
+def parquet_available():
+    return any(importlib.util.find_spec(engine) is not None for engine in ('pyarrow', 'fastparquet'))
+
+
+def write_aggregates(app_dir, directory, formats):
+    os.chdir(app_dir)
+    os.makedirs(directory, exist_ok=True)
+    # Without a Parquet engine the aggregates are written as CSV only
+    if 'parquet' in formats and not parquet_available():
+        print("Neither pyarrow nor fastparquet is installed; writing the aggregates as CSV instead of Parquet", file=sys.stderr)
+        formats = ['csv']
+    written = []
+    for name, table in aggregates().items():
+        if 'csv' in formats:
+            table.to_csv(os.path.join(directory, name + '.csv'), index=False)
+            written.append(name + '.csv')
+        if 'parquet' in formats:
+            table.to_parquet(os.path.join(directory, name + '.parquet'), index=False)
+            written.append(name + '.parquet')
+    return written
+
+
+def page_names(app_dir):
+    from streamlit.testing.v1 import AppTest
+
+    os.chdir(app_dir)
+    app = AppTest.from_file(os.path.join(app_dir, APP_FILE), default_timeout=600)
+    app.run()
+    return list(app.sidebar.radio[0].options)
+
+
+# Render every page of the app in the working directory (or the given pages) and the
+# aggregates in parallel, one page per task, and write them under out:
+# pages/<page>.html and .json, aggregates/*.csv and .parquet, and figures/ for the
+# dashboard to serve with CLIMATE_PRERENDERED_DIR.
+def export(out, pages=None, workers=None, formats=('csv', 'parquet'), plotlyjs=True):
+    app_dir = os.getcwd()
+    out = os.path.abspath(out)
+    figure_dir = os.path.join(out, 'figures')
+    shutil.rmtree(figure_dir, ignore_errors=True)
+    os.makedirs(figure_dir)
+    os.makedirs(os.path.join(out, 'pages'), exist_ok=True)
+
+    start = time.perf_counter()
+    # Bootstrap intervals are computed up front so that every page renders with them
+    precompute(os.path.join(app_dir, DATA_FILE), DataCore.from_frame(load_dataset(os.path.join(app_dir, DATA_FILE))))
+    with ProcessPoolExecutor(max_workers=workers, initializer=prerender_into, initargs=(figure_dir,)) as pool:
+        pages = pages or pool.submit(page_names, app_dir).result()
+        tables = pool.submit(write_aggregates, app_dir, os.path.join(out, 'aggregates'), formats)
+        rendered = list(pool.map(render_page, [app_dir] * len(pages), pages))
+
+    links = []
+    for page, elements in rendered:
+        slug = page_slug(page)
+        with open(os.path.join(out, 'pages', slug + '.html'), 'w') as file:
+            file.write(page_html(page, elements, plotlyjs))
+        with open(os.path.join(out, 'pages', slug + '.json'), 'w') as file:
+            json.dump(page_json(page, elements), file)
+        links.append(f"<li><a href=\"pages/{slug}.html\">{html.escape(page)}</a></li>")
+    with open(os.path.join(out, 'index.html'), 'w') as file:
+        file.write(f"<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>Climate Change Indicators Dashboard</title></head>"
+                   f"<body><h1>Climate Change Indicators Dashboard</h1><ul>{''.join(links)}</ul></body></html>\n")
+
+    manifest = {
+        'generated': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'fingerprint': load_dataset(os.path.join(app_dir, DATA_FILE)).attrs['fingerprint'],
+        'pages': {page: page_slug(page) for page, _ in rendered},
+        'aggregates': tables.result(),
+        'figures': len(os.listdir(figure_dir)),
+        'seconds': time.perf_counter() - start,
+    }
+    with open(os.path.join(out, 'manifest.json'), 'w') as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Prerender every dashboard page to static HTML and JSON, with the aggregates behind them.")
+    parser.add_argument('out', nargs='?', default='site', help="output directory")
+    parser.add_argument('--page', action='append', help="only export this page (can be repeated)")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument('--format', action='append', choices=['csv', 'parquet'], help="aggregate formats (default: both)")
+    parser.add_argument('--plotlyjs', choices=['inline', 'cdn'], default='inline', help="embed plotly.js in every page or load it from the CDN")
+    args = parser.parse_args()
+
+    # Worker processes find the task functions through the module rather than through
+    # __main__, which AppTest replaces with the app script while a page runs
+    import climate_export
+    manifest = climate_export.export(args.out, args.page, args.workers, args.format or ['csv', 'parquet'],
+                                     True if args.plotlyjs == 'inline' else 'cdn')
+    print(f"Exported {len(manifest['pages'])} pages, {manifest['figures']} figures and "
+          f"{len(manifest['aggregates'])} aggregate files to {args.out} in {manifest['seconds']:.1f}s", file=sys.stderr)
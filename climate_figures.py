@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.basedatatypes import BaseFigure
+
+from climate_core import LRUCache
+from climate_store import write_atomic
+
+# Bounds of the process-wide figure cache
+FIGURE_CACHE_ENTRIES = int(os.environ.get('CLIMATE_FIGURE_CACHE_ENTRIES', 512))
+FIGURE_CACHE_MB = float(os.environ.get('CLIMATE_FIGURE_CACHE_MB', 64))
+
+# Scatter traces are drawn with WebGL once a figure has more points than this
+WEBGL_POINTS = int(os.environ.get('CLIMATE_WEBGL_POINTS', 200))
+
+# Line traces longer than this are decimated to the minimum and maximum of each bucket
+MAX_LINE_POINTS = int(os.environ.get('CLIMATE_MAX_LINE_POINTS', 2000))
+
+
+# Positions of the minimum and maximum of each of buckets equal slices of y, in
+# order, so peaks and troughs survive the decimation
+def minmax_indices(y, buckets):
+    size = -(-len(y) // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:len(y)] = y
+    rows = padded.reshape(buckets, size)
+    missing = np.isnan(rows)
+    offsets = np.arange(buckets) * size
+    low = np.where(missing, np.inf, rows).argmin(axis=1) + offsets
+    high = np.where(missing, -np.inf, rows).argmax(axis=1) + offsets
+    keep = np.unique(np.concatenate([low, high]))
+    return keep[keep < len(y)]
+
+
+# Values as a NumPy array if they are all numbers, else None. Plotly sends NumPy
+# arrays base64-encoded, which is far smaller than a JSON list of floats.
+def _numeric(values):
+    if values is None:
+        return None
+    array = np.asarray(values)
+    return array if array.dtype.kind in 'biuf' else None
+
+
+# Prepare a figure for the browser: numeric trace data becomes NumPy arrays so it is
+# sent binary-encoded, line traces longer than max_line_points are decimated, and
+# scatter traces switch to WebGL (Scattergl) when the figure has more than
+# webgl_points points, since SVG slows down with every marker.
+def optimize_figure(fig, webgl_points=WEBGL_POINTS, max_line_points=MAX_LINE_POINTS):
+    traces = [trace.to_plotly_json() for trace in fig.data]
+    points = 0
+    for trace in traces:
+        if trace['type'] != 'scatter':
+            continue
+        x, y = _numeric(trace.get('x')), _numeric(trace.get('y'))
+        if y is not None and len(y) > max_line_points and 'lines' in trace.get('mode', 'lines') \
+                and ('x' not in trace or (x is not None and np.all(np.diff(x) >= 0))):
+            keep = minmax_indices(y.astype(np.float64), max_line_points // 2)
+            y = y[keep]
+            x = x[keep] if x is not None else keep
+        if x is not None:
+            trace['x'] = x
+        if y is not None:
+            trace['y'] = y
+        points += len(trace.get('y', ()))
+
+    # Traces are rebuilt rather than updated in place, since plotly keeps a tuple
+    # it already holds when assigned an equal array
+    webgl = points > webgl_points
+    fig.data = []
+    fig.add_traces([_webgl(trace) if webgl and trace['type'] == 'scatter' else trace for trace in traces])
+    return fig
+
+
+# Scattergl copy of a scatter trace; properties WebGL does not support (e.g.
+# spline lines) are dropped
+def _webgl(properties):
+    properties = dict(properties)
+    properties.pop('type')
+    return go.Scattergl(properties, skip_invalid=True)
+
+
+# A figure that is already serialized to JSON. st.plotly_chart() accepts any
+# plotly figure and only calls to_dict() on it, so a cached figure reaches the
+# browser without being rebuilt or validated again.
+class SerializedFigure(BaseFigure):
+
+    def __init__(self, spec):
+        # BaseFigure.__init__ would parse and validate the spec, which is the work being skipped
+        self._spec = spec
+
+    def to_dict(self):
+        return json.loads(self._spec)
+
+    def to_json(self, *args, **kwargs):
+        return self._spec
+
+    def __repr__(self):
+        return f"SerializedFigure({len(self._spec)} bytes)"
+
+
+# Serialized figures keyed by (page, figure id, dataset fingerprint, parameters),
+# evicted least recently used first once either bound is exceeded. Shared by all
+# sessions, so a figure that only depends on the data is built once per dataset.
+#
+# With a directory, figures missing from memory are looked for on disk first, e.g.
+# the ones prerendered by climate_export.py, and with write=True every figure built
+# is saved there as well.
+class FigureCache(LRUCache):
+
+    def __init__(self, max_entries=FIGURE_CACHE_ENTRIES, max_bytes=int(FIGURE_CACHE_MB * 2**20), directory=None, write=False):
+        super().__init__(max_entries, max_bytes)
+        self.directory = directory
+        self.write = write and directory is not None
+
+    # The figure for key, calling build() to make it only on a miss. Keys with a
+    # None part, such as a missing dataset fingerprint, are built every time.
+    # Returns the figure and whether it came from the cache.
+    def figure(self, key, build):
+        cacheable = None not in key
+        spec = self.get(key) if cacheable else None
+        if spec is None and cacheable and self.directory is not None:
+            spec = self._read(key)
+            if spec is not None:
+                self.put(key, spec)
+        if spec is not None:
+            return SerializedFigure(spec), True
+        spec = pio.to_json(build(), validate=False)
+        if cacheable:
+            self.put(key, spec)
+            if self.write:
+                self._write(key, spec)
+        return SerializedFigure(spec), False
+
+    def _path(self, key):
+        name = hashlib.sha256(json.dumps(key, default=str).encode()).hexdigest()
+        return os.path.join(self.directory, name + '.json')
+
+    def _read(self, key):
+        try:
+            with open(self._path(key), 'r') as file:
+                return file.read()
+        except OSError:
+            return None
+
+    # Export workers write side by side, and may write the same figure
+    def _write(self, key, spec):
+        write_atomic(self._path(key), lambda file: file.write(spec), 'w')
@@ -0,0 +1,191 @@
+import argparse
+import json
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+from climate_store import (MONTHS, STORE_VERSION, cache_root, file_digest, publish_store,
+                           staging_dir, store_name)
+
+# Year columns of the raw wide-format files, e.g. F1961 (Kaggle) or Y1961 (FAOSTAT)
+YEAR_COLUMN = re.compile(r'^[FY]?(\d{4})$')
+
+# Column holding the country name, in order of preference
+COUNTRY_COLUMNS = ['Country', 'Area']
+
+# Column holding the month name in monthly files
+MONTH_COLUMNS = ['Months', 'Month']
+
+# Full and abbreviated month names; anything else in the month column, such as
+# FAOSTAT's seasonal ("Dec-Jan-Feb") or yearly rows, is skipped
+MONTH_NAMES = {**MONTHS, **{name: number for number, name in enumerate(
+    ['january', 'february', 'march', 'april', 'may', 'june', 'july', 'august',
+     'september', 'october', 'november', 'december'], start=1)}}
+
+
+# Lower-case a country name and drop punctuation and repeated spaces for matching
+def _fold(name):
+    return ' '.join(re.sub(r'[^\w\s]', ' ', name.lower()).split())
+
+
+# Map raw country names onto the names used in urban_rural_mapping.json.
+# Names are tried as they are, case- and punctuation-folded, without a trailing
+# ", ..." qualifier (e.g. "Afghanistan, Islamic Rep. of") and without a
+# parenthetical. Names that still do not match are kept and listed in unmatched.
+class CountryNormalizer:
+
+    def __init__(self, mapping_countries):
+        self.known = set(mapping_countries)
+        self.folded = {_fold(name): name for name in mapping_countries}
+        self.resolved = {}
+        self.unmatched = set()
+
+    def __call__(self, name):
+        if name not in self.resolved:
+            self.resolved[name] = self._match(name)
+        return self.resolved[name]
+
+    def _match(self, name):
+        if name in self.known:
+            return name
+        for candidate in (name, name.split(',')[0], re.sub(r'\(.*?\)', '', name)):
+            match = self.folded.get(_fold(candidate))
+            if match:
+                return match
+        self.unmatched.add(name)
+        return name
+
+
+# Columns of the raw file: the country column, the year columns with their years,
+# and the month column for monthly files
+def _layout(path):
+    header = pd.read_csv(path, nrows=0).columns
+    country = next((column for column in COUNTRY_COLUMNS if column in header), None)
+    if country is None:
+        raise ValueError(f"{path} has no country column (expected one of {COUNTRY_COLUMNS})")
+    years = [(column, int(YEAR_COLUMN.match(column).group(1))) for column in header if YEAR_COLUMN.match(column)]
+    month = next((column for column in MONTH_COLUMNS if column in header), None)
+    element = 'Element' if 'Element' in header else None
+    return country, years, month, element
+
+
+# Append a NumPy array's raw bytes to a column file
+def _append(files, column, values):
+    files[column].write(np.ascontiguousarray(values).tobytes())
+
+
+# Reshape one wide chunk into long-format columns, dropping missing cells
+def _melt_chunk(chunk, country_column, year_columns, year_values, month_column, normalize, codes):
+    if month_column is not None:
+        # Keep the twelve calendar months; seasonal and yearly rows are recomputed by the app
+        if pd.api.types.is_numeric_dtype(chunk[month_column]):
+            months = chunk[month_column].where(chunk[month_column].between(1, 12))
+        else:
+            months = chunk[month_column].astype(str).str.strip().str.lower().map(MONTH_NAMES)
+        keep = months.notna().to_numpy()
+        chunk = chunk[keep]
+        months = months[keep].to_numpy(dtype=np.int8)
+
+    # Normalize each distinct name in the chunk once and number it in first-seen order
+    chunk_codes, names = pd.factorize(chunk[country_column])
+    lookup = np.array([codes.setdefault(normalize(str(name).strip()), len(codes)) for name in names], dtype=np.int32)
+    country_codes = lookup[chunk_codes] if len(chunk) else np.empty(0, dtype=np.int32)
+    values = chunk[year_columns].to_numpy(dtype=np.float64)
+    present = ~np.isnan(values)
+    rows, columns = np.nonzero(present)
+
+    melted = {
+        'country_codes': country_codes[rows],
+        'year': year_values[columns],
+        'temperature': values[present],
+    }
+    if month_column is not None:
+        melted['month'] = months[rows]
+    return melted
+
+
+# Copy a raw column file into a .npy file block by block, remapping country codes on the way
+def _finish_column(raw_path, npy_path, dtype, count, remap=None, block=1 << 20):
+    source = np.memmap(raw_path, dtype=dtype, mode='r', shape=(count,)) if count else np.empty(0, dtype)
+    target_dtype = remap.dtype if remap is not None else dtype
+    target = np.lib.format.open_memmap(npy_path, mode='w+', dtype=target_dtype, shape=(count,))
+    for start in range(0, count, block):
+        values = source[start:start + block]
+        target[start:start + block] = remap[values] if remap is not None else values
+    target.flush()
+    del source, target
+    os.remove(raw_path)
+
+
+# Stream a raw wide-format file (one column per year, optionally one row per month)
+# into the app's binary store in chunks of chunksize rows. Only one wide chunk and
+# its long-format form are in memory at a time.
+def ingest(raw_path, name, mapping_path='urban_rural_mapping.json', chunksize=2000, root=None):
+    country_column, years, month_column, element_column = _layout(raw_path)
+    year_columns = [column for column, _ in years]
+    year_values = np.array([year for _, year in years], dtype=np.int64)
+
+    with open(mapping_path, 'r') as file:
+        normalize = CountryNormalizer(json.load(file))
+
+    root = root or cache_root(name)
+    staging = staging_dir(root, store_name(name))
+    dtypes = {'country_codes': np.int32, 'year': np.int64, 'temperature': np.float64}
+    if month_column is not None:
+        dtypes['month'] = np.int8
+
+    codes = {}
+    rows = 0
+    files = {column: open(os.path.join(staging, column + '.raw'), 'wb') for column in dtypes}
+    try:
+        usecols = [country_column] + year_columns + [column for column in (month_column, element_column) if column]
+        for chunk in pd.read_csv(raw_path, usecols=usecols, chunksize=chunksize, encoding_errors='replace'):
+            if element_column is not None:
+                # FAOSTAT files interleave temperature change and standard deviation rows
+                chunk = chunk[chunk[element_column].astype(str).str.lower() == 'temperature change']
+            melted = _melt_chunk(chunk, country_column, year_columns, year_values, month_column, normalize, codes)
+            for column, values in melted.items():
+                _append(files, column, values.astype(dtypes[column], copy=False))
+            rows += len(melted['year'])
+    finally:
+        for file in files.values():
+            file.close()
+
+    # Renumber countries alphabetically, with the smallest code type pandas would pick
+    countries = sorted(codes)
+    code_dtype = np.int8 if len(countries) < 128 else np.int16 if len(countries) < 32768 else np.int32
+    remap = np.empty(len(codes), dtype=code_dtype)
+    remap[[codes[country] for country in countries]] = np.arange(len(countries))
+
+    for column, dtype in dtypes.items():
+        _finish_column(os.path.join(staging, column + '.raw'), os.path.join(staging, column + '.npy'), dtype, rows,
+                       remap if column == 'country_codes' else None)
+
+    manifest = {
+        'version': STORE_VERSION,
+        'source': os.path.basename(raw_path),
+        'fingerprint': file_digest(raw_path),
+        'rows': rows,
+        'countries': countries,
+        'unmatched_countries': sorted(normalize.unmatched),
+    }
+    return publish_store(root, store_name(name), staging, manifest), manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ingest a raw wide-format temperature change file into the dashboard's binary store.")
+    parser.add_argument('raw', help="raw CSV with one column per year (F1961... or Y1961...)")
+    parser.add_argument('--name', help="dataset the store replaces (default: the annual dataset, or the monthly one for files with a Months column)")
+    parser.add_argument('--mapping', default='urban_rural_mapping.json', help="country mapping used to normalize names")
+    parser.add_argument('--chunksize', type=int, default=2000, help="raw rows read per chunk")
+    args = parser.parse_args()
+
+    monthly = _layout(args.raw)[2] is not None
+    name = args.name or ('monthly_temperature_change.csv' if monthly else 'clean_climate_change_indicators.csv')
+    directory, manifest = ingest(args.raw, name, args.mapping, args.chunksize)
+    print(f"Wrote {manifest['rows']} rows for {len(manifest['countries'])} countries to {directory}")
+    if manifest['unmatched_countries']:
+        print(f"Countries not found in {args.mapping}: {', '.join(manifest['unmatched_countries'])}", file=sys.stderr)
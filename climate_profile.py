@@ -0,0 +1,119 @@
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+# Spans of profiled runs are appended here, one JSON object per line
+PROFILE_FILE = os.environ.get('CLIMATE_PROFILE_FILE', 'climate_profile.jsonl')
+
+# Profiler of the run on each thread, so shared code can open spans without
+# having the profiler passed down to it
+_local = threading.local()
+
+# Sessions run on their own threads; one writer at a time keeps lines whole
+_write_lock = threading.Lock()
+
+
+def _new_id(size):
+    return os.urandom(size).hex()
+
+
+# Nested timing spans for one script run. Spans carry OpenTelemetry's field names
+# (trace_id, span_id, parent_span_id, start/end_time_unix_nano, attributes) so the
+# file can be loaded by tools that read OTLP-style JSON.
+class Profiler:
+
+    def __init__(self, name='run', **attributes):
+        self.trace_id = _new_id(16)
+        self.spans = []
+        self.stack = []
+        self.root = self.start(name, **attributes)
+
+    def start(self, name, **attributes):
+        span = {
+            'trace_id': self.trace_id,
+            'span_id': _new_id(8),
+            'parent_span_id': self.stack[-1]['span_id'] if self.stack else None,
+            'name': name,
+            'depth': len(self.stack),
+            'start_time_unix_nano': time.time_ns(),
+            'attributes': attributes,
+        }
+        span['_start'] = time.perf_counter_ns()
+        self.spans.append(span)
+        self.stack.append(span)
+        return span
+
+    # Close a span, along with any spans opened inside it that were left open
+    def finish(self, span):
+        if not any(open_span is span for open_span in self.stack):
+            return
+        now = time.perf_counter_ns()
+        while self.stack:
+            top = self.stack.pop()
+            top['duration_ns'] = now - top.pop('_start')
+            top['end_time_unix_nano'] = top['start_time_unix_nano'] + top['duration_ns']
+            if top is span:
+                break
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        span = self.start(name, **attributes)
+        try:
+            yield span
+        finally:
+            self.finish(span)
+
+    def close(self):
+        self.finish(self.root)
+
+    # Finished spans as rows for display, names indented by nesting depth
+    def rows(self):
+        return [{'Span': '· ' * span['depth'] + span['name'], 'ms': span['duration_ns'] / 1e6}
+                for span in self.spans if 'duration_ns' in span]
+
+    def export(self, path=PROFILE_FILE):
+        with _write_lock, open(path, 'a') as file:
+            for span in self.spans:
+                if 'duration_ns' in span:
+                    file.write(json.dumps(span, default=str) + '\n')
+
+
+# Make profiler the one spans on this thread are recorded in; None switches profiling off
+def activate(profiler):
+    _local.profiler = profiler
+
+
+def active():
+    return getattr(_local, 'profiler', None)
+
+
+# Timing span in the active profiler, or a no-op when profiling is off
+def span(name, **attributes):
+    profiler = active()
+    return profiler.span(name, **attributes) if profiler else contextlib.nullcontext()
+
+
+# Open and close a span across code that cannot be put in a with block
+def start_span(name, **attributes):
+    profiler = active()
+    return profiler.start(name, **attributes) if profiler else None
+
+
+def finish_span(span):
+    profiler = active()
+    if profiler and span is not None:
+        profiler.finish(span)
+
+
+# Record every call of a function as a span named after it
+def traced(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if active() is None:
+            return function(*args, **kwargs)
+        with span(function.__name__):
+            return function(*args, **kwargs)
+    return wrapper
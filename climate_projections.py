@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from scipy import stats
+
+from climate_core import DataCore
+from climate_store import cache_root, load_dataset, write_atomic
+
+# Bump when a model or the saved layout changes so old fits are refitted
+PROJECTIONS_VERSION = 1
+
+# Models fitted to every country: least-squares lines and parabolas over the years,
+# and damped-trend exponential smoothing (Holt's method with a damped trend)
+MODELS = ['linear', 'quadratic', 'damped']
+
+# Smoothing parameters tried for the damped trend; each country gets the combination
+# with the smallest one-step-ahead squared error. The trend parameter is a fraction
+# of the level parameter, as usual for the error-correction form.
+DAMPED_ALPHAS = [0.1, 0.2, 0.3, 0.5, 0.7, 0.9]
+DAMPED_BETA_FRACTIONS = [0.01, 0.05, 0.1, 0.2, 0.4]
+DAMPED_PHIS = [0.8, 0.85, 0.9, 0.95, 0.98]
+
+# Most (parameter combination x country) cells the damped-trend search holds at once
+DAMPED_BLOCK_CELLS = 1_000_000
+
+
+# NaN-aware least-squares polynomial of the given degree through every row of values,
+# from batched normal equations. Returns the coefficients (rows x degree + 1), the
+# inverse of each row's X'X for the prediction variance, the residual standard
+# error and the number of years used. Rows with too few years are NaN.
+def fit_polynomials(t, values, degree):
+    present = ~np.isnan(values)
+    y = np.where(present, values, 0.0)
+    powers = t ** np.arange(2 * degree + 1)[:, None]
+    sums = present.astype(np.float64) @ powers.T
+    indices = np.arange(degree + 1)
+    xtx = sums[:, indices[:, None] + indices]
+    xty = y @ powers[:degree + 1].T
+    n = present.sum(axis=1)
+
+    parameters = degree + 1
+    valid = n > parameters
+    inverse = np.full(xtx.shape, np.nan)
+    coefficients = np.full(xty.shape, np.nan)
+    inverse[valid] = np.linalg.inv(xtx[valid])
+    coefficients[valid] = np.einsum('nij,nj->ni', inverse[valid], xty[valid])
+    residual = np.maximum((y * y).sum(axis=1) - (coefficients * xty).sum(axis=1), 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma = np.where(valid, np.sqrt(residual / (n - parameters)), np.nan)
+    return coefficients, inverse, sigma, n
+
+
+# Damped-trend exponential smoothing of every row of values in error-correction form:
+#   e = y - (level + phi * trend), level += phi * trend + alpha * e, trend = phi * trend + beta * e
+# Years without data carry the forecast forward. Every parameter combination runs
+# for a block of rows at once, one vectorized step per year. Returns, per row, the
+# chosen alpha, beta and phi, the level and trend after the last year, the
+# one-step error standard deviation and the number of errors it is based on.
+def fit_damped(values):
+    combinations = np.array([(alpha, alpha * fraction, phi) for alpha in DAMPED_ALPHAS
+                             for fraction in DAMPED_BETA_FRACTIONS for phi in DAMPED_PHIS])
+    alpha, beta, phi = (combinations[:, [column]] for column in range(3))
+    rows = len(values)
+    block = max(1, DAMPED_BLOCK_CELLS // len(combinations))
+    fitted = {name: np.full(rows, np.nan) for name in ('alpha', 'beta', 'phi', 'level', 'trend', 'sigma')}
+    fitted['n'] = np.zeros(rows, dtype=np.int64)
+
+    for start in range(0, rows, block):
+        part = values[start:start + block]
+        shape = (len(combinations), len(part))
+        level = np.full(shape, np.nan)
+        trend = np.zeros(shape)
+        squares = np.zeros(shape)
+        errors = np.zeros(len(part), dtype=np.int64)
+        for column in part.T:
+            present = ~np.isnan(column)
+            started = ~np.isnan(level[0])
+            forecast = level + phi * trend
+            error = np.where(present & started, column - forecast, 0.0)
+            squares += error * error
+            errors += present & started
+            level = np.where(started, forecast + alpha * error, np.where(present, column, np.nan))
+            trend = np.where(started, phi * trend + beta * error, 0.0)
+
+        best = np.argmin(np.where(np.isnan(squares), np.inf, squares), axis=0)
+        columns = np.arange(len(part))
+        rows_slice = slice(start, start + len(part))
+        fitted['alpha'][rows_slice] = alpha[best, 0]
+        fitted['beta'][rows_slice] = beta[best, 0]
+        fitted['phi'][rows_slice] = phi[best, 0]
+        fitted['level'][rows_slice] = level[best, columns]
+        fitted['trend'][rows_slice] = trend[best, columns]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fitted['sigma'][rows_slice] = np.where(errors > 2, np.sqrt(squares[best, columns] / errors), np.nan)
+        fitted['n'][rows_slice] = errors
+
+    # Rows with too few years to fit keep no parameters
+    missing = fitted['n'] <= 2
+    for name in ('alpha', 'beta', 'phi', 'level', 'trend'):
+        fitted[name][missing] = np.nan
+    return fitted
+
+
+# Parameters of every model for every country, fitted in one batch over the country
+# x year matrix. Projections for any horizon are computed from them on request.
+class ProjectionModels:
+
+    def __init__(self, countries, years, parameters, fingerprint=None):
+        self.countries = np.asarray(countries, dtype=object)
+        self.years = np.asarray(years, dtype=np.int64)
+        self.parameters = parameters
+        self.fingerprint = fingerprint
+        self.country_index = {country: row for row, country in enumerate(self.countries)}
+
+        # Years are centred on the middle of the data and counted in decades, which
+        # keeps the normal equations of the parabola well conditioned
+        self.origin = float(self.years.mean()) if len(self.years) else 0.0
+        self.scale = 10.0
+
+    @classmethod
+    def fit(cls, core):
+        models = cls(core.countries, core.years, {}, core.fingerprint)
+        t = (models.years - models.origin) / models.scale
+        for name, degree in (('linear', 1), ('quadratic', 2)):
+            coefficients, inverse, sigma, n = fit_polynomials(t, np.asarray(core.values), degree)
+            models.parameters.update({
+                f'{name}_coefficients': coefficients, f'{name}_inverse': inverse,
+                f'{name}_sigma': sigma, f'{name}_n': n,
+            })
+        models.parameters.update({f'damped_{name}': value for name, value in fit_damped(np.asarray(core.values)).items()})
+        return models
+
+    # Projected values with their prediction interval for the given countries and
+    # the horizon years after the last year, each a countries x horizon array,
+    # along with the projected years
+    def project(self, model, countries, horizon, confidence=0.95):
+        rows = np.array([self.country_index[country] for country in countries], dtype=np.int64)
+        years = self.years[-1] + np.arange(1, horizon + 1)
+        p = self.parameters
+
+        if model == 'damped':
+            steps = np.arange(1, horizon + 1)
+            phi = p['damped_phi'][rows, None]
+            # Sum of phi^1..phi^h, the damped number of trend steps after h years
+            damping = np.cumsum(phi ** steps, axis=1)
+            mean = p['damped_level'][rows, None] + damping * p['damped_trend'][rows, None]
+            # Variance after h steps: sigma^2 (1 + sum over j < h of (alpha + beta * damping_j)^2)
+            weights = (p['damped_alpha'][rows, None] + p['damped_beta'][rows, None] * damping[:, :-1]) ** 2
+            variance = p['damped_sigma'][rows, None] ** 2 * (1 + np.hstack([np.zeros((len(rows), 1)), np.cumsum(weights, axis=1)]))
+            quantile = stats.norm.ppf((1 + confidence) / 2)
+        else:
+            degree = 1 if model == 'linear' else 2
+            t = (years - self.origin) / self.scale
+            x = t[:, None] ** np.arange(degree + 1)
+            mean = p[f'{model}_coefficients'][rows] @ x.T
+            leverage = np.einsum('hi,nij,hj->nh', x, p[f'{model}_inverse'][rows], x)
+            variance = p[f'{model}_sigma'][rows, None] ** 2 * (1 + leverage)
+            quantile = stats.t.ppf((1 + confidence) / 2, p[f'{model}_n'][rows, None] - degree - 1)
+
+        spread = quantile * np.sqrt(variance)
+        return years, mean, mean - spread, mean + spread
+
+    def save(self, path):
+        meta = {'fingerprint': self.fingerprint}
+        write_atomic(path, lambda file: np.savez(file, countries=self.countries.astype(str), years=self.years,
+                                                 meta=json.dumps(meta), **self.parameters))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as saved:
+            parameters = {name: saved[name] for name in saved.files if name not in ('countries', 'years', 'meta')}
+            meta = json.loads(str(saved['meta']))
+            return cls(saved['countries'].astype(object), saved['years'], parameters, meta['fingerprint'])
+
+
+# Saved fits for a dataset, keyed by its fingerprint
+def models_path(csv_path, fingerprint):
+    key = json.dumps([PROJECTIONS_VERSION, fingerprint, DAMPED_ALPHAS, DAMPED_BETA_FRACTIONS, DAMPED_PHIS])
+    return os.path.join(cache_root(csv_path), 'projections', hashlib.sha256(key.encode()).hexdigest() + '.npz')
+
+
+# The saved fits for core if there are any, otherwise fitted now and saved. A new
+# fingerprint, e.g. after a year is appended, is the only thing that causes a refit.
+def load_or_fit(csv_path, core):
+    path = models_path(csv_path, core.fingerprint) if core.fingerprint is not None else None
+    if path is not None and os.path.exists(path):
+        return ProjectionModels.load(path)
+    models = ProjectionModels.fit(core)
+    if path is not None:
+        models.save(path)
+    return models
+
+
+if __name__ == '__main__':
+    # Fit the models during deploy:  python climate_projections.py [csv]
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else 'clean_climate_change_indicators.csv'
+    start = time.perf_counter()
+    core = DataCore.from_frame(load_dataset(csv_path))
+    load_or_fit(csv_path, core)
+    print(f"Fitted {len(MODELS)} models to {len(core.countries)} countries in {time.perf_counter() - start:.1f}s: "
+          f"{models_path(csv_path, core.fingerprint)}")
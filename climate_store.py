@@ -0,0 +1,249 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Bump when the on-disk layout changes so old caches are rebuilt
+STORE_VERSION = 1
+
+# Binary caches live next to the source CSV unless overridden
+CACHE_DIR = os.environ.get('CLIMATE_CACHE_DIR', '.climate_cache')
+
+
+# Content hash of the source file, read in blocks so large files stay cheap on memory
+def file_digest(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_root(csv_path):
+    return os.path.join(os.path.dirname(os.path.abspath(csv_path)), CACHE_DIR)
+
+
+def _read_manifest(directory):
+    try:
+        with open(os.path.join(directory, 'manifest.json'), 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+# Fingerprint of the source CSV. The stored manifest is reused while the file's
+# size and mtime are unchanged, so the content hash is only taken after an edit.
+def fingerprint(csv_path):
+    stat = os.stat(csv_path)
+    current = os.path.join(cache_root(csv_path), store_name(csv_path))
+    manifest = _read_manifest(current)
+    if (manifest and manifest.get('version') == STORE_VERSION
+            and manifest.get('size') == stat.st_size and manifest.get('mtime_ns') == stat.st_mtime_ns):
+        return manifest['fingerprint']
+    return file_digest(csv_path)
+
+
+def store_name(csv_path):
+    return os.path.splitext(os.path.basename(csv_path))[0]
+
+
+# Month numbers for the month names used by monthly sources
+MONTHS = {name: number for number, name in enumerate(
+    ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'], start=1)}
+
+
+# Month column as numbers 1-12, accepting numbers or month names such as 'Jan' or 'January'
+def month_numbers(months):
+    if pd.api.types.is_numeric_dtype(months):
+        return months.to_numpy(dtype=np.int8)
+    names = pd.Categorical(months)
+    lookup = np.array([MONTHS[str(name)[:3].lower()] for name in names.categories], dtype=np.int8)
+    return lookup[np.asarray(names.codes)]
+
+
+# Convert the long-format CSV into one .npy file per column plus a manifest.
+# Monthly sources carry an extra Month column, stored as month numbers.
+def build_store(csv_path):
+    stat = os.stat(csv_path)
+    data = pd.read_csv(csv_path)
+    countries = pd.Categorical(data['Country'])
+
+    columns = {
+        'country_codes': np.asarray(countries.codes),
+        'year': data['Year'].to_numpy(dtype=np.int64),
+        'temperature': data['Temperature Change'].to_numpy(dtype=np.float64),
+    }
+    if 'Month' in data.columns:
+        columns['month'] = month_numbers(data['Month'])
+    manifest = {
+        'version': STORE_VERSION,
+        'source': os.path.basename(csv_path),
+        'fingerprint': file_digest(csv_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'rows': len(data),
+        'countries': [str(country) for country in countries.categories],
+    }
+    return write_store(cache_root(csv_path), store_name(csv_path), columns, manifest)
+
+
+# Write the columns into a fresh directory and swap it in atomically, so readers
+# never see a half-written store
+def write_store(root, name, columns, manifest):
+    staging = staging_dir(root, name)
+    for column, values in columns.items():
+        np.save(os.path.join(staging, column + '.npy'), values)
+    return publish_store(root, name, staging, manifest)
+
+
+# Write a file by calling write(file) on a unique temporary file in the same directory
+# and renaming it into place, so readers never see half a file and processes writing
+# the same path at once do not write into each other's temporary file
+def write_atomic(path, write, mode='wb'):
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    handle, staging = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(handle, mode) as file:
+            write(file)
+        os.chmod(staging, 0o644)
+        os.replace(staging, path)
+    except BaseException:
+        os.remove(staging)
+        raise
+
+
+# Empty directory next to the store that columns can be written into
+def staging_dir(root, name):
+    os.makedirs(root, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=name + '.', dir=root)
+    os.chmod(staging, 0o755)
+    return staging
+
+
+# Add the manifest to a staging directory and swap it in as the named store
+def publish_store(root, name, staging, manifest):
+    with open(os.path.join(staging, 'manifest.json'), 'w') as file:
+        json.dump(manifest, file)
+
+    target = os.path.join(root, name)
+    if os.path.isdir(target):
+        retired = tempfile.mkdtemp(prefix=name + '.old.', dir=root)
+        os.rmdir(retired)
+        os.replace(target, retired)
+        os.replace(staging, target)
+        shutil.rmtree(retired, ignore_errors=True)
+    else:
+        os.replace(staging, target)
+    return target
+
+
+# Memory-map a store directory as a long-format DataFrame without copying the columns
+def open_store(directory):
+    manifest = _read_manifest(directory)
+    codes = np.load(os.path.join(directory, 'country_codes.npy'), mmap_mode='r')
+    countries = pd.Categorical.from_codes(
+        codes, dtype=pd.CategoricalDtype(manifest['countries']), validate=False)
+    columns = {
+        'Country': countries,
+        'Year': np.load(os.path.join(directory, 'year.npy'), mmap_mode='r'),
+        'Temperature Change': np.load(os.path.join(directory, 'temperature.npy'), mmap_mode='r'),
+    }
+    if os.path.exists(os.path.join(directory, 'month.npy')):
+        columns['Month'] = np.load(os.path.join(directory, 'month.npy'), mmap_mode='r')
+    data = pd.DataFrame(columns, copy=False)
+    data.attrs['fingerprint'] = manifest['fingerprint']
+    # Set when the store was extended by append_rows(): the fingerprint and row
+    # count it had before, so a cached core can fold in only the new rows
+    data.attrs['parent'] = manifest.get('parent')
+    data.attrs['base_rows'] = manifest.get('base_rows')
+    return data
+
+
+# Modification time of a dataset's source: the CSV if there is one, otherwise the
+# store written by the ingest command
+def source_mtime(csv_path):
+    if os.path.exists(csv_path):
+        return os.stat(csv_path).st_mtime_ns
+    manifest = os.path.join(cache_root(csv_path), store_name(csv_path), 'manifest.json')
+    return os.stat(manifest).st_mtime_ns if os.path.exists(manifest) else None
+
+
+# Open the binary form of a CSV, rebuilding it first if the CSV has changed.
+# Without the CSV, a store written by the ingest command is opened as it is.
+def load_dataset(csv_path):
+    directory = os.path.join(cache_root(csv_path), store_name(csv_path))
+    manifest = _read_manifest(directory)
+    if not os.path.exists(csv_path):
+        if not manifest or manifest.get('version') != STORE_VERSION:
+            raise FileNotFoundError(f"{csv_path} not found and no ingested store at {directory}")
+        return open_store(directory)
+    if not manifest or manifest.get('version') != STORE_VERSION or manifest['fingerprint'] != fingerprint(csv_path):
+        directory = build_store(csv_path)
+    else:
+        _touch_manifest(directory, manifest, os.stat(csv_path))
+    return open_store(directory)
+
+
+# Record the current size and mtime after a content match, so a touched but
+# unchanged CSV is not re-hashed by every new process
+def _touch_manifest(directory, manifest, stat):
+    if manifest.get('size') == stat.st_size and manifest.get('mtime_ns') == stat.st_mtime_ns:
+        return
+    manifest.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+    write_atomic(os.path.join(directory, 'manifest.json'), lambda file: json.dump(manifest, file), 'w')
+
+
+# Append the rows of a long-format CSV (typically one new year) to a dataset. The
+# store is extended in place of a rebuild, and the source CSV, if there is one, gets
+# the same rows so the two stay in step.
+def append_rows(csv_path, rows_path):
+    current = load_dataset(csv_path)
+    directory = os.path.join(cache_root(csv_path), store_name(csv_path))
+    manifest = _read_manifest(directory)
+    rows = pd.read_csv(rows_path)
+    if len(current) and rows['Year'].min() <= current['Year'].max():
+        raise ValueError(f"{rows_path} has years up to {current['Year'].max()}, which are already in {csv_path}")
+
+    # New countries join the sorted category list; existing codes are renumbered to match
+    countries = sorted(set(manifest['countries']) | set(rows['Country'].astype(str)))
+    new_codes = np.asarray(pd.Categorical(rows['Country'].astype(str), categories=countries).codes)
+    renumber = pd.Index(countries).get_indexer(manifest['countries']).astype(new_codes.dtype)
+
+    columns = {
+        'country_codes': np.concatenate([renumber[np.asarray(current['Country'].cat.codes)], new_codes]),
+        'year': np.concatenate([current['Year'].to_numpy(), rows['Year'].to_numpy(dtype=np.int64)]),
+        'temperature': np.concatenate([current['Temperature Change'].to_numpy(), rows['Temperature Change'].to_numpy(dtype=np.float64)]),
+    }
+    if 'Month' in current.columns:
+        columns['month'] = np.concatenate([current['Month'].to_numpy(), month_numbers(rows['Month'])])
+
+    appended = dict(manifest, parent=manifest['fingerprint'], base_rows=len(current),
+                    rows=len(current) + len(rows), countries=countries)
+    if os.path.exists(csv_path):
+        header = pd.read_csv(csv_path, nrows=0).columns
+        with open(csv_path, 'rb+') as file:
+            # Terminate a last line that has no newline before adding rows after it
+            file.seek(-1, os.SEEK_END)
+            if file.read(1) != b'\n':
+                file.write(b'\n')
+        rows[list(header)].to_csv(csv_path, mode='a', header=False, index=False)
+        stat = os.stat(csv_path)
+        appended.update(fingerprint=file_digest(csv_path), size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+    else:
+        appended['fingerprint'] = hashlib.sha256((manifest['fingerprint'] + file_digest(rows_path)).encode()).hexdigest()
+    return write_store(cache_root(csv_path), store_name(csv_path), columns, appended)
+
+
+if __name__ == '__main__':
+    # Prebuild the binary store during deploy:  python climate_store.py [csv]
+    # Append a new year of rows to a dataset:   python climate_store.py append rows.csv [csv]
+    if len(sys.argv) > 1 and sys.argv[1] == 'append':
+        print(append_rows(sys.argv[3] if len(sys.argv) > 3 else 'clean_climate_change_indicators.csv', sys.argv[2]))
+    else:
+        print(build_store(sys.argv[1] if len(sys.argv) > 1 else 'clean_climate_change_indicators.csv'))
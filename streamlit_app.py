@@ -3,60 +3,288 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
-import json
-from scipy.stats import linregress
+import logging
+import os
+import sys
 import matplotlib.pyplot as plt
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from climate_bootstrap import load_intervals, precompute_in_subprocess
+from climate_core import (COUNTRY_METRICS, MAX_BREAKS, MIN_SEGMENT_YEARS, OUTLIER_BASELINES, OUTLIER_METHODS, ROLLING_WINDOW, SEASONS,
+                          Artifacts, ChangePoints, CorrelationMatrix, CountryMapping, GroupEngine, MonthlyCore,
+                          OutlierScreen, Rankings, WarmUp, fit_trends, load_core, sources_fingerprint)
+from climate_figures import FigureCache, optimize_figure
+from climate_projections import load_or_fit
+from climate_profile import Profiler, activate, active, finish_span, span, start_span, traced
+from climate_store import load_dataset, source_mtime
+
+logger = logging.getLogger(__name__)
+
+# Opt-in profiling of each rerun, switched on with CLIMATE_PROFILE=1 or ?profile=1.
+# The spans are shown in a sidebar panel and appended to climate_profile.jsonl.
+PROFILING = os.environ.get('CLIMATE_PROFILE', '0') not in ('', '0') or st.query_params.get('profile', '0') != '0'
+activate(Profiler('rerun') if PROFILING else None)
 
 # Title of the dashboard
 st.title("Climate Change Indicators Dashboard")
 
-# Load data
-@st.cache_data
-def load_data():
-    return pd.read_csv('clean_climate_change_indicators.csv')
+DATA_FILE = 'clean_climate_change_indicators.csv'
+MAPPING_FILE = 'urban_rural_mapping.json'
+
+# Optional monthly temperature changes (Country, Year, Month, Temperature Change) for the seasonal analysis
+MONTHLY_FILE = 'monthly_temperature_change.csv'
+
+# Country the comparison pages focus on by default; set it to host the dashboard for another country
+DEFAULT_FOCUS_COUNTRY = os.environ.get('CLIMATE_FOCUS_COUNTRY', 'Jordan')
+
+# Neighboring countries compared on the Country-Specific Analysis page
+NEIGHBORING_COUNTRIES = {
+    'Jordan': ['Saudi Arabia', 'Iraq', 'Palestine', 'Syria', 'Lebanon', 'Egypt'],
+}
+
+# Named country groups compared on the G7 Analysis page, alongside any custom group
+COUNTRY_GROUPS = {
+    'G7': ['Canada', 'France', 'Germany', 'Italy', 'Japan', 'United Kingdom', 'United States'],
+    'MENA': ['Algeria', 'Bahrain', 'Egypt', 'Iran', 'Iraq', 'Jordan', 'Kuwait', 'Lebanon', 'Libya', 'Morocco',
+             'Oman', 'Palestine', 'Qatar', 'Saudi Arabia', 'Syria', 'Tunisia', 'United Arab Emirates', 'Yemen'],
+    'BRICS': ['Brazil', 'Russia', 'India', 'China', 'South Africa'],
+}
+
+# Country mapping compiled once into categorical code arrays
+@traced
+def build_mapping(artifacts):
+    artifacts.source('mapping')
+    return CountryMapping.from_file(MAPPING_FILE)
+
+# Country x year data core, updated in place of a rebuild when years were appended
+@traced
+def build_core(artifacts):
+    return load_core(artifacts, DATA_FILE)
+
+# Country x year x month cube with seasonal means, or None when there is no monthly file
+@traced
+def build_monthly(artifacts):
+    if artifacts.source('monthly') is None:
+        return None
+    return MonthlyCore.from_frame(load_dataset(MONTHLY_FILE))
+
+# Average temperature change for each year across all countries, precomputed by the data core
+@traced
+def build_average_temperature_change(artifacts):
+    return artifacts.get('core').yearly_mean()
+
+# Trend statistics of every country, fitted in one batch over the country x year matrix
+@traced
+def build_trends(artifacts):
+    return artifacts.get('core').trend_table()
+
+# Group x year statistics of the mapping's dimensions and of named country groups,
+# computed from the data core and kept per grouping
+@traced
+def build_groups(artifacts):
+    groups = GroupEngine(artifacts.get('core'), artifacts.get('mapping'))
+    if groups.unmapped_countries:
+        logger.warning("Countries missing from %s: %s", MAPPING_FILE, ', '.join(groups.unmapped_countries))
+    return groups
+
+# Top and bottom N countries and years, from the core's metric vectors
+@traced
+def build_rankings(artifacts):
+    return Rankings(artifacts.get('core'), artifacts.get('groups'))
+
+# Correlation between the yearly series of every pair of countries, for the similar-countries lookup
+@traced
+def build_correlations(artifacts):
+    return CorrelationMatrix.from_core(artifacts.get('core'))
+
+# Outlier scores of every country in every year, against its own previous years and against all countries that year
+@traced
+def build_outliers(artifacts):
+    return OutlierScreen.from_core(artifacts.get('core'))
+
+# Bootstrap confidence intervals of every country's warming rate, mean and correlation
+# with the global mean, as a future. Intervals saved with the store are loaded at once;
+# otherwise they are computed by climate_bootstrap.py in a child process, waited on
+# from the background thread, and saved, so no request waits for the resampling.
+@traced
+def build_bootstrap(artifacts):
+    core = artifacts.get('core')
+    intervals = load_intervals(DATA_FILE, core)
+    if intervals is None:
+        return load_background('bootstrap').submit(precompute_in_subprocess, DATA_FILE, core)
+    future = Future()
+    future.set_result(intervals)
+    return future
+
+# Mean-level breaks of every country's series, as a future: the segmentation runs
+# on its own background thread so no request waits for it, nor for the bootstrap
+@traced
+def build_change_points(artifacts):
+    return load_background('change-points').submit(ChangePoints.from_core, artifacts.get('core'))
+
+# Linear, quadratic and damped-trend fits of every country, saved with the store per
+# dataset fingerprint so they are only refitted when the data changes
+@traced
+def build_projections(artifacts):
+    return load_or_fit(DATA_FILE, artifacts.get('core'))
+
+# Content fingerprint of the data, mapping and monthly sources, part of every cached figure's key
+@traced
+def build_fingerprint(artifacts):
+    return sources_fingerprint(artifacts, DATA_FILE, MAPPING_FILE, MONTHLY_FILE)
+
+# Datasets shared by the pages and sessions, each computed the first time a page asks for it
+@st.cache_resource
+def load_artifacts():
+    return Artifacts({
+        'mapping': build_mapping,
+        'core': build_core,
+        'monthly': build_monthly,
+        'average_temperature_change': build_average_temperature_change,
+        'trends': build_trends,
+        'groups': build_groups,
+        'rankings': build_rankings,
+        'correlations': build_correlations,
+        'outliers': build_outliers,
+        'bootstrap': build_bootstrap,
+        'projections': build_projections,
+        'change_points': build_change_points,
+        'fingerprint': build_fingerprint,
+    })
 
-data = load_data()
+# Datasets built in the background after the first page a process serves, most
+# widely used first, so later page views do not pay for them.
+# CLIMATE_WARM_UP_THREADS=0 switches the warm-up off.
+WARM_UP = ['core', 'average_temperature_change', 'trends', 'rankings', 'correlations', 'groups', 'outliers', 'bootstrap',
+           'projections', 'change_points', 'monthly', 'fingerprint']
+WARM_UP_THREADS = int(os.environ.get('CLIMATE_WARM_UP_THREADS', 2))
+
+@st.cache_resource
+def load_warm_up():
+    return WarmUp(load_artifacts(), WARM_UP, WARM_UP_THREADS)
+
+# Thread for work that is started by a request but must not hold it up, one per kind
+# of work, so a quick job such as the segmentation never queues behind the bootstrap
+@st.cache_resource
+def load_background(kind):
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'climate-{kind}')
+
+# Serialized figures shared by the pages and sessions. CLIMATE_PRERENDERED_DIR points at
+# the figures/ directory written by climate_export.py, whose figures are then served
+# from disk instead of being computed.
+@st.cache_resource
+def load_figure_cache():
+    return FigureCache(directory=os.environ.get('CLIMATE_PRERENDERED_DIR'),
+                       write=os.environ.get('CLIMATE_PRERENDER_WRITE') == '1')
+
+# Source modification times, checked on every rerun; an edited CSV, ingested store or
+# mapping drops only the datasets built from it, and they are rebuilt on next use
+with span('prelude'):
+    artifacts = load_artifacts()
+    figure_cache = load_figure_cache()
+    artifacts.update_sources(
+        data=source_mtime(DATA_FILE),
+        mapping=os.stat(MAPPING_FILE).st_mtime_ns,
+        monthly=source_mtime(MONTHLY_FILE),
+    )
+    warm_up = load_warm_up() if WARM_UP_THREADS > 0 else None
+    # Queue the warm-up before the page renders, so a cold process starts on the shared
+    # datasets at once; the page joins any build it needs that is already running.
+    # Later reruns requeue whatever a source change has dropped.
+    if warm_up is not None:
+        warm_up.schedule()
+
+# Pages in the sidebar and the datasets their text, tables and controls need; text-only
+# pages need none. Datasets only a figure needs are fetched with figure_dataset() inside
+# the figure's build function, so a cached or prerendered figure never builds them.
+PAGES = {
+    "Introduction": [],
+    "Data Sources and Methodology": [],
+    "Overview of Global Trends": [],
+    "Global Trends": ['rankings'],
+    "Top 10 Coldest and Hottest Years": ['rankings', 'core'],
+    "Temperature Change Before and After 2000": ['core'],
+    "Temperature Change Comparison": ['core'],
+    "Trend Analysis": ['trends', 'core', 'bootstrap'],
+    "Warming-Rate Ranking": ['trends', 'core', 'bootstrap'],
+    "Regional Analysis": ['groups'],
+    "Country-Specific Analysis": ['core', 'monthly', 'correlations', 'rankings'],
+    "Urban vs. Rural Trends": ['groups'],
+    "G7 Analysis": ['core', 'groups'],
+    "Statistical Analysis": ['average_temperature_change', 'core', 'outliers', 'bootstrap'],
+    "Projections": ['core', 'projections', 'correlations'],
+    "Change-Point Analysis": ['core', 'groups', 'change_points'],
+    "Conclusions": [],
+}
+
+# The datasets a page declared, in declaration order
+def page_datasets(page):
+    datasets = []
+    for name in PAGES[page]:
+        with span(f'dataset {name}', cached=artifacts.ready(name)):
+            datasets.append(artifacts.get(name))
+    return datasets
+
+# A dataset needed only to draw a figure, built when the figure is not cached
+def figure_dataset(name):
+    with span(f'dataset {name}', cached=artifacts.ready(name)):
+        return artifacts.get(name)
+
+# Show the figure made by build(). Figures are cached as JSON per page, figure id,
+# dataset fingerprint and the parameters the figure depends on, so on a hit neither
+# build() nor plotly's figure construction and validation run. Large figures are
+# switched to WebGL and long lines decimated before they are cached.
+def plotly_chart(figure_id, build, *params):
+    with span('plotly_chart', figure=figure_id) as chart_span:
+        key = (options, figure_id, artifacts.get('fingerprint'), params)
+        figure, cached = figure_cache.figure(key, lambda: optimize_figure(build()))
+        if chart_span is not None:
+            chart_span['attributes']['cached'] = cached
+        st.plotly_chart(figure)
+
+# The result of a background computation if it is ready, else None after telling the
+# reader it is on the way; what names the result, e.g. "Confidence intervals", and
+# name is the artifact holding the future. A failed computation is logged and its
+# artifact dropped, so the next rerun starts it again.
+def ready_result(future, what, name):
+    # Pages exported by climate_export.py or timed by benchmark.py wait for it, so the
+    # page is complete
+    if os.environ.get('CLIMATE_PRERENDER_WRITE') == '1' or os.environ.get('CLIMATE_WAIT_FOR_BACKGROUND') == '1':
+        wait([future])
+    if not future.done():
+        st.caption(f"{what} are being computed in the background and will appear when the page is reloaded.")
+        return None
+    if future.exception() is not None:
+        logger.error("%s failed", what, exc_info=future.exception())
+        artifacts.discard(name, future)
+        st.caption(f"{what} could not be computed; they will be computed again when the page is reloaded.")
+        return None
+    return future.result()
+
+# Focus country for the comparison pages, chosen in the sidebar and kept in the
+# ?country= query parameter so a link opens on the same country
+def select_focus_country(core):
+    countries = core.countries.tolist()
+    requested = st.query_params.get('country', DEFAULT_FOCUS_COUNTRY)
+    index = core.country_index.get(requested, core.country_index.get(DEFAULT_FOCUS_COUNTRY, 0))
+    focus = st.sidebar.selectbox("Focus country:", countries, index=index)
+    st.query_params['country'] = focus
+    return focus
+
+# Tell the reader which countries the mapping does not cover on pages that use it
+def report_unmapped_countries(unmapped):
+    if unmapped:
+        st.warning(f"{len(unmapped)} countries are not in {MAPPING_FILE} and are shown as 'Unknown' or left out: {', '.join(unmapped)}")
 
 # Sidebar for navigation
 st.sidebar.title("Navigation")
-options = st.sidebar.radio("Select a page:", [
-    "Introduction", 
-    "Data Sources and Methodology", 
-    "Overview of Global Trends",
-    "Global Trends",
-    "Top 10 Coldest and Hottest Years",
-    "Temperature Change Before and After 2000",
-    "Temperature Change Comparison",
-    "Trend Analysis",
-    "Regional Analysis",
-    "Country-Specific Analysis",
-    "Urban vs. Rural Trends",
-    "G7 Analysis",
-    "Statistical Analysis",
-    "Conclusions"
-])
-
-# Ensure the 'Urban_Rural' column is added to the DataFrame
-with open('urban_rural_mapping.json', 'r') as file:
-    urban_rural_mapping = json.load(file)
-country_to_continent = {country: info['region'] for country, info in urban_rural_mapping.items()}
-
-# Map 'Urban_Rural' values to the DataFrame
-data['Urban_Rural'] = data['Country'].map(lambda x: urban_rural_mapping.get(x, {}).get('urban_rural', 'Unknown'))
-
-# Calculate the average temperature change for each year across all countries
-average_temperature_change = data.groupby('Year')['Temperature Change'].mean()
-
-# Filter the data for Jordan
-jordan_data = data[data['Country'].str.contains('Jordan', case=False)]
-
-# Extract Jordan's temperature change values
-jordan_temperature_change = jordan_data.groupby('Year')['Temperature Change'].mean()
-
-# Calculate the average temperature change for all other countries
-other_countries_data = data[~data['Country'].str.contains('Jordan', case=False)]
-average_temperature_change_other_countries = other_countries_data.groupby('Year')['Temperature Change'].mean()
+options = st.sidebar.radio("Select a page:", list(PAGES))
 
+# Progress of the background warm-up; pages work meanwhile, computing what they need themselves
+if warm_up is not None and not warm_up.ready():
+    finished, total = warm_up.progress()
+    st.sidebar.progress(finished / total, text=f"Preparing datasets in the background: {finished} of {total}")
+
+page_span = start_span('page', page=options)
 
 if options == "Introduction":
     st.header("Introduction")
@@ -103,608 +331,683 @@ elif options == "Overview of Global Trends":
     """)
 
 elif options == "Temperature Change Before and After 2000":
-    st.header("Temperature Change Before and After 2000")
+    [core] = page_datasets(options)
+    focus = select_focus_country(core)
 
-    # Extract the years of interest
-    years_before_2000 = list(range(1961, 2001))
-    years_after_2000 = list(range(2001, 2021))
+    # Year that closes the "before" period; the "after" period starts the year after
+    first_year, last_year = int(core.years[0]), int(core.years[-1])
+    split_year = st.slider("Split year:", first_year, last_year - 1, min(max(2000, first_year), last_year - 1))
+    before_label, after_label = f'Before {split_year}', f'After {split_year}'
+    st.header(f"Temperature Change Before and After {split_year}")
 
-    # Calculate the average temperature change for each country before and after 2000
-    average_temp_change_before_2000 = data[data['Year'].isin(years_before_2000)].groupby('Country')['Temperature Change'].mean()
-    average_temp_change_after_2000 = data[data['Year'].isin(years_after_2000)].groupby('Country')['Temperature Change'].mean()
+    # Average temperature change for each country in both periods, from the prefix-sum index
+    average_temp_change_before = core.range_mean(first_year, split_year)
+    average_temp_change_after = core.range_mean(split_year + 1, last_year)
 
-    # Combine the results into a single DataFrame
+    # Combine the results into a single DataFrame; both Series share the core's country order
     temp_changes = pd.DataFrame({
-        'Country': average_temp_change_before_2000.index,
-        'Average_Temperature_Change_Before_2000': average_temp_change_before_2000.values,
-        'Average_Temperature_Change_After_2000': average_temp_change_after_2000.values
-    })
-
-    # Calculate the global average temperature change before and after 2000
-    global_avg_temp_change_before_2000 = average_temp_change_before_2000.mean()
-    global_avg_temp_change_after_2000 = average_temp_change_after_2000.mean()
-
-    # Create a DataFrame for global average temperature changes
-    global_avg_temp_changes = pd.DataFrame({
-        'Period': ['Before 2000', 'After 2000'],
-        'Average_Temperature_Change': [global_avg_temp_change_before_2000, global_avg_temp_change_after_2000]
+        'Country': core.countries,
+        'Average_Temperature_Change_Before': average_temp_change_before.values,
+        'Average_Temperature_Change_After': average_temp_change_after.values
     })
 
-    # Plot the global average temperature changes before and after 2000
-    fig = go.Figure(data=[go.Bar(x=global_avg_temp_changes['Period'], y=global_avg_temp_changes['Average_Temperature_Change'])])
-    fig.update_layout(
-        title='Global Average Temperature Change Before and After 2000',
-        xaxis_title='Period',
-        yaxis_title='Average Temperature Change (°C)',
-        template='plotly_white'
-    )
-    st.plotly_chart(fig)
-
-    # Plot the average temperature changes for each country before and after 2000
-    fig_country = go.Figure()
-
-    # Plot all countries except Jordan
-    fig_country.add_trace(go.Scatter(
-        x=temp_changes[temp_changes['Country'] != 'Jordan']['Country'],
-        y=temp_changes[temp_changes['Country'] != 'Jordan']['Average_Temperature_Change_Before_2000'],
-        mode='markers',
-        name='Before 2000'
-    ))
-
-    fig_country.add_trace(go.Scatter(
-        x=temp_changes[temp_changes['Country'] != 'Jordan']['Country'],
-        y=temp_changes[temp_changes['Country'] != 'Jordan']['Average_Temperature_Change_After_2000'],
-        mode='markers',
-        marker=dict(color='red'),
-        name='After 2000'
-    ))
-
-    # Highlight Jordan with a star marker
-    fig_country.add_trace(go.Scatter(
-        x=['Jordan'],
-        y=temp_changes[temp_changes['Country'] == 'Jordan']['Average_Temperature_Change_Before_2000'],
-        mode='markers',
-        marker=dict(symbol='star', size=12, color='blue'),
-        name='Jordan Before 2000'
-    ))
-
-    fig_country.add_trace(go.Scatter(
-        x=['Jordan'],
-        y=temp_changes[temp_changes['Country'] == 'Jordan']['Average_Temperature_Change_After_2000'],
-        mode='markers',
-        marker=dict(symbol='star', size=12, color='red'),
-        name='Jordan After 2000'
-    ))
-
-    fig_country.update_layout(
-        title='Country-wise Average Temperature Change Before and After 2000',
-        xaxis_title='Country',
-        yaxis_title='Average Temperature Change (°C)',
-        template='plotly_white',
-        showlegend=True
-    )
-    st.plotly_chart(fig_country)
-
-    st.write("**Temperature Changes in Jordan Before and After 2000**")
-    # Filter data for Jordan
-    jordan_data = data[data['Country'] == 'Jordan']
+    # Plot the global average temperature changes before and after the split year
+    def plot_global_before_after():
+        # Create a DataFrame for global average temperature changes
+        global_avg_temp_changes = pd.DataFrame({
+            'Period': [before_label, after_label],
+            'Average_Temperature_Change': [average_temp_change_before.mean(), average_temp_change_after.mean()]
+        })
+
+        fig = go.Figure(data=[go.Bar(x=global_avg_temp_changes['Period'], y=global_avg_temp_changes['Average_Temperature_Change'])])
+        fig.update_layout(
+            title=f'Global Average Temperature Change Before and After {split_year}',
+            xaxis_title='Period',
+            yaxis_title='Average Temperature Change (°C)',
+            template='plotly_white'
+        )
+        return fig
+    plotly_chart('global_before_after', plot_global_before_after, split_year)
+
+    # Row of the focus country in both periods
+    focus_changes = temp_changes.iloc[[core.country_index[focus]]]
+
+    # Plot the average temperature changes for each country before and after the split year
+    def plot_countries_before_after():
+        fig_country = go.Figure()
+        others = temp_changes[temp_changes['Country'] != focus]
+
+        # Plot all countries except the focus country
+        fig_country.add_trace(go.Scatter(
+            x=others['Country'],
+            y=others['Average_Temperature_Change_Before'],
+            mode='markers',
+            name=before_label
+        ))
+
+        fig_country.add_trace(go.Scatter(
+            x=others['Country'],
+            y=others['Average_Temperature_Change_After'],
+            mode='markers',
+            marker=dict(color='red'),
+            name=after_label
+        ))
+
+        # Highlight the focus country with a star marker
+        fig_country.add_trace(go.Scatter(
+            x=[focus],
+            y=focus_changes['Average_Temperature_Change_Before'],
+            mode='markers',
+            marker=dict(symbol='star', size=12, color='blue'),
+            name=f'{focus} {before_label}'
+        ))
+
+        fig_country.add_trace(go.Scatter(
+            x=[focus],
+            y=focus_changes['Average_Temperature_Change_After'],
+            mode='markers',
+            marker=dict(symbol='star', size=12, color='red'),
+            name=f'{focus} {after_label}'
+        ))
+
+        fig_country.update_layout(
+            title=f'Country-wise Average Temperature Change Before and After {split_year}',
+            xaxis_title='Country',
+            yaxis_title='Average Temperature Change (°C)',
+            template='plotly_white',
+            showlegend=True
+        )
+        return fig_country
+    plotly_chart('countries_before_after', plot_countries_before_after, split_year, focus)
 
-    # Calculate the average temperature change for Jordan before and after 2000
-    average_temp_change_before_2000 = jordan_data[jordan_data['Year'] <= 2000]['Temperature Change'].mean()
-    average_temp_change_after_2000 = jordan_data[jordan_data['Year'] > 2000]['Temperature Change'].mean()
+    st.write(f"**Temperature Changes in {focus} Before and After {split_year}**")
+    # Yearly series of the focus country, split at the split year
+    focus_temperature_change = core.country_series(focus)
+    focus_before = focus_temperature_change[focus_temperature_change.index <= split_year]
+    focus_after = focus_temperature_change[focus_temperature_change.index > split_year]
 
     # Create a DataFrame for easier plotting
-    jordan_temp_changes = pd.DataFrame({
-        'Period': ['Before 2000', 'After 2000'],
-        'Average_Temperature_Change': [average_temp_change_before_2000, average_temp_change_after_2000]
+    focus_temp_changes = pd.DataFrame({
+        'Period': [before_label, after_label],
+        'Average_Temperature_Change': focus_changes[['Average_Temperature_Change_Before', 'Average_Temperature_Change_After']].to_numpy()[0]
     })
 
-    # Create a scatter plot DataFrame
-    jordan_scatter_data_before_2000 = jordan_data[jordan_data['Year'] <= 2000].copy()
-    jordan_scatter_data_before_2000['Period'] = 'Before 2000'
-
-    jordan_scatter_data_after_2000 = jordan_data[jordan_data['Year'] > 2000].copy()
-    jordan_scatter_data_after_2000['Period'] = 'After 2000'
-
-    jordan_scatter_data = pd.concat([jordan_scatter_data_before_2000, jordan_scatter_data_after_2000])
-
     # Plot the bar plot for average temperature changes
-    fig_bar = go.Figure(data=[go.Bar(x=jordan_temp_changes['Period'], y=jordan_temp_changes['Average_Temperature_Change'])])
-    fig_bar.update_layout(
-        title='Average Temperature Change in Jordan Before and After 2000',
-        xaxis_title='Period',
-        yaxis_title='Average Temperature Change (°C)',
-        template='plotly_white'
-    )
-    st.plotly_chart(fig_bar)
+    def plot_focus_before_after():
+        fig_bar = go.Figure(data=[go.Bar(x=focus_temp_changes['Period'], y=focus_temp_changes['Average_Temperature_Change'])])
+        fig_bar.update_layout(
+            title=f'Average Temperature Change in {focus} Before and After {split_year}',
+            xaxis_title='Period',
+            yaxis_title='Average Temperature Change (°C)',
+            template='plotly_white'
+        )
+        return fig_bar
+    plotly_chart('focus_before_after', plot_focus_before_after, split_year, focus)
 
     # Plot the scatter plot for annual temperature changes
-    fig_scatter = go.Figure()
-
-    fig_scatter.add_trace(go.Scatter(
-        x=jordan_scatter_data_before_2000['Year'],
-        y=jordan_scatter_data_before_2000['Temperature Change'],
-        mode='markers+lines',
-        name='Before 2000'
-    ))
-
-    fig_scatter.add_trace(go.Scatter(
-        x=jordan_scatter_data_after_2000['Year'],
-        y=jordan_scatter_data_after_2000['Temperature Change'],
-        mode='markers+lines',
-        marker=dict(color='red'),
-        name='After 2000'
-    ))
-
-    fig_scatter.update_layout(
-        title='Annual Temperature Changes in Jordan Before and After 2000',
-        xaxis_title='Year',
-        yaxis_title='Temperature Change (°C)',
-        template='plotly_white',
-        showlegend=True
-    )
-    st.plotly_chart(fig_scatter)
+    def plot_focus_annual_before_after():
+        fig_scatter = go.Figure()
+
+        fig_scatter.add_trace(go.Scatter(
+            x=focus_before.index,
+            y=focus_before.values,
+            mode='markers+lines',
+            name=before_label
+        ))
+
+        fig_scatter.add_trace(go.Scatter(
+            x=focus_after.index,
+            y=focus_after.values,
+            mode='markers+lines',
+            marker=dict(color='red'),
+            name=after_label
+        ))
+
+        fig_scatter.update_layout(
+            title=f'Annual Temperature Changes in {focus} Before and After {split_year}',
+            xaxis_title='Year',
+            yaxis_title='Temperature Change (°C)',
+            template='plotly_white',
+            showlegend=True
+        )
+        return fig_scatter
+    plotly_chart('focus_annual_before_after', plot_focus_annual_before_after, split_year, focus)
 
 elif options == "Global Trends":
     st.header("Global Trends")
+    [rankings] = page_datasets(options)
 
     # Plot global temperature change trends
-    average_temp_change_per_year = data.groupby('Year')['Temperature Change'].mean().reset_index()
-    fig = px.line(average_temp_change_per_year, x='Year', y='Temperature Change', title='Global Temperature Change (1961-2020)')
-
-    # Add markers to the plot
-    fig.update_traces(mode='lines+markers')
-
-    st.plotly_chart(fig)
+    def plot_global_trend():
+        average_temp_change_per_year = figure_dataset('average_temperature_change').reset_index()
+        fig = px.line(average_temp_change_per_year, x='Year', y='Temperature Change', title='Global Temperature Change (1961-2020)')
 
-    # Extract the years of interest
-    years = list(range(1961, 2021))
-
-    # Aggregate the data to ensure unique Country-Year pairs and calculate mean temperature change for each country
-    aggregated_data = data.groupby('Country')['Temperature Change'].mean().reset_index()
-    aggregated_data.columns = ['Country', 'Average_Temperature_Change']
-
-    # Identify the top 10 countries with the highest average temperature change
-    top_10_countries = aggregated_data.sort_values(by='Average_Temperature_Change', ascending=False).head(10)
+        # Add markers to the plot
+        fig.update_traces(mode='lines+markers')
+        return fig
+    plotly_chart('global_trend', plot_global_trend)
 
     # Plot top 10 countries
-    fig_top_10 = go.Figure(data=[go.Bar(x=top_10_countries['Country'], y=top_10_countries['Average_Temperature_Change'])])
-    fig_top_10.update_layout(
-        title='Top 10 Countries with Highest Average Temperature Change',
-        xaxis_title='Country',
-        yaxis_title='Average Temperature Change (°C)',
-        template='plotly_white'
-    )
-    st.plotly_chart(fig_top_10)
+    def plot_top_10_countries():
+        # Identify the top 10 countries with the highest average temperature change
+        top_10_countries = rankings.countries('mean', 10)
+
+        fig_top_10 = go.Figure(data=[go.Bar(x=top_10_countries['Country'], y=top_10_countries['mean'])])
+        fig_top_10.update_layout(
+            title='Top 10 Countries with Highest Average Temperature Change',
+            xaxis_title='Country',
+            yaxis_title='Average Temperature Change (°C)',
+            template='plotly_white'
+        )
+        return fig_top_10
+    plotly_chart('top_10_countries', plot_top_10_countries)
+
+    # Rank countries by any metric, optionally within a region or urban/rural class
+    st.subheader("Country Rankings")
+    metric_labels = {'mean': "Average temperature change (°C)", 'slope': "Warming rate (°C per year)", 'change': "Change after the split year (°C)"}
+    ranking_columns = st.columns(3)
+    metric = ranking_columns[0].selectbox("Rank by:", COUNTRY_METRICS, format_func=metric_labels.get)
+    largest = ranking_columns[1].radio("Order:", ["Highest", "Lowest"], horizontal=True) == "Highest"
+    ranking_size = ranking_columns[2].slider("Number of countries:", 3, 50, 10)
+    region_options, urban_rural_options = rankings.groups.dimensions['Region'][0], rankings.groups.dimensions['Urban_Rural'][0]
+    filter_columns = st.columns(3)
+    region = filter_columns[0].selectbox("Region:", [None] + region_options, format_func=lambda option: option or "All regions")
+    urban_rural = filter_columns[1].selectbox("Urban or rural:", [None] + urban_rural_options, format_func=lambda option: option or "All countries")
+    first_year, last_year = int(rankings.core.years[0]), int(rankings.core.years[-1])
+    split_year = filter_columns[2].number_input("Split year:", first_year, last_year - 1, min(max(2000, first_year), last_year - 1),
+                                                disabled=metric != 'change')
+    country_ranking = rankings.countries(metric, ranking_size, largest, region, urban_rural, int(split_year))
+
+    def plot_country_ranking():
+        fig = go.Figure(data=[go.Bar(x=country_ranking['Country'], y=country_ranking[metric])])
+        fig.update_layout(
+            title=f"{'Highest' if largest else 'Lowest'} {len(country_ranking)} Countries by {metric_labels[metric]}"
+                  + (f" in {region}" if region else '') + (f" ({urban_rural})" if urban_rural else ''),
+            xaxis_title='Country',
+            yaxis_title=metric_labels[metric],
+            template='plotly_white'
+        )
+        return fig
+    plotly_chart('country_ranking', plot_country_ranking, metric, largest, ranking_size, region, urban_rural, int(split_year) if metric == 'change' else None)
+    st.dataframe(country_ranking.rename(columns={metric: metric_labels[metric]}), hide_index=True)
 
 elif options == "Top 10 Coldest and Hottest Years":
-    st.header("Top 10 Coldest and Hottest Years Globally with Jordan Comparison (1961-2020)")
-
-    # Extract the years of interest
-    years = list(range(1961, 2021))
-
-    # Calculate the average temperature change for each year across all countries
-    average_temp_change_per_year = data.groupby('Year')['Temperature Change'].mean()
+    rankings, core = page_datasets(options)
+    focus = select_focus_country(core)
+    year_count = st.slider("Number of years:", 3, 20, 10)
+    st.header(f"Top {year_count} Coldest and Hottest Years Globally with {focus} Comparison (1961-2020)")
 
-    # Convert to a DataFrame for easier manipulation
-    average_temp_change_per_year_df = average_temp_change_per_year.reset_index()
-    average_temp_change_per_year_df.columns = ['Year', 'Average_Temperature_Change']
+    # Identify the coldest and hottest years by global average temperature change
+    coldest_years = rankings.years('mean', year_count, largest=False).rename(columns={'mean': 'Average_Temperature_Change'})
+    hottest_years = rankings.years('mean', year_count, largest=True).rename(columns={'mean': 'Average_Temperature_Change'})
 
-    # Identify the top 10 coldest and hottest years
-    coldest_years = average_temp_change_per_year_df.sort_values(by='Average_Temperature_Change', ascending=True).head(10)
-    hottest_years = average_temp_change_per_year_df.sort_values(by='Average_Temperature_Change', ascending=False).head(10)
-
-    # Filter data for Jordan
-    jordan_data = data[data['Country'] == 'Jordan']
+    # Yearly series of the focus country
+    focus_temperature_change = core.country_series(focus)
 
     # Plot the coldest years
-    fig_coldest = go.Figure()
-
-    fig_coldest.add_trace(go.Bar(
-        x=coldest_years['Year'], 
-        y=coldest_years['Average_Temperature_Change'], 
-        name='Coldest Years',
-        marker_color='blue'
-    ))
-
-    fig_coldest.update_layout(
-        title='Top 10 Coldest Years Globally (1961-2020)',
-        xaxis_title='Year',
-        yaxis_title='Average Temperature Change (°C)',
-        template='plotly_white',
-        width=800, 
-        height=400,
-        barmode='group'
-    )
-    st.plotly_chart(fig_coldest)
+    def plot_coldest_years():
+        fig_coldest = go.Figure()
+
+        fig_coldest.add_trace(go.Bar(
+            x=coldest_years['Year'], 
+            y=coldest_years['Average_Temperature_Change'], 
+            name='Coldest Years',
+            marker_color='blue'
+        ))
+
+        fig_coldest.update_layout(
+            title=f'Top {year_count} Coldest Years Globally (1961-2020)',
+            xaxis_title='Year',
+            yaxis_title='Average Temperature Change (°C)',
+            template='plotly_white',
+            width=800, 
+            height=400,
+            barmode='group'
+        )
+        return fig_coldest
+    plotly_chart('coldest_years', plot_coldest_years, year_count)
 
     # Plot the hottest years
-    fig_hottest = go.Figure()
-
-    fig_hottest.add_trace(go.Bar(
-        x=hottest_years['Year'], 
-        y=hottest_years['Average_Temperature_Change'], 
-        name='Hottest Years',
-        marker_color='red'
-    ))
-
-    fig_hottest.update_layout(
-        title='Top 10 Hottest Years Globally (1961-2020)',
-        xaxis_title='Year',
-        yaxis_title='Average Temperature Change (°C)',
-        template='plotly_white',
-        width=800, 
-        height=400,
-        barmode='group'
-    )
-    st.plotly_chart(fig_hottest)
-
-    # Extract temperature changes for Jordan in the coldest and hottest years
-    jordan_coldest_years = jordan_data[jordan_data['Year'].isin(coldest_years['Year'])]
-    jordan_hottest_years = jordan_data[jordan_data['Year'].isin(hottest_years['Year'])]
-
-    # Plot the comparison for Jordan in the coldest years
-    fig_jordan_coldest = go.Figure()
-
-    fig_jordan_coldest.add_trace(go.Scatter(
-        x=jordan_coldest_years['Year'],
-        y=jordan_coldest_years['Temperature Change'],
-        mode='lines+markers',
-        name='Jordan in Coldest Years',
-        marker_color='blue'
-    ))
-
-    fig_jordan_coldest.update_layout(
-        title='Jordan Temperature Change in the Coldest Years Globally (1961-2020)',
-        xaxis_title='Year',
-        yaxis_title='Temperature Change (°C)',
-        template='plotly_white',
-        width=800,
-        height=400
-    )
-    st.plotly_chart(fig_jordan_coldest)
-
-    # Plot the comparison for Jordan in the hottest years
-    fig_jordan_hottest = go.Figure()
-
-    fig_jordan_hottest.add_trace(go.Scatter(
-        x=jordan_hottest_years['Year'],
-        y=jordan_hottest_years['Temperature Change'],
-        mode='lines+markers',
-        name='Jordan in Hottest Years',
-        marker_color='red'
-    ))
-
-    fig_jordan_hottest.update_layout(
-        title='Jordan Temperature Change in the Hottest Years Globally (1961-2020)',
-        xaxis_title='Year',
-        yaxis_title='Temperature Change (°C)',
-        template='plotly_white',
-        width=800,
-        height=400
-    )
-    st.plotly_chart(fig_jordan_hottest)
+    def plot_hottest_years():
+        fig_hottest = go.Figure()
+
+        fig_hottest.add_trace(go.Bar(
+            x=hottest_years['Year'], 
+            y=hottest_years['Average_Temperature_Change'], 
+            name='Hottest Years',
+            marker_color='red'
+        ))
+
+        fig_hottest.update_layout(
+            title=f'Top {year_count} Hottest Years Globally (1961-2020)',
+            xaxis_title='Year',
+            yaxis_title='Average Temperature Change (°C)',
+            template='plotly_white',
+            width=800, 
+            height=400,
+            barmode='group'
+        )
+        return fig_hottest
+    plotly_chart('hottest_years', plot_hottest_years, year_count)
+
+    # Extract temperature changes for the focus country in the coldest and hottest years
+    focus_coldest_years = focus_temperature_change[focus_temperature_change.index.isin(coldest_years['Year'])]
+    focus_hottest_years = focus_temperature_change[focus_temperature_change.index.isin(hottest_years['Year'])]
+
+    # Plot the comparison for the focus country in the coldest years
+    def plot_focus_coldest_years():
+        fig_focus_coldest = go.Figure()
+
+        fig_focus_coldest.add_trace(go.Scatter(
+            x=focus_coldest_years.index,
+            y=focus_coldest_years.values,
+            mode='lines+markers',
+            name=f'{focus} in Coldest Years',
+            marker_color='blue'
+        ))
+
+        fig_focus_coldest.update_layout(
+            title=f'{focus} Temperature Change in the Coldest Years Globally (1961-2020)',
+            xaxis_title='Year',
+            yaxis_title='Temperature Change (°C)',
+            template='plotly_white',
+            width=800,
+            height=400
+        )
+        return fig_focus_coldest
+    plotly_chart('focus_coldest_years', plot_focus_coldest_years, focus, year_count)
+
+    # Plot the comparison for the focus country in the hottest years
+    def plot_focus_hottest_years():
+        fig_focus_hottest = go.Figure()
+
+        fig_focus_hottest.add_trace(go.Scatter(
+            x=focus_hottest_years.index,
+            y=focus_hottest_years.values,
+            mode='lines+markers',
+            name=f'{focus} in Hottest Years',
+            marker_color='red'
+        ))
+
+        fig_focus_hottest.update_layout(
+            title=f'{focus} Temperature Change in the Hottest Years Globally (1961-2020)',
+            xaxis_title='Year',
+            yaxis_title='Temperature Change (°C)',
+            template='plotly_white',
+            width=800,
+            height=400
+        )
+        return fig_focus_hottest
+    plotly_chart('focus_hottest_years', plot_focus_hottest_years, focus, year_count)
 
 elif options == "Temperature Change Comparison":
-    st.header("Temperature Change Comparison: Jordan vs. Average of Other Countries")
-    
-    # Calculate the average temperature change for each year across all countries
-    average_temperature_change = data.groupby('Year')['Temperature Change'].mean()
+    [core] = page_datasets(options)
+    focus = select_focus_country(core)
+    st.header(f"Temperature Change Comparison: {focus} vs. Average of Other Countries")
 
-    # Filter the data for Jordan
-    jordan_data = data[data['Country'].str.contains('Jordan', case=False)]
-
-    # Extract Jordan's temperature change values
-    jordan_temperature_change = jordan_data.groupby('Year')['Temperature Change'].mean()
+    # Yearly series of the focus country
+    focus_temperature_change = core.country_series(focus)
 
     # Create a plotly figure
-    fig = go.Figure()
+    def plot_comparison():
+        fig = go.Figure()
 
-    # Add Jordan's temperature change line
-    fig.add_trace(go.Scatter(x=jordan_temperature_change.index, y=jordan_temperature_change.values, mode='lines+markers', name='Jordan'))
+        # Add the focus country's temperature change line
+        fig.add_trace(go.Scatter(x=focus_temperature_change.index, y=focus_temperature_change.values, mode='lines+markers', name=focus))
 
-    # Add global average temperature change line
-    fig.add_trace(go.Scatter(x=average_temperature_change.index, y=average_temperature_change.values, mode='lines+markers', name='Average of Other Countries'))
+        # Add the mean of all other countries, the column totals minus the focus country's row
+        average_temperature_change_other_countries = core.others_mean(focus).dropna()
+        fig.add_trace(go.Scatter(x=average_temperature_change_other_countries.index, y=average_temperature_change_other_countries.values,
+                                 mode='lines+markers', name='Average of Other Countries'))
 
-    # Update layout
-    fig.update_layout(
-        title='Temperature Change Comparison: Jordan vs. Average of Other Countries',
-        xaxis_title='Year',
-        yaxis_title='Temperature Change (°C)',
-        legend_title='Country',
-        template='plotly_white'
-    )
-    st.plotly_chart(fig)
+        # Update layout
+        fig.update_layout(
+            title=f'Temperature Change Comparison: {focus} vs. Average of Other Countries',
+            xaxis_title='Year',
+            yaxis_title='Temperature Change (°C)',
+            legend_title='Country',
+            template='plotly_white'
+        )
+        return fig
+    plotly_chart('comparison', plot_comparison, focus)
 
 elif options == "Trend Analysis":
-    st.header("Trend Analysis and Linear Regression of Temperature Changes: Jordan vs. Global Average")
-
-    # Calculate the average temperature change for each year across all countries
-    average_temperature_change = data.groupby('Year')['Temperature Change'].mean()
+    trends, core, bootstrap = page_datasets(options)
+    focus = select_focus_country(core)
+    st.header(f"Trend Analysis and Linear Regression of Temperature Changes: {focus} vs. Global Average")
 
-    # Filter the data for Jordan
-    jordan_data = data[data['Country'].str.contains('Jordan', case=False)]
+    # Yearly series of the focus country and the mean of all other countries
+    focus_temperature_change = core.country_series(focus)
+    average_temperature_change_other_countries = core.others_mean(focus).dropna()
 
-    # Extract Jordan's temperature change values
-    jordan_temperature_change = jordan_data.groupby('Year')['Temperature Change'].mean()
-
-    # Calculate the average temperature change for all other countries
-    other_countries_data = data[~data['Country'].str.contains('Jordan', case=False)]
-    average_temperature_change_other_countries = other_countries_data.groupby('Year')['Temperature Change'].mean()
-
-    # Calculate trend lines using linear regression
-    years_numeric = jordan_temperature_change.index.to_list()
-    slope_jordan, intercept_jordan, _, _, _ = linregress(years_numeric, jordan_temperature_change)
-    slope_global, intercept_global, _, _, _ = linregress(years_numeric, average_temperature_change_other_countries)
+    # Trend of the focus country from the batched fit, and of the other countries' mean
+    focus_trend = trends.iloc[core.country_index[focus]]
+    global_trend = fit_trends(average_temperature_change_other_countries.index, average_temperature_change_other_countries.values)
 
     # Calculate trend lines
-    trend_jordan = [slope_jordan * year + intercept_jordan for year in years_numeric]
-    trend_global = [slope_global * year + intercept_global for year in years_numeric]
+    years_numeric = focus_temperature_change.index.to_numpy()
+    trend_focus = focus_trend['Slope'] * years_numeric + focus_trend['Intercept']
+    trend_global = global_trend['slope'][0] * years_numeric + global_trend['intercept'][0]
 
     # Create a plotly figure
-    fig = go.Figure()
+    def plot_trend_lines():
+        fig = go.Figure()
 
-    # Add Jordan's average temperature change line
-    fig.add_trace(go.Scatter(x=jordan_temperature_change.index, y=jordan_temperature_change.values, mode='lines+markers', name='Jordan'))
+        # Add the focus country's average temperature change line
+        fig.add_trace(go.Scatter(x=focus_temperature_change.index, y=focus_temperature_change.values, mode='lines+markers', name=focus))
 
-    # Add global average temperature change line for other countries
-    fig.add_trace(go.Scatter(x=average_temperature_change_other_countries.index, y=average_temperature_change_other_countries.values, mode='lines+markers', name='Average of Other Countries'))
+        # Add global average temperature change line for other countries
+        fig.add_trace(go.Scatter(x=average_temperature_change_other_countries.index, y=average_temperature_change_other_countries.values, mode='lines+markers', name='Average of Other Countries'))
 
-    # Add trend lines
-    fig.add_trace(go.Scatter(x=years_numeric, y=trend_jordan, mode='lines', name='Jordan Trend Line', line=dict(dash='dash')))
-    fig.add_trace(go.Scatter(x=years_numeric, y=trend_global, mode='lines', name='Global Trend Line', line=dict(dash='dash')))
+        # Add trend lines
+        fig.add_trace(go.Scatter(x=years_numeric, y=trend_focus, mode='lines', name=f'{focus} Trend Line', line=dict(dash='dash')))
+        fig.add_trace(go.Scatter(x=years_numeric, y=trend_global, mode='lines', name='Global Trend Line', line=dict(dash='dash')))
 
-    # Update layout
-    fig.update_layout(
-        title='Temperature Change Comparison: Jordan vs. Average of Other Countries',
-        xaxis_title='Year',
-        yaxis_title='Temperature Change (°C)',
-        legend_title='Country',
-        template='plotly_white'
-    )
-    st.plotly_chart(fig)
+        # Update layout
+        fig.update_layout(
+            title=f'Temperature Change Comparison: {focus} vs. Average of Other Countries',
+            xaxis_title='Year',
+            yaxis_title='Temperature Change (°C)',
+            legend_title='Country',
+            template='plotly_white'
+        )
+        return fig
+    plotly_chart('trend_lines', plot_trend_lines, focus)
+
+    # Warming rate of the focus country with its bootstrap confidence interval
+    intervals = ready_result(bootstrap, "Confidence intervals", 'bootstrap')
+    if intervals is not None:
+        slope_low, slope_high = intervals.interval(focus, 'slope')
+        st.write(f"**{focus} warms by {focus_trend['Slope'] * 10:.3f} °C per decade "
+                 f"({intervals.confidence:.0%} confidence interval {slope_low * 10:.3f} to {slope_high * 10:.3f}, "
+                 f"{intervals.resamples} block-bootstrap resamples)**")
+
+elif options == "Warming-Rate Ranking":
+    st.header("Warming-Rate Ranking")
+    trends, core, bootstrap = page_datasets(options)
+    focus = select_focus_country(core)
+
+    # Rank every country by its linear warming rate, fastest first
+    order = np.argsort(-trends['Slope'].to_numpy(), kind='stable')
+    ranking = trends.iloc[order].reset_index(drop=True)
+    ranking.insert(0, 'Rank', np.arange(1, len(ranking) + 1))
+    ranking.insert(3, 'Slope_Per_Decade', ranking['Slope'] * 10)
+
+    # Bootstrap confidence interval of each rate per decade, once computed
+    intervals = ready_result(bootstrap, "Confidence intervals", 'bootstrap')
+    if intervals is not None:
+        ranking.insert(4, 'Per_Decade_Low', intervals.lower['slope'][order] * 10)
+        ranking.insert(5, 'Per_Decade_High', intervals.upper['slope'][order] * 10)
+    st.write("Linear warming rate of every country (°C per year and per decade). Click a column header to sort.")
+    st.dataframe(ranking, hide_index=True)
+
+    # Overlay the trend line of any country on its yearly series
+    country = st.selectbox("Show the trend of:", core.countries.tolist(), index=core.country_index[focus])
+    country_trend = trends.iloc[core.country_index[country]]
+    country_temps = core.country_series(country)
+    years_numeric = country_temps.index.to_numpy()
+
+    def plot_country_trend():
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(x=years_numeric, y=country_temps.values, mode='lines+markers', name=country))
+        fig.add_trace(go.Scatter(x=years_numeric, y=country_trend['Slope'] * years_numeric + country_trend['Intercept'], mode='lines', name=f'{country} Trend Line', line=dict(dash='dash')))
+        fig.update_layout(
+            title=f"Temperature Change and Trend for {country}: {country_trend['Slope'] * 10:.2f} °C per decade (p = {country_trend['P_Value']:.3g})",
+            xaxis_title='Year',
+            yaxis_title='Temperature Change (°C)',
+            template='plotly_white'
+        )
+        return fig
+    plotly_chart('country_trend', plot_country_trend, country)
 
 elif options == "Regional Analysis":
     st.header("Regional Analysis")
+    [groups] = page_datasets(options)
+    report_unmapped_countries(groups.unmapped_countries)
     
     # Plot temperature change by continent
-    data['Continent'] = data['Country'].map(lambda x: country_to_continent.get(x, 'Unknown'))
-    continent_avg_temp = data.groupby(['Continent', 'Year'])['Temperature Change'].mean().reset_index()
-    fig = px.line(continent_avg_temp, x='Year', y='Temperature Change', color='Continent', title='Average Temperature Change by Continent (1961-2020)')
-    st.plotly_chart(fig)
-
-    # Load the urban_rural_region_mapping JSON file
-    with open('urban_rural_mapping.json', 'r') as file:
-        mapping = json.load(file)
-
-    # Extract the region mapping
-    region_mapping = {country: details['region'] for country, details in mapping.items()}
-
-    # Add the 'Region' column to data
-    data['Region'] = data['Country'].map(region_mapping)
-
-    # Filter out rows with missing regions
-    data = data.dropna(subset=['Region'])
-
-    # Calculate average temperature change by region
-    average_temp_change_by_region = data.groupby('Region')['Temperature Change'].mean()
-
-    # Plot average temperature change by region
-    fig = go.Figure(data=[go.Bar(x=average_temp_change_by_region.index, y=average_temp_change_by_region.values)])
-    fig.update_layout(
-        title='Average Temperature Change by Region',
-        xaxis_title='Region',
-        yaxis_title='Average Temperature Change (°C)',
-        template='plotly_white'
-    )
-    st.plotly_chart(fig)
+    def plot_continent_trends():
+        with span('continent_mean'):
+            continent_avg_temp = groups.stats('Continent').frame('Continent')
+        fig = px.line(continent_avg_temp, x='Year', y='Temperature Change', color='Continent', title='Average Temperature Change by Continent (1961-2020)')
+        return fig
+    plotly_chart('continent_trends', plot_continent_trends)
+
+    # Calculate average temperature change by region; countries without a region are left out
+    def plot_region_means():
+        with span('region_mean'):
+            average_temp_change_by_region = groups.stats('Region').overall('Region')
+
+        # Plot average temperature change by region
+        fig = go.Figure(data=[go.Bar(x=average_temp_change_by_region.index, y=average_temp_change_by_region.values)])
+        fig.update_layout(
+            title='Average Temperature Change by Region',
+            xaxis_title='Region',
+            yaxis_title='Average Temperature Change (°C)',
+            template='plotly_white'
+        )
+        return fig
+    plotly_chart('region_means', plot_region_means)
 
 elif options == "Country-Specific Analysis":
     st.header("Country-Specific Analysis")
-
-    # Filter data for Jordan
-    jordan_data = data[data['Country'] == 'Jordan']
-
-    # Extract the years of interest
-    years = list(range(1961, 2021))
-
-    # Pivot the data to have years as rows and temperature change as columns
-    jordan_temps = jordan_data.pivot(index='Year', columns='Country', values='Temperature Change')['Jordan']
-
-    # Plot temperature change over time for Jordan
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(x=years, y=jordan_temps.loc[years], mode='lines+markers', name='Jordan'))
-    fig.update_layout(
-        title='Temperature Change Over Time for Jordan',
-        xaxis_title='Year',
-        yaxis_title='Temperature Change (°C)',
-        template='plotly_white'
-    )
-    st.plotly_chart(fig)
-
-    # Extract the months of interest for seasons
-    winter_months = ['Dec', 'Jan', 'Feb']
-    spring_months = ['Mar', 'Apr', 'May']
-    summer_months = ['Jun', 'Jul', 'Aug']
-    fall_months = ['Sep', 'Oct', 'Nov']
-
-    # Filter data for Jordan
-    jordan_data = data[data['Country'] == 'Jordan']
-
-    # Create dummy monthly data for the example (Replace with actual monthly data)
-    months = [f'{year}-{month:02d}' for year in range(1961, 2020 + 1) for month in range(1, 13)]
-    jordan_data = pd.DataFrame({'Country': ['Jordan'] * len(months), 'Month': months, 'Temperature Change': np.random.randn(len(months))})
-
-    # Convert Month column to datetime
-    jordan_data['Month'] = pd.to_datetime(jordan_data['Month'])
-
-    # Define seasons
-    seasons = {'Winter': winter_months, 'Spring': spring_months, 'Summer': summer_months, 'Fall': fall_months}
-
-    # Calculate seasonal averages
-    seasonal_averages = []
-    for season, months in seasons.items():
-        season_data = jordan_data[jordan_data['Month'].dt.strftime('%b').isin(months)]
-        season_data['Year'] = season_data['Month'].dt.year
-        season_avg = season_data.groupby('Year')['Temperature Change'].mean().reset_index()
-        season_avg['Season'] = season
-        seasonal_averages.append(season_avg)
-
-    # Combine all seasonal averages into one DataFrame
-    seasonal_averages_df = pd.concat(seasonal_averages)
-
-    # Plot the seasonal temperature changes
-    fig_season = go.Figure()
-
-    for season in seasons.keys():
-        season_data = seasonal_averages_df[seasonal_averages_df['Season'] == season]
-        fig_season.add_trace(go.Scatter(x=season_data['Year'], y=season_data['Temperature Change'], mode='lines+markers', name=season))
-
-    fig_season.update_layout(
-        title='Seasonal Temperature Changes in Jordan (1961-2020)',
-        xaxis_title='Year',
-        yaxis_title='Temperature Change (°C)',
-        template='plotly_white',
-        showlegend=True,
-        width=800,
-        height=400
-    )
-    st.plotly_chart(fig_season)
-
-    # Calculate the average temperature change for each year across all countries
-    years = list(range(2013, 2023))
-
-    # Calculate the average temperature change for each country
-    average_temp_change = data.groupby('Country')['Temperature Change'].mean().reset_index()
+    core, monthly, correlations, rankings = page_datasets(options)
+    focus = select_focus_country(core)
+
+    # Yearly series of the focus country
+    focus_temps = core.country_series(focus)
+
+    # Plot temperature change over time for the focus country
+    def plot_focus_series():
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(x=focus_temps.index, y=focus_temps.values, mode='lines+markers', name=focus))
+        fig.update_layout(
+            title=f'Temperature Change Over Time for {focus}',
+            xaxis_title='Year',
+            yaxis_title='Temperature Change (°C)',
+            template='plotly_white'
+        )
+        return fig
+    plotly_chart('focus_series', plot_focus_series, focus)
+
+    # Seasonal temperature changes from the monthly data (December counts towards the next winter)
+    if monthly is None:
+        st.info(f"Seasonal temperature changes need monthly data. Add {MONTHLY_FILE} with Country, Year, Month and Temperature Change columns to enable them.")
+    elif focus not in monthly.country_index:
+        st.info(f"The monthly data has no entries for {focus}.")
+    else:
+        seasonal_averages = monthly.seasonal_frame(focus)
+
+        # Plot the seasonal temperature changes
+        def plot_seasons():
+            fig_season = go.Figure()
+
+            for season in SEASONS:
+                fig_season.add_trace(go.Scatter(x=seasonal_averages.index, y=seasonal_averages[season], mode='lines+markers', name=season))
+
+            fig_season.update_layout(
+                title=f'Seasonal Temperature Changes in {focus} ({monthly.years[0]}-{monthly.years[-1]})',
+                xaxis_title='Year',
+                yaxis_title='Temperature Change (°C)',
+                template='plotly_white',
+                showlegend=True,
+                width=800,
+                height=400
+            )
+            return fig_season
+        plotly_chart('seasons', plot_seasons, focus)
 
     # Identify the top 3 countries with the highest average temperature changes
-    top_3_max_countries = average_temp_change.nlargest(3, 'Temperature Change')
+    top_3_max_countries = rankings.countries('mean', 3, largest=True)
 
     # Identify the 3 countries with the lowest average temperature changes
-    bottom_3_min_countries = average_temp_change.nsmallest(3, 'Temperature Change')
-
-    # Include Jordan for comparison
-    jordan_data = average_temp_change[average_temp_change['Country'].str.contains('Jordan', case=False)]
-
-    # Combine the selected countries for the max comparison
-    max_comparison_data = pd.concat([top_3_max_countries, jordan_data])
-
-    # Combine the selected countries for the min comparison
-    min_comparison_data = pd.concat([bottom_3_min_countries, jordan_data])
+    bottom_3_min_countries = rankings.countries('mean', 3, largest=False)
 
-    # Filter the data to include only the selected countries
-    max_comparison_temps = data[data['Country'].isin(max_comparison_data['Country'])]
-    min_comparison_temps = data[data['Country'].isin(min_comparison_data['Country'])]
-
-    # Pivot the data to have countries as rows and years as columns for plotting
-    max_comparison_pivot = max_comparison_temps.pivot(index='Country', columns='Year', values='Temperature Change')
-    min_comparison_pivot = min_comparison_temps.pivot(index='Country', columns='Year', values='Temperature Change')
+    # Combine the selected countries with the focus country for the max and min comparisons
+    max_comparison_countries = top_3_max_countries['Country'].tolist() + [focus]
+    min_comparison_countries = bottom_3_min_countries['Country'].tolist() + [focus]
 
     # Create a plotly figure for the max comparison
-    fig_max = go.Figure()
-
-    # Plot the temperature changes for Jordan and the top 3 max countries
-    for country in max_comparison_pivot.index:
-        fig_max.add_trace(go.Scatter(x=max_comparison_pivot.columns, y=max_comparison_pivot.loc[country], mode='lines+markers', name=country))
-
-    # Update layout for the max comparison figure
-    fig_max.update_layout(
-        title='Temperature Change Comparison: Jordan vs. Top 3 Max Countries',
-        xaxis_title='Year',
-        yaxis_title='Temperature Change (°C)',
-        legend_title='Country',
-        template='plotly_white'
-    )
-    st.plotly_chart(fig_max)
+    def plot_top_3_comparison():
+        fig_max = go.Figure()
 
-    # Create a plotly figure for the min comparison
-    fig_min = go.Figure()
-
-    # Plot the temperature changes for Jordan and the bottom 3 min countries
-    for country in min_comparison_pivot.index:
-        fig_min.add_trace(go.Scatter(x=min_comparison_pivot.columns, y=min_comparison_pivot.loc[country], mode='lines+markers', name=country))
-
-    # Update layout for the min comparison figure
-    fig_min.update_layout(
-        title='Temperature Change Comparison: Jordan vs. Bottom 3 Min Countries',
-        xaxis_title='Year',
-        yaxis_title='Temperature Change (°C)',
-        legend_title='Country',
-        template='plotly_white'
-    )
-    st.plotly_chart(fig_min)
+        # Plot the temperature changes for the focus country and the top 3 max countries
+        for country in max_comparison_countries:
+            country_temps = core.country_series(country)
+            fig_max.add_trace(go.Scatter(x=country_temps.index, y=country_temps.values, mode='lines+markers', name=country))
 
-    # Define Jordan's neighboring countries
-    neighboring_countries = ['Saudi Arabia', 'Iraq', 'Palestine', 'Syria', 'Lebanon', 'Egypt']
+        # Update layout for the max comparison figure
+        fig_max.update_layout(
+            title=f'Temperature Change Comparison: {focus} vs. Top 3 Max Countries',
+            xaxis_title='Year',
+            yaxis_title='Temperature Change (°C)',
+            legend_title='Country',
+            template='plotly_white'
+        )
+        return fig_max
+    plotly_chart('top_3_comparison', plot_top_3_comparison, focus)
 
-    # Add Jordan to the list for comparison
-    countries_to_plot = ['Jordan'] + neighboring_countries
+    # Create a plotly figure for the min comparison
+    def plot_bottom_3_comparison():
+        fig_min = go.Figure()
 
-    # Extract temperature changes for the selected countries
-    selected_countries_data = data[data['Country'].isin(countries_to_plot)]
+        # Plot the temperature changes for the focus country and the bottom 3 min countries
+        for country in min_comparison_countries:
+            country_temps = core.country_series(country)
+            fig_min.add_trace(go.Scatter(x=country_temps.index, y=country_temps.values, mode='lines+markers', name=country))
 
-    # Remove duplicate entries for the same country and year combination
-    selected_countries_data = selected_countries_data.drop_duplicates(subset=['Country', 'Year'])
+        # Update layout for the min comparison figure
+        fig_min.update_layout(
+            title=f'Temperature Change Comparison: {focus} vs. Bottom 3 Min Countries',
+            xaxis_title='Year',
+            yaxis_title='Temperature Change (°C)',
+            legend_title='Country',
+            template='plotly_white'
+        )
+        return fig_min
+    plotly_chart('bottom_3_comparison', plot_bottom_3_comparison, focus)
 
-    # Pivot the data to have countries as rows and years as columns
-    selected_countries_temps = selected_countries_data.pivot(index='Country', columns='Year', values='Temperature Change')
+    # Neighboring countries of the focus country that are present in the data
+    neighboring_countries = [country for country in NEIGHBORING_COUNTRIES.get(focus, []) if country in core.country_index]
 
-    # Plot Jordan with each pair of neighboring countries
+    # Plot the focus country with each pair of neighboring countries
     for i in range(0, len(neighboring_countries), 2):
-        fig_neighbor = go.Figure()
-
-        # Plot Jordan
-        fig_neighbor.add_trace(go.Scatter(x=selected_countries_temps.columns, y=selected_countries_temps.loc['Jordan'], mode='lines+markers', name='Jordan'))
-
-        # Plot neighboring countries
-        for j in range(2):
-            if i + j < len(neighboring_countries):
-                country = neighboring_countries[i + j]
-                fig_neighbor.add_trace(go.Scatter(x=selected_countries_temps.columns, y=selected_countries_temps.loc[country], mode='lines+markers', name=country))
-
-        # Update layout
-        fig_neighbor.update_layout(
-            title=f'Temperature Change Comparison: Jordan vs. {neighboring_countries[i]} and {neighboring_countries[i+1] if i+1 < len(neighboring_countries) else ""}',
+        def plot_neighbors():
+            fig_neighbor = go.Figure()
+
+            # Plot the focus country
+            fig_neighbor.add_trace(go.Scatter(x=focus_temps.index, y=focus_temps.values, mode='lines+markers', name=focus))
+
+            # Plot neighboring countries
+            for country in neighboring_countries[i:i + 2]:
+                country_temps = core.country_series(country)
+                fig_neighbor.add_trace(go.Scatter(x=country_temps.index, y=country_temps.values, mode='lines+markers', name=country))
+
+            # Update layout
+            fig_neighbor.update_layout(
+                title=f'Temperature Change Comparison: {focus} vs. {" and ".join(neighboring_countries[i:i + 2])}',
+                xaxis_title='Year',
+                yaxis_title='Temperature Change (°C)',
+                legend_title='Country',
+                template='plotly_white',
+                width=900,
+                height=600
+            )
+            return fig_neighbor
+        plotly_chart('neighbors', plot_neighbors, focus, i)
+
+    # Countries whose year-to-year temperature changes track the focus country's most closely
+    st.subheader(f"Countries with the Most Similar Warming Profile to {focus}")
+    similar_count = st.slider("Number of similar countries:", 1, 10, 5)
+    similar_countries = correlations.most_similar(focus, similar_count)
+    st.dataframe(similar_countries.style.background_gradient(cmap='coolwarm', subset=['Correlation']))
+
+    # Plot the focus country with its most similar countries
+    def plot_similar_countries():
+        fig_similar = go.Figure()
+        fig_similar.add_trace(go.Scatter(x=focus_temps.index, y=focus_temps.values, mode='lines+markers', name=focus, line=dict(width=4)))
+        for country in similar_countries['Country']:
+            country_temps = core.country_series(country)
+            fig_similar.add_trace(go.Scatter(x=country_temps.index, y=country_temps.values, mode='lines', name=country))
+        fig_similar.update_layout(
+            title=f'Temperature Change: {focus} vs. Its {len(similar_countries)} Most Similar Countries',
             xaxis_title='Year',
             yaxis_title='Temperature Change (°C)',
             legend_title='Country',
-            template='plotly_white',
-            width=900,
-            height=600
+            template='plotly_white'
         )
-        st.plotly_chart(fig_neighbor)
+        return fig_similar
+    plotly_chart('similar_countries', plot_similar_countries, focus, similar_count)
 
 elif options == "Urban vs. Rural Trends":
     st.header("Urban vs. Rural Temperature Trends")
+    [groups] = page_datasets(options)
+    report_unmapped_countries(groups.unmapped_countries)
 
     # Plot urban vs. rural temperature trends
-    urban_data = data[data['Urban_Rural'] == 'Urban'].groupby('Year')['Temperature Change'].mean().reset_index()
-    rural_data = data[data['Urban_Rural'] == 'Rural'].groupby('Year')['Temperature Change'].mean().reset_index()
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(x=urban_data['Year'], y=urban_data['Temperature Change'], mode='lines+markers', name='Urban'))
-    fig.add_trace(go.Scatter(x=rural_data['Year'], y=rural_data['Temperature Change'], mode='lines+markers', name='Rural'))
-    fig.update_layout(title='Urban vs. Rural Temperature Trends (1961-2020)', xaxis_title='Year', yaxis_title='Temperature Change (°C)')
-    st.plotly_chart(fig)
+    def plot_urban_rural():
+        with span('urban_rural_mean'):
+            urban_rural = groups.stats('Urban_Rural')
+            urban_data = urban_rural.series('Urban').dropna()
+            rural_data = urban_rural.series('Rural').dropna()
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(x=urban_data.index, y=urban_data.values, mode='lines+markers', name='Urban'))
+        fig.add_trace(go.Scatter(x=rural_data.index, y=rural_data.values, mode='lines+markers', name='Rural'))
+        fig.update_layout(title='Urban vs. Rural Temperature Trends (1961-2020)', xaxis_title='Year', yaxis_title='Temperature Change (°C)')
+        return fig
+    plotly_chart('urban_rural', plot_urban_rural)
 
 elif options == "G7 Analysis":
     st.header("G7 Countries Analysis")
+    core, groups = page_datasets(options)
 
     # Plot G7 temperature trends
-    g7_countries = ['Canada', 'France', 'Germany', 'Italy', 'Japan', 'United Kingdom', 'United States']
-    g7_data = data[data['Country'].isin(g7_countries)]
-    fig = px.line(g7_data, x='Year', y='Temperature Change', color='Country', title='Temperature Trends of G7 Countries (1961-2020)')
-    st.plotly_chart(fig)
+    def plot_g7_trends():
+        with span('g7_filter'):
+            g7_countries = [country for country in COUNTRY_GROUPS['G7'] if country in core.country_index]
+            g7_data = pd.concat([core.country_series(country).reset_index().assign(Country=country) for country in g7_countries])
+        fig = px.line(g7_data, x='Year', y='Temperature Change', color='Country', title='Temperature Trends of G7 Countries (1961-2020)')
+        return fig
+    plotly_chart('g7_trends', plot_g7_trends)
+
+    # Compare the yearly mean of country groups, including one of the reader's own choosing
+    st.subheader("Country Group Comparison")
+    selected_groups = st.multiselect("Groups:", list(COUNTRY_GROUPS), default=list(COUNTRY_GROUPS))
+    custom_group = st.multiselect("Custom group:", core.countries.tolist())
+    grouping = {name: COUNTRY_GROUPS[name] for name in selected_groups}
+    if custom_group:
+        grouping['Custom'] = custom_group
+
+    if grouping:
+        group_stats = groups.stats(grouping)
+
+        def plot_group_comparison():
+            fig = px.line(group_stats.frame(), x='Year', y='Temperature Change', color='Group',
+                          title='Average Temperature Change by Country Group', hover_data=['Std', 'Count'])
+            fig.update_layout(yaxis_title='Temperature Change (°C)', template='plotly_white')
+            return fig
+        plotly_chart('group_comparison', plot_group_comparison, tuple(selected_groups), tuple(custom_group))
+
+        # Mean over all years of each group, with the number of its countries in the data
+        summary = group_stats.overall().to_frame('Mean Temperature Change')
+        summary['Countries'] = [sum(country in core.country_index for country in grouping[name]) for name in summary.index]
+        st.dataframe(summary.style.background_gradient(cmap='coolwarm', subset=['Mean Temperature Change']))
 
 elif options == "Statistical Analysis":
     st.header("Statistical Analysis and Correlations")
-
-    # Calculate statistical summary for Jordan
-    jordan_stats = {
-        'Mean': jordan_temperature_change.mean(),
-        'Median': jordan_temperature_change.median(),
-        'Standard Deviation': jordan_temperature_change.std(),
-        'Minimum': jordan_temperature_change.min(),
-        'Maximum': jordan_temperature_change.max()
+    average_temperature_change, core, outlier_screen, bootstrap = page_datasets(options)
+    focus = select_focus_country(core)
+
+    # Yearly series of the focus country
+    focus_temperature_change = core.country_series(focus)
+
+    # Calculate statistical summary for the focus country
+    focus_stats = {
+        'Mean': focus_temperature_change.mean(),
+        'Median': focus_temperature_change.median(),
+        'Standard Deviation': focus_temperature_change.std(),
+        'Minimum': focus_temperature_change.min(),
+        'Maximum': focus_temperature_change.max()
     }
 
     # Calculate statistical summary for the global average
@@ -717,66 +1020,74 @@ elif options == "Statistical Analysis":
     }
 
     # Create a DataFrame to display the results
-    stats_df = pd.DataFrame([jordan_stats, global_stats], index=['Jordan', 'Global Average'])
+    stats_df = pd.DataFrame([focus_stats, global_stats], index=[focus, 'Global Average'])
 
     # Display the DataFrame as a colorful table
     st.dataframe(stats_df.style.background_gradient(cmap='coolwarm'))
 
-    # Calculate correlation
-    correlation_coefficient = np.corrcoef(jordan_temperature_change, average_temperature_change)[0, 1]
-    st.write(f"**Correlation between Jordan's temperature change and global average: {correlation_coefficient:.2f}**")
+    # Calculate correlation over the years the focus country has data for
+    correlation_coefficient = np.corrcoef(focus_temperature_change, average_temperature_change.loc[focus_temperature_change.index])[0, 1]
+    st.write(f"**Correlation between {focus}'s temperature change and global average: {correlation_coefficient:.2f}**")
+    intervals = ready_result(bootstrap, "Confidence intervals", 'bootstrap')
+    if intervals is not None:
+        correlation_low, correlation_high = intervals.interval(focus, 'correlation')
+        mean_low, mean_high = intervals.interval(focus, 'mean')
+        st.write(f"{intervals.confidence:.0%} bootstrap confidence intervals: correlation {correlation_low:.2f} to {correlation_high:.2f}, "
+                 f"mean temperature change {mean_low:.3f} to {mean_high:.3f} °C")
 
     # Define the categories
     categories = ['Mean', 'Median', 'Standard Deviation', 'Minimum', 'Maximum']
 
-    # Define the values for Jordan and Global Average
-    jordan_values = [jordan_stats[cat] for cat in categories]
+    # Define the values for the focus country and Global Average
+    focus_values = [focus_stats[cat] for cat in categories]
     global_values = [global_stats[cat] for cat in categories]
 
     # Create a plotly figure
-    fig = go.Figure()
-
-    # Add bars for Jordan
-    fig.add_trace(go.Bar(
-        x=categories,
-        y=jordan_values,
-        name='Jordan',
-        marker_color='blue'
-    ))
-
-    # Add bars for Global Average
-    fig.add_trace(go.Bar(
-        x=categories,
-        y=global_values,
-        name='Global Average',
-        marker_color='orange'
-    ))
-
-    # Update layout
-    fig.update_layout(
-        title='Statistical Summary: Jordan vs. Global Average',
-        xaxis_title='Statistic',
-        yaxis_title='Value',
-        barmode='group',
-        template='plotly_white'
-    )
-    st.plotly_chart(fig)
+    def plot_summary_statistics():
+        fig = go.Figure()
+
+        # Add bars for the focus country
+        fig.add_trace(go.Bar(
+            x=categories,
+            y=focus_values,
+            name=focus,
+            marker_color='blue'
+        ))
+
+        # Add bars for Global Average
+        fig.add_trace(go.Bar(
+            x=categories,
+            y=global_values,
+            name='Global Average',
+            marker_color='orange'
+        ))
+
+        # Update layout
+        fig.update_layout(
+            title=f'Statistical Summary: {focus} vs. Global Average',
+            xaxis_title='Statistic',
+            yaxis_title='Value',
+            barmode='group',
+            template='plotly_white'
+        )
+        return fig
+    plotly_chart('summary_statistics', plot_summary_statistics, focus)
 
-    # Calculate the deviations between Jordan's temperature change and the global average
-    deviations = jordan_temperature_change - average_temperature_change
+    # Calculate the deviations between the focus country's temperature change and the global average
+    deviations = focus_temperature_change - average_temperature_change
 
     # Identify years with significant deviations (greater than one standard deviation of global average)
     threshold = average_temperature_change.std()
     significant_deviations = deviations[abs(deviations) > threshold]
 
     significant_frame = significant_deviations.to_frame().reset_index()
-    st.write("**Significant Deviations in Temperature Change: Jordan vs. Global Average**")
+    st.write(f"**Significant Deviations in Temperature Change: {focus} vs. Global Average**")
     st.dataframe(significant_frame.style.background_gradient(cmap='coolwarm'))
 
     st.write("**Outlier Countries in Temperature Change**")
 
-    # Calculate average temperature change for each country
-    average_temp_change_by_country = data.groupby('Country')['Temperature Change'].mean().reset_index()
+    # Average temperature change for each country
+    average_temp_change_by_country = core.country_mean().reset_index()
 
     # Calculate the Z-scores for average temperature changes
     mean_temp_change = average_temp_change_by_country['Temperature Change'].mean()
@@ -787,49 +1098,215 @@ elif options == "Statistical Analysis":
     outliers = average_temp_change_by_country[(average_temp_change_by_country['Z_Score'] > 2) | (average_temp_change_by_country['Z_Score'] < -2)]
     st.dataframe(outliers[['Country', 'Temperature Change', 'Z_Score']].style.background_gradient(cmap='coolwarm'))
 
-    # Identify the result for Jordan
-    jordan_result = average_temp_change_by_country[average_temp_change_by_country['Country'] == 'Jordan']
+    # Identify the result for the focus country
+    focus_result = average_temp_change_by_country.iloc[[core.country_index[focus]]]
 
     # Plot the results
-    fig_outlier = go.Figure()
-
-    # Plot all countries
-    fig_outlier.add_trace(go.Scatter(
-        x=average_temp_change_by_country['Country'],
-        y=average_temp_change_by_country['Temperature Change'],
-        mode='markers',
-        name='All Countries',
-        marker=dict(color='red', size=8)
-    ))
-
-    # Highlight outliers
-    fig_outlier.add_trace(go.Scatter(
-        x=outliers['Country'],
-        y=outliers['Temperature Change'],
-        mode='markers+lines',
-        line=dict(dash='dash', color='red'),
-        marker=dict(color='red', size=12, symbol='circle'),
-        name='Outliers'
-    ))
-
-    # Highlight Jordan
-    fig_outlier.add_trace(go.Scatter(
-        x=jordan_result['Country'],
-        y=jordan_result['Temperature Change'],
-        mode='markers',
-        marker=dict(color='blue', size=15, symbol='star'),
-        name='Jordan'
-    ))
-
-    # Update layout
-    fig_outlier.update_layout(
-        title='Outlier Countries in Temperature Change with Jordan Highlighted',
-        xaxis_title='Country',
-        yaxis_title='Average Temperature Change (°C)',
-        showlegend=True,
-        template='plotly_white'
-    )
-    st.plotly_chart(fig_outlier)
+    def plot_outliers():
+        fig_outlier = go.Figure()
+
+        # Plot all countries
+        fig_outlier.add_trace(go.Scatter(
+            x=average_temp_change_by_country['Country'],
+            y=average_temp_change_by_country['Temperature Change'],
+            mode='markers',
+            name='All Countries',
+            marker=dict(color='red', size=8)
+        ))
+
+        # Highlight outliers
+        fig_outlier.add_trace(go.Scatter(
+            x=outliers['Country'],
+            y=outliers['Temperature Change'],
+            mode='markers+lines',
+            line=dict(dash='dash', color='red'),
+            marker=dict(color='red', size=12, symbol='circle'),
+            name='Outliers'
+        ))
+
+        # Highlight the focus country
+        fig_outlier.add_trace(go.Scatter(
+            x=focus_result['Country'],
+            y=focus_result['Temperature Change'],
+            mode='markers',
+            marker=dict(color='blue', size=15, symbol='star'),
+            name=focus
+        ))
+
+        # Update layout
+        fig_outlier.update_layout(
+            title=f'Outlier Countries in Temperature Change with {focus} Highlighted',
+            xaxis_title='Country',
+            yaxis_title='Average Temperature Change (°C)',
+            showlegend=True,
+            template='plotly_white'
+        )
+        return fig_outlier
+    plotly_chart('outliers', plot_outliers, focus)
+
+    st.subheader("Yearly Outlier Screening")
+
+    # Baseline and method labels shown in the controls
+    baseline_labels = {'history': f"Country's previous {ROLLING_WINDOW} years", 'peers': "All countries in the same year"}
+    method_labels = {'z': "Z-score (mean and standard deviation)", 'mad': "Robust (median and MAD)"}
+    baseline = st.radio("Compare each value with:", OUTLIER_BASELINES, format_func=baseline_labels.get, horizontal=True)
+    method = st.radio("Score:", OUTLIER_METHODS, format_func=method_labels.get, horizontal=True)
+    outlier_threshold = st.slider("Flag scores beyond:", 2.0, 5.0, 3.0, 0.5)
+
+    # Plot the number of countries flagged in each year
+    def plot_outlier_counts():
+        outlier_counts = outlier_screen.counts(baseline, method, outlier_threshold)
+        fig = go.Figure(go.Bar(x=outlier_counts.index, y=outlier_counts.values))
+        fig.update_layout(
+            title=f'Countries Flagged as Outliers per Year ({method_labels[method]}, |score| > {outlier_threshold})',
+            xaxis_title='Year',
+            yaxis_title='Countries',
+            template='plotly_white'
+        )
+        return fig
+    plotly_chart('outlier_counts', plot_outlier_counts, baseline, method, outlier_threshold)
+
+    # Browse the flagged countries of one year
+    outlier_year = st.select_slider("Year:", outlier_screen.years.tolist(), value=int(outlier_screen.years[-1]))
+    year_outliers = outlier_screen.year_outliers(outlier_year, baseline, method, outlier_threshold)
+    st.write(f"**{len(year_outliers)} countries flagged in {outlier_year}**")
+    st.dataframe(year_outliers.style.background_gradient(cmap='coolwarm', subset=['Score']))
+
+elif options == "Projections":
+    st.header("Temperature Change Projections")
+    core, projections, correlations = page_datasets(options)
+    focus = select_focus_country(core)
+
+    # Model, horizon and interval coverage of the projections
+    model_labels = {'linear': "Linear trend", 'quadratic': "Quadratic trend", 'damped': "Damped trend (exponential smoothing)"}
+    model = st.radio("Model:", list(model_labels), format_func=model_labels.get, horizontal=True)
+    horizon = st.slider("Years ahead:", 5, 50, 20, 5)
+    confidence = st.select_slider("Prediction interval:", [0.8, 0.9, 0.95], value=0.95, format_func=lambda level: f"{level:.0%}")
+
+    # The focus country's neighbors by default, or its most similar countries when none are listed
+    default_comparison = [country for country in NEIGHBORING_COUNTRIES.get(focus, []) if country in core.country_index]
+    if not default_comparison:
+        default_comparison = correlations.most_similar(focus, 3)['Country'].tolist()
+    comparison = st.multiselect("Compare with:", [country for country in core.countries.tolist() if country != focus], default=default_comparison)
+    countries = [focus] + comparison
+
+    years, mean, lower, upper = projections.project(model, countries, horizon, confidence)
+
+    # Plot each country's history with its projection and prediction interval
+    def plot_projections():
+        fig = go.Figure()
+        for row, country in enumerate(countries):
+            color = px.colors.qualitative.Plotly[row % len(px.colors.qualitative.Plotly)]
+            history = core.country_series(country)
+            fig.add_trace(go.Scatter(x=history.index, y=history.values, mode='lines', name=country, legendgroup=country,
+                                     line=dict(color=color, width=4 if country == focus else 2)))
+            fig.add_trace(go.Scatter(x=np.concatenate([years, years[::-1]]), y=np.concatenate([upper[row], lower[row][::-1]]),
+                                     fill='toself', fillcolor=color, opacity=0.15, line=dict(width=0), hoverinfo='skip',
+                                     showlegend=False, legendgroup=country))
+            fig.add_trace(go.Scatter(x=years, y=mean[row], mode='lines', name=f'{country} (projected)', legendgroup=country,
+                                     line=dict(color=color, dash='dash')))
+        fig.update_layout(
+            title=f'Projected Temperature Change to {years[-1]}: {focus} vs. {", ".join(comparison) or "no comparison"}',
+            xaxis_title='Year',
+            yaxis_title='Temperature Change (°C)',
+            legend_title='Country',
+            template='plotly_white'
+        )
+        return fig
+    plotly_chart('projections', plot_projections, model, horizon, confidence, tuple(countries))
+    st.caption(f"Shaded bands are {confidence:.0%} prediction intervals for a single year's value.")
+
+    # Projected value at the end of the horizon for the compared countries
+    st.subheader(f"Projected Temperature Change in {years[-1]}")
+    last_observed = [core.country_series(country).iloc[-1] for country in countries]
+    projected = pd.DataFrame({'Country': countries, 'Last Observed': last_observed, 'Projected': mean[:, -1],
+                              'Low': lower[:, -1], 'High': upper[:, -1]})
+    st.dataframe(projected.style.background_gradient(cmap='coolwarm', subset=['Projected']))
+
+    # Projection of every country, warmest first
+    st.subheader(f"All Countries in {years[-1]}")
+    all_countries = core.countries.tolist()
+    _, all_mean, all_lower, all_upper = projections.project(model, all_countries, horizon, confidence)
+    ranking = pd.DataFrame({'Country': all_countries, 'Projected': all_mean[:, -1], 'Low': all_lower[:, -1], 'High': all_upper[:, -1]})
+    ranking = ranking.sort_values('Projected', ascending=False).reset_index(drop=True)
+    st.dataframe(ranking.style.background_gradient(cmap='coolwarm', subset=['Projected']))
+
+elif options == "Change-Point Analysis":
+    st.header("Change-Point (Regime Shift) Analysis")
+    core, groups, change_points = page_datasets(options)
+    focus = select_focus_country(core)
+    st.write(f"""
+        Instead of a fixed split at 2000, each country's series is divided into periods with a constant average
+        temperature change, with breaks placed where they explain the most variation. Up to {MAX_BREAKS} breaks are
+        considered, each period spanning at least {MIN_SEGMENT_YEARS} years with data, and the number of breaks is chosen
+        by the Bayesian information criterion. A break year is the first year of the new period.
+    """)
+
+    change_points = ready_result(change_points, "Change points", 'change_points')
+    if change_points is not None:
+        multiple = st.radio("Breaks per country:", [False, True], horizontal=True,
+                            format_func=lambda multiple: f"Up to {MAX_BREAKS}, chosen by BIC" if multiple else "Most likely single break")
+
+        # Break year of the global yearly mean, for comparison with the hard-coded 2000 split
+        global_breaks = ChangePoints(['Global'], core.years, core.year_means[None]).breaks('Global', multiple)
+        st.write(f"**Break years of the global average:** {', '.join(map(str, global_breaks)) or 'none'}")
+
+        # Every break with the continent of its country
+        breaks = change_points.table(multiple)
+        continents, codes = groups.dimensions['Continent']
+        breaks['Region'] = np.asarray(continents, dtype=object)[codes[[core.country_index[country] for country in breaks['Country']]]]
+
+        # Plot the distribution of break years by region
+        def plot_break_years():
+            fig = px.histogram(breaks, x='Year', color='Region', nbins=len(change_points.years),
+                               title='Distribution of Break Years by Region')
+            fig.update_layout(xaxis_title='Break Year', yaxis_title='Breaks', template='plotly_white')
+            return fig
+        plotly_chart('break_years', plot_break_years, multiple)
+
+        def plot_break_years_by_region():
+            fig = px.box(breaks, x='Region', y='Year', points='all', hover_data=['Country', 'Shift'],
+                         title='Break Years by Region')
+            fig.update_layout(yaxis_title='Break Year', template='plotly_white')
+            return fig
+        plotly_chart('break_years_by_region', plot_break_years_by_region, multiple)
+
+        # Summary of the breaks in each region
+        st.subheader("Breaks by Region")
+        region_breaks = breaks.groupby('Region').agg(
+            Breaks=('Year', 'size'),
+            Median_Year=('Year', 'median'),
+            Most_Common_Year=('Year', lambda years: years.mode().iloc[0]),
+            Mean_Shift=('Shift', 'mean'),
+        ).reset_index()
+        st.dataframe(region_breaks.style.background_gradient(cmap='coolwarm', subset=['Median_Year']))
+
+        # The focus country's series with the mean of each period
+        st.subheader(f"Periods in {focus}'s Temperature Change")
+        focus_breaks = change_points.breaks(focus, multiple)
+
+        def plot_focus_periods():
+            focus_temps = core.country_series(focus)
+            levels = change_points.segment_means(focus, multiple)
+            fig = go.Figure()
+            fig.add_trace(go.Scatter(x=focus_temps.index, y=focus_temps.values, mode='lines+markers', name=focus))
+            fig.add_trace(go.Scatter(x=levels.index, y=levels.values, mode='lines', line=dict(shape='hv', color='red', width=3),
+                                     name='Period mean'))
+            for year in focus_breaks:
+                fig.add_vline(x=year - 0.5, line_dash='dash', line_color='gray')
+            fig.update_layout(
+                title=f'Temperature Change in {focus} with Breaks in {", ".join(map(str, focus_breaks)) or "no year"}',
+                xaxis_title='Year',
+                yaxis_title='Temperature Change (°C)',
+                template='plotly_white'
+            )
+            return fig
+        plotly_chart('focus_periods', plot_focus_periods, focus, multiple)
+
+        # Countries with the largest shifts in their mean level
+        st.subheader("Largest Regime Shifts")
+        largest_shifts = breaks.reindex(breaks['Shift'].abs().sort_values(ascending=False).index).head(10).reset_index(drop=True)
+        st.dataframe(largest_shifts.style.background_gradient(cmap='coolwarm', subset=['Shift']))
 
 elif options == "Conclusions":
     st.header("Conclusions and Insights")
@@ -854,7 +1331,40 @@ elif options == "Conclusions":
         - Further Research: Future research should explore the underlying causes of temperature changes in Jordan and other regions. This includes investigating the role of human activities, land use changes, and natural climatic variations. Additionally, more granular data on monthly and seasonal temperature changes can provide deeper insights into the dynamics of climate change.
     """)
 
+# Memory of this whole process in MB, shared by every session it serves, and whether
+# it is the current resident size or, where /proc is not available, the peak
+def process_memory_mb():
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20, False
+    except (OSError, ValueError):
+        import resource
+        # ru_maxrss is in bytes on macOS and in kilobytes on Linux and the BSDs
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (2**20 if sys.platform == 'darwin' else 2**10), True
+
+# Number of sessions connected to this server process, or None when Streamlit does
+# not expose it. The count comes from the runtime's session manager, which is not a
+# public API, so any failure to read it just leaves the count out.
+def active_sessions():
+    try:
+        from streamlit.runtime import Runtime
+        return Runtime.instance()._session_mgr.num_active_sessions()
+    except Exception:
+        return None
+
+finish_span(page_span)
+
 # Footer
+memory_mb, peak = process_memory_mb()
+sessions = active_sessions()
+memory_caption = f"Process memory: {memory_mb:.0f} MB {'peak resident' if peak else 'resident'}"
+# Per-session figure: the process memory divided by the sessions it serves, which
+# falls as sessions are added since the datasets are shared rather than copied
+if sessions:
+    memory_caption += f", shared by {sessions} active session(s): {memory_mb / sessions:.0f} MB per session on average"
+st.sidebar.caption(memory_caption)
+
 st.sidebar.title("About")
 st.sidebar.image("dhif_6.png", use_column_width=True)  # Add your image file here
 st.sidebar.info("""
@@ -864,3 +1374,14 @@ st.sidebar.info("""
     - [DataCamp](https://www.datacamp.com/portfolio/alayadidhif)
     - [Tableau](https://public.tableau.com/app/profile/dhifallah/vizzes)
 """)
+
+# Timing panel of a profiled rerun
+profiler = active()
+if profiler is not None:
+    profiler.close()
+    profiler.export()
+    with st.sidebar.expander("Profile"):
+        st.dataframe(pd.DataFrame(profiler.rows()), hide_index=True)
+        if warm_up is not None:
+            st.caption("Background warm-up")
+            st.dataframe(pd.DataFrame(warm_up.status()), hide_index=True)